@@ -0,0 +1,55 @@
+// 4x4 MATRIX MULTIPLICATION WITH NMC MAC (generated by init_matmul.py --nmc)
+// A: RAM[16..31]
+// B: RAM[32..47]
+// C: RAM[48..63]
+// R13: row i of A, R14: column j of B, R15: address of C[i][j]
+
+@16
+D=A
+@R13
+M=D      // row = A
+@48
+D=A
+@R15
+M=D      // addrC = C
+
+(LOOP_i)
+@32
+D=A
+@R14
+M=D      // column = B
+
+(LOOP_j)
+// C[i][j] = row . column
+@4
+D=A      // n = N
+@R15
+A=M
+M=0
+MAC 1,4
+
+// addrC++, column++; next j while column < B + N
+@R15
+M=M+1
+@R14
+MD=M+1
+@36
+D=D-A
+@LOOP_j
+D;JLT
+
+// row += N; next i while row < B
+@R13
+D=M
+@4
+D=D+A
+@R13
+M=D
+@32
+D=D-A
+@LOOP_i
+D;JLT
+
+(HALT)
+@HALT
+0;JMP
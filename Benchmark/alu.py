@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# alu.py
+# Hack ALU model shared by the emulators
+#
+# The comp field of a C-instruction is 7 bits: the a-bit (select A or M as
+# the y input) followed by the six ALU control bits zx, nx, zy, ny, f, no of
+# project2/ALU.hdl. Every one of the 128 codes is valid hardware, so the
+# kernel table below covers all of them: the 28 canonical mnemonics get a
+# hand-written kernel and the rest fall back to a kernel built from the
+# control bits. All values are 16-bit unsigned; two's complement arithmetic
+# is just arithmetic modulo 2**16.
+
+MASK16 = 0xFFFF
+
+# Canonical comp codes -> mnemonic (same table as assembler.py)
+COMP_MNEMONICS = {
+    0b0101010: "0", 0b0111111: "1", 0b0111010: "-1",
+    0b0001100: "D", 0b0110000: "A", 0b1110000: "M",
+    0b0001101: "!D", 0b0110001: "!A", 0b1110001: "!M",
+    0b0001111: "-D", 0b0110011: "-A", 0b1110011: "-M",
+    0b0011111: "D+1", 0b0110111: "A+1", 0b1110111: "M+1",
+    0b0001110: "D-1", 0b0110010: "A-1", 0b1110010: "M-1",
+    0b0000010: "D+A", 0b1000010: "D+M", 0b0010011: "D-A",
+    0b1010011: "D-M", 0b0000111: "A-D", 0b1000111: "M-D",
+    0b0000000: "D&A", 0b1000000: "D&M", 0b0010101: "D|A",
+    0b1010101: "D|M",
+}
+
+def alu(x, y, zx, nx, zy, ny, f, no):
+    """Evaluate the Hack ALU on 16-bit inputs x, y with the given control bits"""
+    if zx:
+        x = 0
+    if nx:
+        x = ~x & MASK16
+    if zy:
+        y = 0
+    if ny:
+        y = ~y & MASK16
+    out = (x + y) & MASK16 if f else x & y
+    if no:
+        out = ~out & MASK16
+    return out
+
+def make_kernel(comp):
+    """Build a kernel (D, A, RAM) -> out for any 7-bit comp code"""
+    control = [(comp >> bit) & 1 for bit in range(5, -1, -1)]
+    if comp & 0x40:
+        return lambda D, A, RAM: alu(D, RAM[A], *control)
+    return lambda D, A, RAM: alu(D, A, *control)
+
+# Fast path for the 28 canonical operations
+_CANONICAL_KERNELS = {
+    0b0101010: lambda D, A, RAM: 0,
+    0b0111111: lambda D, A, RAM: 1,
+    0b0111010: lambda D, A, RAM: MASK16,
+    0b0001100: lambda D, A, RAM: D,
+    0b0110000: lambda D, A, RAM: A,
+    0b1110000: lambda D, A, RAM: RAM[A],
+    0b0001101: lambda D, A, RAM: ~D & MASK16,
+    0b0110001: lambda D, A, RAM: ~A & MASK16,
+    0b1110001: lambda D, A, RAM: ~RAM[A] & MASK16,
+    0b0001111: lambda D, A, RAM: -D & MASK16,
+    0b0110011: lambda D, A, RAM: -A & MASK16,
+    0b1110011: lambda D, A, RAM: -RAM[A] & MASK16,
+    0b0011111: lambda D, A, RAM: (D + 1) & MASK16,
+    0b0110111: lambda D, A, RAM: (A + 1) & MASK16,
+    0b1110111: lambda D, A, RAM: (RAM[A] + 1) & MASK16,
+    0b0001110: lambda D, A, RAM: (D - 1) & MASK16,
+    0b0110010: lambda D, A, RAM: (A - 1) & MASK16,
+    0b1110010: lambda D, A, RAM: (RAM[A] - 1) & MASK16,
+    0b0000010: lambda D, A, RAM: (D + A) & MASK16,
+    0b1000010: lambda D, A, RAM: (D + RAM[A]) & MASK16,
+    0b0010011: lambda D, A, RAM: (D - A) & MASK16,
+    0b1010011: lambda D, A, RAM: (D - RAM[A]) & MASK16,
+    0b0000111: lambda D, A, RAM: (A - D) & MASK16,
+    0b1000111: lambda D, A, RAM: (RAM[A] - D) & MASK16,
+    0b0000000: lambda D, A, RAM: D & A,
+    0b1000000: lambda D, A, RAM: D & RAM[A],
+    0b0010101: lambda D, A, RAM: D | A,
+    0b1010101: lambda D, A, RAM: D | RAM[A],
+}
+
+# Kernel table indexed by the 7-bit comp code
+ALU_KERNELS = [_CANONICAL_KERNELS.get(comp) or make_kernel(comp) for comp in range(128)]
+
+def compute_alu(comp, D, A, RAM):
+    """Compute the ALU output for a decoded comp code; only that op is evaluated"""
+    return ALU_KERNELS[comp](D, A, RAM)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# asmcache.py
+# On-disk cache of assembled programs keyed by source hash
+#
+# An entry is <key>.hackb (the packed program, see hackbin.py) plus
+# <key>.json (its labels and variables). The key is the SHA-256 of the
+# assembler version and the source bytes, so an edited source or a new
+# assembler never hits a stale entry. Hits refresh the entry's mtime; when
+# the cache grows past max_bytes the least recently used entries are removed.
+#
+# The cache is opt-in: nothing is written unless $HACK_ASM_CACHE is set or
+# a command line asks for it (--cache), see default_cache().
+#
+# Location: $HACK_ASM_CACHE, default ~/.cache/hack-asm
+import hashlib
+import json
+import os
+import tempfile
+from array import array
+
+from hackbin import BINARY_SUFFIX, unpack, write_binary
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+_default_cache = None
+
+def default_directory():
+    """Return the cache directory from $HACK_ASM_CACHE or the user cache dir"""
+    return os.environ.get("HACK_ASM_CACHE") or os.path.join(
+        os.path.expanduser("~"), ".cache", "hack-asm")
+
+def source_key(path, version):
+    """Return the cache key for the source file at path"""
+    digest = hashlib.sha256(f"{version}\0".encode('ascii'))
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class AssemblyCache:
+    """Size-bounded LRU cache of (words, symbols) entries on disk"""
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + BINARY_SUFFIX, base + ".json"
+
+    def get(self, key):
+        """Return (words, symbols) for key, or None on a miss.
+
+        words is an array('H') copy, so no file stays open or mapped.
+        """
+        program_path, symbols_path = self._paths(key)
+        try:
+            with open(symbols_path) as f:
+                symbols = json.load(f)
+            with open(program_path, 'rb') as f:
+                words = array('H', unpack(f.read()))
+            os.utime(program_path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return words, symbols
+
+    def put(self, key, words, symbols):
+        """Store an entry, then evict down to max_bytes"""
+        program_path, symbols_path = self._paths(key)
+        # Write to temporary names and rename, so concurrent readers never
+        # see a partial entry; the program file is written last and marks
+        # the entry complete.
+        self._write(symbols_path, lambda tmp: self._dump_json(tmp, symbols))
+        self._write(program_path, lambda tmp: write_binary(tmp, words))
+        self.evict()
+
+    def _write(self, path, write):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @staticmethod
+    def _dump_json(path, symbols):
+        with open(path, 'w') as f:
+            json.dump(symbols, f)
+
+    def entries(self):
+        """Return [(mtime, size, key)] for complete entries"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(BINARY_SUFFIX):
+                continue
+            key = name[:-len(BINARY_SUFFIX)]
+            try:
+                size = sum(os.path.getsize(p) for p in self._paths(key))
+                mtime = os.path.getmtime(self._paths(key)[0])
+            except OSError:  # removed concurrently
+                continue
+            entries.append((mtime, size, key))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(key)
+            total -= size
+
+    def remove(self, key):
+        for path in self._paths(key):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """Remove every entry"""
+        for _, _, key in self.entries():
+            self.remove(key)
+
+def default_cache(enabled=None):
+    """Return the process-wide cache in default_directory(), or None.
+
+    enabled=True opens it and False disables it. With None it is used only
+    if $HACK_ASM_CACHE is set or an earlier call in this process opened it.
+    """
+    global _default_cache
+    if enabled is None:
+        enabled = _default_cache is not None or bool(os.environ.get("HACK_ASM_CACHE"))
+    if not enabled:
+        return None
+    if _default_cache is None:
+        _default_cache = AssemblyCache()
+    return _default_cache
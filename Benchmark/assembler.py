@@ -1,112 +1,503 @@
 #!/usr/bin/env python3
 # assembler.py
-# Simple Hack assembler (Hack assembly -> Hack binary)
-import sys
+# Streaming Hack assembler (Hack assembly -> Hack binary)
+#
+# Source lines are read once. Labels are resolved in the same pass: a
+# symbol that is not yet known is emitted as a placeholder and recorded on a
+# backpatch list, which is fixed up when its label appears or, at the end,
+# with a newly allocated variable address (in order of first reference, as
+# the classic two-pass assembler does). Words go straight to a writer:
+#     WordWriter    array('H') in memory (library use)
+#     TextWriter    .hack text, 17 bytes per line, patched in place
+#     BinaryWriter  packed .hackb (see hackbin.py), patched in place
+# so memory use is the symbol table and backpatch list, not the program.
+#
+#     from assembler import assemble
+#     words = assemble("@2\nD=A\n@3\nD=D+A\n@0\nM=D\n")
+#
+# Given directories or several files, the command line assembles them all on
+# a process pool (assemble_batch), writing each output next to its source
+# or under --out-dir, and reports per-file timings and errors.
+#
+# -O runs the peephole optimizer (peephole.py) over the source first and
+# reports the instructions it saved; --temp names scratch addresses whose
+# stores it may drop. Variables keep the addresses the unoptimized source
+# gives them.
+#
+# NMC instructions (see nmc.py) are written "MAC sx,sy", "COPY sx,sy" or
+# "VADD sx,sy" with strides 0..31; the strides default to 1,1.
+import argparse
+import io
 import os
+import struct
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from asmcache import default_cache, source_key
+from hackbin import BINARY_SUFFIX, HEADER, pack_header
+from peephole import PeepholeOptimizer
+from sourcemap import SourceMap, map_path
+
+VERSION = 3  # bump when output for the same source changes (invalidates asmcache)
+CHUNK = 65536  # words buffered before each writer.write()
+
+# Predefined symbols (R0-R15, SCREEN, KBD, etc.)
+SYMBOLS = {
+    "SP": 0, "LCL": 1, "ARG": 2, "THIS": 3, "THAT": 4,
+    "R0": 0, "R1": 1, "R2": 2, "R3": 3, "R4": 4, "R5": 5, "R6": 6, "R7": 7,
+    "R8": 8, "R9": 9, "R10": 10, "R11": 11, "R12": 12, "R13": 13, "R14": 14, "R15": 15,
+    "SCREEN": 16384, "KBD": 24576
+}
+# Code tables for C-instructions (comp, dest, jump)
+COMP = {
+    "0": 0b0101010, "1": 0b0111111, "-1": 0b0111010, "D": 0b0001100, "A": 0b0110000, "M": 0b1110000,
+    "!D": 0b0001101, "!A": 0b0110001, "!M": 0b1110001, "-D": 0b0001111, "-A": 0b0110011, "-M": 0b1110011,
+    "D+1": 0b0011111, "A+1": 0b0110111, "M+1": 0b1110111, "D-1": 0b0001110, "A-1": 0b0110010, "M-1": 0b1110010,
+    "D+A": 0b0000010, "D+M": 0b1000010, "D-A": 0b0010011, "D-M": 0b1010011, "A-D": 0b0000111, "M-D": 0b1000111,
+    "D&A": 0b0000000, "D&M": 0b1000000, "D|A": 0b0010101, "D|M": 0b1010101
+}
+DEST = {
+    "null": 0b000, "M": 0b001, "D": 0b010, "MD": 0b011,
+    "A": 0b100, "AM": 0b101, "AD": 0b110, "AMD": 0b111
+}
+JUMP = {
+    "null": 0b000, "JGT": 0b001, "JEQ": 0b010, "JGE": 0b011,
+    "JLT": 0b100, "JNE": 0b101, "JLE": 0b110, "JMP": 0b111
+}
+# NMC instructions: mnemonic -> opcode (word 100o oo xx xxxy yyyy, see nmc.py)
+NMC = {"MAC": 0b000, "COPY": 0b001, "VADD": 0b010}
+
+class WordWriter:
+    """Collect assembled words in an array('H')"""
+
+    def __init__(self):
+        self.words = array('H')
+
+    def write(self, words):
+        self.words.extend(words)
+
+    def patch(self, fixups):
+        for index, word in fixups:
+            self.words[index] = word
+
+    def close(self, count):
+        return self.words
+
+class TextWriter:
+    """Write .hack text to a seekable binary file object"""
+    LINE = 17  # 16 digits + newline
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, words):
+        self.f.write("".join([f"{word:016b}\n" for word in words]).encode('ascii'))
+
+    def patch(self, fixups):
+        for index, word in fixups:
+            self.f.seek(index * self.LINE)
+            self.f.write(f"{word:016b}".encode('ascii'))
+        self.f.seek(0, os.SEEK_END)
+
+    def close(self, count):
+        return count
+
+class BinaryWriter:
+    """Write a packed .hackb program to a seekable binary file object"""
+
+    def __init__(self, f):
+        self.f = f
+        f.write(pack_header(0))  # count is filled in by close()
+
+    def write(self, words):
+        if sys.byteorder == 'big':
+            words = array('H', words)
+            words.byteswap()
+        self.f.write(words.tobytes())
+
+    def patch(self, fixups):
+        for index, word in fixups:
+            self.f.seek(HEADER.size + 2 * index)
+            self.f.write(struct.pack("<H", word))
+        self.f.seek(0, os.SEEK_END)
+
+    def close(self, count):
+        self.f.seek(0)
+        self.f.write(pack_header(count))
+        return count
 
 class Assembler:
-    def __init__(self, file_path):
-        self.codes = []
-        self.binary = []
+    """Single-pass Hack assembler with label backpatching"""
+
+    def __init__(self, source_map=False, variables=()):
+        self.sym = dict(SYMBOLS)
         self.allo = 16
-        # Predefined symbols (R0-R15, SCREEN, KBD, etc.)
-        self.sym = {
-            "SP": 0, "LCL": 1, "ARG": 2, "THIS": 3, "THAT": 4,
-            "R0": 0, "R1": 1, "R2": 2, "R3": 3, "R4": 4, "R5": 5, "R6": 6, "R7": 7,
-            "R8": 8, "R9": 9, "R10": 10, "R11": 11, "R12": 12, "R13": 13, "R14": 14, "R15": 15,
-            "SCREEN": 16384, "KBD": 24576
-        }
-        # Code tables for C-instructions (comp, dest, jump)
-        self.comp = {
-            "0": "0101010", "1": "0111111", "-1": "0111010", "D": "0001100", "A": "0110000", "M": "1110000",
-            "!D": "0001101", "!A": "0110001", "!M": "1110001", "-D": "0001111", "-A": "0110011", "-M": "1110011",
-            "D+1": "0011111", "A+1": "0110111", "M+1": "1110111", "D-1": "0001110", "A-1": "0110010", "M-1": "1110010",
-            "D+A": "0000010", "D+M": "1000010", "D-A": "0010011", "D-M": "1010011", "A-D": "0000111", "M-D": "1000111",
-            "D&A": "0000000", "D&M": "1000000", "D|A": "0010101", "D|M": "1010101"
-        }
-        self.dest = {
-            "null": "000", "M": "001", "D": "010", "MD": "011",
-            "A": "100", "AM": "101", "AD": "110", "AMD": "111"
-        }
-        self.jump = {
-            "null": "000", "JGT": "001", "JEQ": "010", "JGE": "011",
-            "JLT": "100", "JNE": "101", "JLE": "110", "JMP": "111"
-        }
-        self.file = os.path.basename(file_path)
-        assert self.file.endswith(".asm"), "Input file must be .asm"
-        # Read and clean lines
-        with open(file_path) as f:
-            for line in f:
-                line = line.split('//')[0].strip()  # remove comments
-                if line:
-                    self.codes.append(line)
-
-    def first_pass(self):
-        """First pass: process labels and build symbol table"""
-        new_codes, pc = [], 0
-        for line in self.codes:
-            if line.startswith('(') and line.endswith(')'):
-                label = line[1:-1]
-                self.sym[label] = pc
-            else:
-                new_codes.append(line)
-                pc += 1
-        self.codes = new_codes
-
-    def to_binary(self):
-        """Second pass: convert instructions to binary"""
-        for line in self.codes:
-            if line.startswith('@'):  # A-instruction
+        self.labels = {}  # label -> ROM address
+        self.variables = {}  # variable -> RAM address
+        for name in variables:  # allocated up front, in this order
+            self.sym[name] = self.variables[name] = self.allo
+            self.allo += 1
+        self.lines = array('L') if source_map else None  # source line per ROM address
+        self.c_words = {}  # C-instruction text -> word
+
+    def encode_c(self, line, lineno):
+        """Encode a dest=comp;jump instruction"""
+        word = self.c_words.get(line)
+        if word is not None:
+            return word
+        name, _, strides = line.partition(' ')
+        if name in NMC:
+            word = self.c_words[line] = self.encode_nmc(name, strides, line, lineno)
+            return word
+        # Split dest=comp;jump
+        if '=' in line:
+            dest, rest = line.split('=', 1)
+            dest = dest.strip()
+        else:
+            dest, rest = "null", line
+        if ';' in rest:
+            comp, jmp = rest.split(';', 1)
+            comp = comp.strip()
+            jmp = jmp.strip()
+        else:
+            comp, jmp = rest.strip(), "null"
+
+        if comp not in COMP:
+            raise ValueError(f"line {lineno}: Unknown comp mnemonic: {comp} in line: {line}")
+        if dest not in DEST:
+            raise ValueError(f"line {lineno}: Unknown dest mnemonic: {dest} in line: {line}")
+        if jmp not in JUMP:
+            raise ValueError(f"line {lineno}: Unknown jump mnemonic: {jmp} in line: {line}")
+
+        word = 0b111 << 13 | COMP[comp] << 6 | DEST[dest] << 3 | JUMP[jmp]
+        self.c_words[line] = word
+        return word
+
+    @staticmethod
+    def encode_nmc(name, strides, line, lineno):
+        """Encode an NMC instruction with its "sx,sy" strides (default 1,1)"""
+        fields = [field.strip() for field in strides.split(',')] if strides.strip() else ["1", "1"]
+        if len(fields) != 2 or not all(field.isdigit() and int(field) < 32 for field in fields):
+            raise ValueError(f"line {lineno}: NMC strides must be two numbers 0..31: {line}")
+        sx, sy = map(int, fields)
+        return 0b100 << 13 | NMC[name] << 10 | sx << 5 | sy
+
+    def assemble(self, lines, writer=None):
+        """Assemble an iterable of source lines into writer (default: WordWriter).
+
+        Returns writer.close(count): the words for a WordWriter, otherwise
+        the number of instructions.
+        """
+        if writer is None:
+            writer = WordWriter()
+        sym = self.sym
+        pending = {}  # unresolved symbol -> indices referring to it
+        labels = self.labels
+        line_numbers = self.lines
+        buf = array('H')
+        pc = 0
+        for lineno, line in enumerate(lines, 1):
+            if '//' in line:
+                line = line.split('//')[0]  # remove comments
+            line = line.strip()
+            if not line:
+                continue
+            if line[0] == '@':  # A-instruction
                 symbol = line[1:]
                 if symbol.isdigit():
-                    addr = int(symbol)
+                    word = int(symbol)
+                    if word > 0x7FFF:
+                        raise ValueError(f"line {lineno}: constant out of range: {line}")
                 else:
-                    if symbol not in self.sym:
-                        self.sym[symbol] = self.allo
-                        self.allo += 1
-                    addr = self.sym[symbol]
-                self.binary.append(f"{addr:016b}")
+                    word = sym.get(symbol)
+                    if word is None:
+                        refs = pending.get(symbol)
+                        if refs is None:
+                            refs = pending[symbol] = array('L')
+                        refs.append(pc)
+                        word = 0
+            elif line[0] == '(' and line[-1] == ')':  # label
+                label = line[1:-1]
+                if label in labels:
+                    raise ValueError(f"line {lineno}: Duplicate label: {label}")
+                if pc > 0x7FFF:
+                    raise ValueError(f"line {lineno}: label {label} at {pc} is beyond the 15-bit address range")
+                labels[label] = pc
+                sym[label] = pc
+                refs = pending.pop(label, None)
+                if refs is not None:
+                    self._patch(writer, buf, pc - len(buf), refs, pc)
+                continue
             else:  # C-instruction
-                # Split dest=comp;jump
-                if '=' in line:
-                    dest, rest = line.split('=', 1)
-                    dest = dest.strip()
-                else:
-                    dest, rest = "null", line
-                if ';' in rest:
-                    comp, jmp = rest.split(';', 1)
-                    comp = comp.strip()
-                    jmp = jmp.strip()
-                else:
-                    comp, jmp = rest.strip(), "null"
-                
-                if comp not in self.comp:
-                    raise ValueError(f"Unknown comp mnemonic: {comp} in line: {line}")
-                if dest not in self.dest:
-                    raise ValueError(f"Unknown dest mnemonic: {dest} in line: {line}")
-                if jmp not in self.jump:
-                    raise ValueError(f"Unknown jump mnemonic: {jmp} in line: {line}")
-                
-                bits = "111" + self.comp[comp] + self.dest[dest] + self.jump[jmp]
-                self.binary.append(bits)
-
-    def write_out(self):
-        """Write binary output to .hack file"""
-        out_file = self.file[:-4] + ".hack"
-        with open(out_file, 'w') as f:
-            for code in self.binary:
-                f.write(code + "\n")
-        print(f"Assembled {len(self.binary)} instructions to {out_file}")
+                word = self.encode_c(line, lineno)
+            buf.append(word)
+            if line_numbers is not None:
+                line_numbers.append(lineno)
+            pc += 1
+            if len(buf) >= CHUNK:
+                writer.write(buf)
+                buf = array('H')
+
+        # Symbols never defined as labels are variables
+        for symbol, refs in pending.items():
+            sym[symbol] = self.variables[symbol] = self.allo
+            self._patch(writer, buf, pc - len(buf), refs, self.allo)
+            self.allo += 1
+        writer.write(buf)
+        return writer.close(pc)
+
+    @staticmethod
+    def _patch(writer, buf, buf_start, refs, word):
+        """Fix up refs: in the unflushed buffer directly, earlier words via the writer"""
+        flushed = []
+        for index in refs:
+            if index >= buf_start:
+                buf[index - buf_start] = word
+            else:
+                flushed.append((index, word))
+        if flushed:
+            writer.patch(flushed)
+
+def prepare(lines, optimizer=None, source_map=False):
+    """Return (Assembler, lines) for source lines, run through optimizer if given"""
+    if optimizer is None:
+        return Assembler(source_map), lines
+    lines = optimizer.optimize(lines)
+    # Keep variables where the unoptimized program has them, even if the
+    # optimizer removed their first reference
+    variables = [symbol for symbol in optimizer.symbols
+                 if symbol not in SYMBOLS and symbol not in optimizer.labels and not symbol.isdigit()]
+    return Assembler(source_map, variables), lines
+
+def assemble(source, optimizer=None):
+    """Assemble source (a string or an iterable of lines) into an array('H') of words"""
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    asm, lines = prepare(source, optimizer)
+    return asm.assemble(lines)
+
+def cache_version(optimizer=None):
+    """Assembler version for cache keys; optimized output is cached separately"""
+    if optimizer is None:
+        return VERSION
+    return f"{VERSION}-O:{','.join(sorted(optimizer.temporaries))}"
+
+def output_path(asm_file, binary=False):
+    """Return the default output file for asm_file (in the current directory)"""
+    return os.path.basename(asm_file)[:-4] + (BINARY_SUFFIX if binary else ".hack")
+
+def assemble_cached(asm_file, cache, optimizer=None):
+    """Return (words, symbols) for asm_file, reusing cache when the source is unchanged.
+
+    symbols is {"labels": {...}, "variables": {...}, "lines": [...]}, with
+    the source line of every ROM address in "lines", and the optimizer's
+    counts in "peephole" when there is one (restored into it on a hit).
+    """
+    key = source_key(asm_file, cache_version(optimizer))
+    entry = cache.get(key)
+    if entry is not None:
+        if optimizer is not None:
+            peephole = entry[1]["peephole"]
+            optimizer.before, optimizer.after = peephole["before"], peephole["after"]
+            optimizer.stats.update(peephole["stats"])
+        return entry
+    with open(asm_file) as src:
+        asm, lines = prepare(src, optimizer, source_map=True)
+        words = asm.assemble(lines)
+    symbols = {"labels": asm.labels, "variables": asm.variables, "lines": list(asm.lines)}
+    if optimizer is not None:
+        symbols["peephole"] = {"before": optimizer.before, "after": optimizer.after,
+                               "stats": optimizer.stats}
+    cache.put(key, words, symbols)
+    return words, symbols
+
+def build_source_map(asm_file, cache=None):
+    """Return the SourceMap of asm_file (assembled in memory, or from cache)"""
+    if cache is not None:
+        _, symbols = assemble_cached(asm_file, cache)
+        return SourceMap(asm_file, symbols["lines"], symbols["labels"], symbols["variables"])
+    asm = Assembler(source_map=True)
+    with open(asm_file) as src:
+        asm.assemble(src)
+    return SourceMap(asm_file, asm.lines, asm.labels, asm.variables)
+
+def assemble_file(asm_file, out_file=None, binary=False, cache=None, source_map=False,
+                  optimizer=None):
+    """Assemble asm_file to a .hack text file, or a packed .hackb file if binary.
+
+    With an AssemblyCache, unchanged sources are copied from the cache
+    instead of being assembled. With source_map, the source map is written
+    next to the output (Xxx.map.json). With a PeepholeOptimizer the source
+    is optimized first. Returns the number of instructions written.
+    """
+    if not asm_file.endswith(".asm"):
+        raise ValueError("Input file must be .asm")
+    if out_file is None:
+        out_file = output_path(asm_file, binary)
+    if cache is not None:
+        words, symbols = assemble_cached(asm_file, cache, optimizer)
+        with open(out_file, 'wb') as out:
+            writer = BinaryWriter(out) if binary else TextWriter(out)
+            writer.write(words)
+            count = writer.close(len(words))
+        if source_map:
+            SourceMap(asm_file, symbols["lines"], symbols["labels"],
+                      symbols["variables"]).save(map_path(out_file))
+        return count
+    with open(asm_file) as src, open(out_file, 'wb') as out:
+        asm, lines = prepare(src, optimizer, source_map)
+        writer = BinaryWriter(out) if binary else TextWriter(out)
+        count = asm.assemble(lines, writer)
+    if source_map:
+        SourceMap(asm_file, asm.lines, asm.labels, asm.variables).save(map_path(out_file))
+    return count
+
+def find_asm_files(paths, out_dir=None, binary=False):
+    """Expand files and directories (recursively) into [(asm_file, out_file)].
+
+    Outputs go next to each source, or under out_dir keeping the layout
+    below each directory argument.
+    """
+    suffix = BINARY_SUFFIX if binary else ".hack"
+    pairs = []
+    for path in paths:
+        if os.path.isdir(path):
+            sources = sorted(os.path.join(root, f) for root, _, files in os.walk(path)
+                             for f in files if f.endswith(".asm"))
+            base = path
+        else:
+            sources = [path]
+            base = os.path.dirname(path)
+        for asm_file in sources:
+            out_file = asm_file[:-4] + suffix
+            if out_dir is not None:
+                out_file = os.path.join(out_dir, os.path.relpath(out_file, base))
+            pairs.append((asm_file, out_file))
+    return pairs
+
+def assemble_job(asm_file, out_file, binary=False, use_cache=None, source_map=False,
+                 temporaries=None):
+    """Assemble one file of a batch; errors are reported in the result, not raised.
+
+    use_cache is passed to asmcache.default_cache(). temporaries=None assembles as is; a (possibly empty) list runs the
+    peephole optimizer with those temporaries.
+    """
+    result = {"source": asm_file, "output": out_file, "status": "ok", "instructions": 0,
+              "seconds": 0.0, "cached": False, "saved": None, "error": None}
+    start = time.perf_counter()
+    try:
+        cache = default_cache(use_cache)
+        hits = cache.hits if cache is not None else 0
+        optimizer = PeepholeOptimizer(temporaries) if temporaries is not None else None
+        os.makedirs(os.path.dirname(out_file) or ".", exist_ok=True)
+        result["instructions"] = assemble_file(asm_file, out_file, binary, cache, source_map,
+                                               optimizer)
+        result["cached"] = cache is not None and cache.hits > hits
+        if optimizer is not None:
+            result["saved"] = optimizer.before - optimizer.after
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def assemble_batch(pairs, binary=False, jobs=None, use_cache=None, source_map=False,
+                   temporaries=None):
+    """Assemble every (asm_file, out_file) pair; results come back in input order.
+
+    jobs is the number of worker processes (default: one per core);
+    jobs=1 runs everything in the calling process. use_cache and
+    temporaries are as for assemble_job().
+    """
+    jobs = min(jobs or os.cpu_count() or 1, len(pairs)) or 1
+    if jobs == 1:
+        return [assemble_job(asm_file, out_file, binary, use_cache, source_map, temporaries)
+                for asm_file, out_file in pairs]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(assemble_job, asm_file, out_file, binary, use_cache, source_map,
+                               temporaries)
+                   for asm_file, out_file in pairs]
+        return [future.result() for future in futures]
+
+def print_batch(results, elapsed):
+    """Print one line per file and a summary"""
+    for r in results:
+        if r["status"] == "ok":
+            cached = " (cached)" if r["cached"] else ""
+            saved = f" ({r['saved']} saved)" if r["saved"] is not None else ""
+            print(f"{'ok':<6} {r['seconds'] * 1000:>8.1f} ms {r['instructions']:>8} instr  "
+                  f"{r['source']} -> {r['output']}{cached}{saved}")
+        else:
+            print(f"{'error':<6} {r['seconds'] * 1000:>8.1f} ms {'':>14}  {r['source']}: {r['error']}")
+    errors = sum(r["status"] != "ok" for r in results)
+    print(f"Assembled {len(results) - errors} of {len(results)} files "
+          f"({errors} errors) in {elapsed:.2f} s")
+
+def parse_temporaries(specs):
+    """["73-76", "tmp,R13"] -> ["73", "74", "75", "76", "tmp", "R13"]"""
+    temporaries = []
+    for spec in specs:
+        for part in spec.split(","):
+            first, sep, last = part.strip().partition("-")
+            if sep and first.isdigit() and last.isdigit():
+                temporaries.extend(str(n) for n in range(int(first), int(last) + 1))
+            elif part.strip():
+                temporaries.append(part.strip())
+    return temporaries
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python3 assembler.py <file.asm>")
+    parser = argparse.ArgumentParser(description="Assemble Hack assembly into Hack binary")
+    parser.add_argument("paths", nargs="+", metavar="asm_file",
+                        help="programs to assemble (.asm), or directories to search recursively")
+    parser.add_argument("-o", "--output",
+                        help="output file for a single program (default: Xxx.hack or Xxx.hackb here)")
+    parser.add_argument("--out-dir", help="batch mode: write outputs here instead of next to sources")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="batch mode: worker processes (default: number of cores)")
+    parser.add_argument("--binary", action="store_true",
+                        help="write packed little-endian uint16 (.hackb) instead of text")
+    parser.add_argument("--map", action="store_true",
+                        help="also write the source map sidecar (Xxx.map.json) next to each output")
+    caching = parser.add_mutually_exclusive_group()
+    caching.add_argument("--cache", action="store_true",
+                         help="reuse and store programs in the on-disk assembly cache "
+                              "(default: only if $HACK_ASM_CACHE is set)")
+    caching.add_argument("--no-cache", action="store_true",
+                         help="always assemble, even if $HACK_ASM_CACHE is set")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="run the peephole optimizer and report the instructions it saved")
+    parser.add_argument("--temp", action="append", default=[], metavar="ADDRS",
+                        help="with -O: scratch addresses or symbols whose stores may be dropped, "
+                             "e.g. 73-76 or tmp,R13 (repeatable)")
+    args = parser.parse_args()
+    if args.temp and not args.optimize:
+        parser.error("--temp needs -O")
+    temporaries = parse_temporaries(args.temp) if args.optimize else None
+    use_cache = True if args.cache else False if args.no_cache else None
+
+    if len(args.paths) == 1 and not os.path.isdir(args.paths[0]) and args.out_dir is None:
+        asm_file = args.paths[0]
+        out_file = args.output or output_path(asm_file, args.binary)
+        cache = default_cache(use_cache)
+        optimizer = PeepholeOptimizer(temporaries) if temporaries is not None else None
+        count = assemble_file(asm_file, out_file, binary=args.binary, cache=cache,
+                              source_map=args.map, optimizer=optimizer)
+        cached = " (cached)" if cache is not None and cache.hits else ""
+        print(f"Assembled {count} instructions to {out_file}{cached}")
+        if optimizer is not None:
+            print(optimizer.report())
+        return
+    if args.output:
+        parser.error("-o/--output takes a single program; use --out-dir for batches")
+
+    start = time.perf_counter()
+    pairs = find_asm_files(args.paths, args.out_dir, args.binary)
+    results = assemble_batch(pairs, args.binary, args.jobs, use_cache, args.map, temporaries)
+    print_batch(results, time.perf_counter() - start)
+    if any(r["status"] != "ok" for r in results):
         sys.exit(1)
-    path = sys.argv[1]
-    asm = Assembler(path)
-    asm.first_pass()
-    asm.to_binary()
-    asm.write_out()
 
 if __name__ == "__main__":
     main()
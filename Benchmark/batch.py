@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# batch.py
+# Vectorized batch emulation of many Hack machines with NumPy
+#
+# BatchCPU runs K independent machines on the same program in lock-step:
+# A, D and PC are length-K vectors and RAM is a K x 32768 uint16 array.
+# Each step executes one instruction, vectorized over every running machine
+# at the lowest PC. Machines whose control flow does not depend on their
+# data stay in a single group; divergent ones (e.g. MatMul's repeated-
+# addition loop) split up, and running the lowest PC first holds back the
+# machines that are ahead until the others reach the same PC, where the
+# groups merge again. Structured code joins its branches at a higher PC
+# (after an if/else, at a loop exit), so that is where they meet.
+#
+# Instructions come from the same decode tables as hack_cpu.py, and
+# instruction counts, cost-model cycles and halt detection match HackCPU
+# machine by machine.
+import argparse
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; only BatchCPU needs it
+    np = None
+
+from asmcache import default_cache
+from cost_models import COST_MODELS, BaselineCostModel
+from dataimage import read_image_arg
+from decode import OP_A, load_program
+from halt import find_halt_loops
+from memory import RAM_SIZE
+from nmc import is_nmc
+
+MAX_CYCLES = 10000000
+
+def vector_alu(comp, x, y):
+    """Hack ALU over int64 vectors; comp is the 7-bit comp code (a-bit ignored)"""
+    if comp & 0x20:  # zx
+        x = np.zeros_like(x)
+    if comp & 0x10:  # nx
+        x = ~x & 0xFFFF
+    if comp & 0x08:  # zy
+        y = np.zeros_like(y)
+    if comp & 0x04:  # ny
+        y = ~y & 0xFFFF
+    out = (x + y) & 0xFFFF if comp & 0x02 else x & y  # f
+    if comp & 0x01:  # no
+        out = ~out & 0xFFFF
+    return out
+
+class BatchCPU:
+    """K Hack machines running one program in lock-step"""
+
+    def __init__(self, program, k, cost_models=None, halt_detect=True, max_cycles=MAX_CYCLES):
+        if np is None:
+            raise ImportError("BatchCPU requires NumPy")
+        if isinstance(program, str):
+            program = load_program(program, default_cache())
+        self.program = list(program)
+        if any(map(is_nmc, self.program)):
+            raise ValueError("BatchCPU does not run NMC instructions; use HackCPU")
+        self.k = k
+        self.cost_models = list(cost_models) if cost_models is not None else [BaselineCostModel()]
+        self.halt_detect = halt_detect
+        self.max_cycles = max_cycles
+        # Indexed by jump target; one slot past the end for jumps out of ROM
+        self._halt_pc = np.zeros(len(self.program) + 1, dtype=bool)
+        if halt_detect:
+            self._halt_pc[sorted(find_halt_loops(self.program))] = True
+        # (models x PCs) cost table, so each group adds its costs in one operation
+        self._cost_table = np.array([model.program_costs(self.program)
+                                     for model in self.cost_models], dtype=np.float64)
+        self.RAM = np.zeros((k, RAM_SIZE), dtype=np.uint16)
+        self.reset()
+
+    def reset(self):
+        """Reset all machines; RAM is cleared in place"""
+        k = self.k
+        self.A = np.zeros(k, dtype=np.int64)
+        self.D = np.zeros(k, dtype=np.int64)
+        self.PC = np.zeros(k, dtype=np.int64)
+        self.RAM.fill(0)
+        self.instr_count = np.zeros(k, dtype=np.int64)
+        self.cycles = np.zeros((len(self.cost_models), k), dtype=np.float64)
+        self.halted = np.zeros(k, dtype=bool)
+        # Repeated-state halt detection, per machine (see halt.py)
+        self._last_pc = np.full(k, -1, dtype=np.int64)
+        self._last_D = np.zeros(k, dtype=np.int64)
+        self._mem_written = np.zeros(k, dtype=bool)
+
+    def preload(self, regions, machine=None):
+        """Write (address, values) regions into every machine's RAM, or one machine's"""
+        rows = slice(None) if machine is None else machine
+        for address, values in regions:
+            words = np.asarray(values, dtype=np.int64) & 0xFFFF
+            self.RAM[rows, address:address + len(words)] = words
+
+    def running(self):
+        """Boolean vector of machines that have neither halted nor left ROM"""
+        return ((~self.halted) & (self.PC >= 0) & (self.PC < len(self.program))
+                & (self.instr_count < self.max_cycles))
+
+    def cycle_costs(self):
+        """Return {cost model name: per-machine weighted cycles vector}"""
+        return {model.name: self.cycles[i] for i, model in enumerate(self.cost_models)}
+
+    def step(self):
+        """Execute the instruction at the lowest running PC on every machine there.
+
+        Returns how many machines ran. Machines further ahead wait, so a group
+        that took a different branch catches up with them where the paths join.
+        """
+        active = np.flatnonzero(self.running())
+        if not active.size:
+            return 0
+        pcs = self.PC[active]
+        pc = pcs.min()
+        group = active[pcs == pc]
+        self._execute(int(pc), group)
+        return group.size
+
+    def run(self, n=None):
+        """Run until every machine stops, or for at most n steps; returns steps taken"""
+        steps = 0
+        while n is None or steps < n:
+            if not self.step():
+                break
+            steps += 1
+        return steps
+
+    def _execute(self, pc, idx):
+        """Execute the instruction at pc on machines idx"""
+        op, operand, dest, jump = self.program[pc]
+        self.instr_count[idx] += 1
+        self.cycles[:, idx] += self._cost_table[:, pc:pc + 1]
+        if op == OP_A:
+            self.A[idx] = operand
+            self.PC[idx] = pc + 1
+            return
+
+        old_A = self.A[idx]
+        D = self.D[idx]
+        y = self.RAM[idx, old_A].astype(np.int64) if operand & 0x40 else old_A
+        val = vector_alu(operand, D, y)
+
+        # Write destinations (in parallel - old A addresses memory)
+        if dest & 1:
+            self.RAM[idx, old_A] = val
+            self._mem_written[idx] = True
+        A = val if dest & 4 else old_A
+        if dest & 4:
+            self.A[idx] = val
+        if dest & 2:
+            self.D[idx] = val
+            D = val
+
+        if not jump:
+            self.PC[idx] = pc + 1
+            return
+        negative = (val & 0x8000) != 0
+        zero = val == 0
+        taken = np.zeros(idx.size, dtype=bool)
+        if jump & 4:
+            taken |= negative
+        if jump & 2:
+            taken |= zero
+        if jump & 1:
+            taken |= ~(negative | zero)
+        self.PC[idx] = np.where(taken, A, pc + 1)
+        if not self.halt_detect or not taken.any():
+            return
+
+        # Halt detection at taken jumps, as in HaltDetector.on_jump
+        jumped = idx[taken]
+        target = A[taken]
+        D_after = D[taken]
+        halted = self._halt_pc[np.minimum(target, len(self.program))]
+        halted |= ((self._last_pc[jumped] == target) & (self._last_D[jumped] == D_after)
+                   & ~self._mem_written[jumped])
+        self.halted[jumped] |= halted
+        self._last_pc[jumped] = target
+        self._last_D[jumped] = D_after
+        self._mem_written[jumped] = False
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run one .hack program on many inputs at once (one machine per data image)")
+    parser.add_argument("hack_file", help="program to run (.hack or .hackb)")
+    parser.add_argument("images", nargs="+", help="data images, one machine each (.ram or file.bin[@addr])")
+    parser.add_argument("--no-halt-detect", action="store_true",
+                        help="run until the PC leaves the program or max_cycles is hit")
+    parser.add_argument("--cost-model", action="append", default=[], choices=sorted(COST_MODELS),
+                        help="also report weighted cycles under this cost model (repeatable)")
+    args = parser.parse_args()
+
+    models = [BaselineCostModel()] + [COST_MODELS[name]() for name in args.cost_model
+                                      if name != BaselineCostModel.name]
+    batch = BatchCPU(args.hack_file, len(args.images), cost_models=models,
+                     halt_detect=not args.no_halt_detect)
+    for machine, image in enumerate(args.images):
+        batch.preload(read_image_arg(image), machine)
+    steps = batch.run()
+
+    print(f"Machines: {batch.k}, lock-step steps: {steps}, "
+          f"instructions executed: {int(batch.instr_count.sum())}")
+    costs = {name: cost for name, cost in batch.cycle_costs().items()
+             if name != BaselineCostModel.name}
+    for machine, image in enumerate(args.images):
+        weighted = "".join(f", {name}: {cost[machine]:.2f} cycles" for name, cost in costs.items())
+        print(f"  {image}: {int(batch.instr_count[machine])} instructions{weighted}, "
+              f"A={int(batch.A[machine])}, D={int(batch.D[machine])}, PC={int(batch.PC[machine])}")
+
+if __name__ == "__main__":
+    main()
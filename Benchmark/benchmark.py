@@ -1,81 +1,297 @@
 #!/usr/bin/env python3
 # benchmark.py
 # Benchmark script to compare standard Hack CPU vs NMC-augmented CPU
-
-import subprocess
-import sys
+#
+# Runs the (program x CPU model) matrix in-process on a pool of worker
+# processes and collects structured results. A CPU model is an emulator
+# configuration (see CPU_MODELS); every job reports the weighted cycles of
+# all selected cost models from a single run.
+import argparse
+import csv
+import json
+import math
 import os
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-def run_benchmark(hack_file, test_name):
-    """Run both simulators on a .hack file and compare results"""
-    print(f"\n{'='*70}")
-    print(f"Benchmarking: {test_name}")
-    print(f"{'='*70}\n")
-    
-    # Run standard CPU
-    print("Running Standard Hack CPU:")
-    print("-" * 70)
-    try:
-        result_std = subprocess.run(
-            ["python3", "hack_cpu.py", hack_file],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        print(result_std.stdout)
-        if result_std.stderr:
-            print("STDERR:", result_std.stderr)
-    except subprocess.TimeoutExpired:
-        print("ERROR: Standard CPU timed out!")
-        return
-    except Exception as e:
-        print(f"ERROR running standard CPU: {e}")
-        return
-    
-    print("\n")
-    
-    # Run NMC CPU
-    print("Running NMC-Augmented Hack CPU:")
-    print("-" * 70)
+import checkpoint
+from asmcache import default_cache
+from cost_models import COST_MODELS
+from dataimage import read_image_arg
+from hack_cpu import HackCPU
+from hackbin import BINARY_SUFFIX
+from nmc import is_nmc
+
+# CPU model name -> HackCPU keyword arguments
+CPU_MODELS = {
+    "interp": {},                   # one instruction at a time
+    "blocks": {"blocks": True},     # compiled basic blocks
+}
+
+DEFAULT_TIMEOUT = 30.0  # seconds per job
+CHUNK = 100000          # instructions between timeout checks
+
+def summarize(samples, higher_is_better=False):
+    """Return median/p95/stddev/min/mean of a list of samples.
+
+    p95 is the slow tail: the nearest-rank 95th percentile of times, or
+    with higher_is_better (rates) the 5th percentile.
+    """
+    if not samples:
+        return {"median": 0.0, "p95": 0.0, "stddev": 0.0, "min": 0.0, "mean": 0.0}
+    ordered = sorted(samples)
+    rank = math.ceil((0.05 if higher_is_better else 0.95) * len(ordered))
+    p95 = ordered[max(0, rank - 1)]
+    return {"median": statistics.median(ordered), "p95": p95,
+            "stddev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+            "min": ordered[0], "mean": statistics.mean(ordered)}
+
+def run_job(hack_file, cpu_model, cost_models, timeout=DEFAULT_TIMEOUT, repeat=1, warmup=0,
+            data=(), checkpoint_dir=None, use_cache=None):
+    """Run one (program, CPU model) job and return its result dict.
+
+    The program is loaded once, then run warmup untimed times and repeat
+    timed times (resetting the machine in between). wall_time and
+    instr_per_sec are the medians over the timed runs; their full
+    distributions are under "stats". Program loading is not timed; data
+    regions are preloaded into RAM before every run.
+
+    The timeout covers the whole job and is checked every CHUNK
+    instructions; a job that exceeds it stops there and reports what it
+    executed so far with status "timeout". With checkpoint_dir, the machine
+    state at the timeout is saved there (see checkpoint.py) so the run can
+    be resumed with hack_cpu.py --resume. use_cache is passed to
+    asmcache.default_cache() for .asm programs.
+    """
+    result = {"program": hack_file, "cpu": cpu_model, "status": "ok",
+              "instructions": 0, "cycles": {}, "wall_time": 0.0,
+              "instr_per_sec": 0.0, "repeat": 0, "stats": {}, "state": None, "error": None,
+              "checkpoint": None, "nmc": False}
+    start = time.perf_counter()
+    wall_times = []
     try:
-        result_nmc = subprocess.run(
-            ["python3", "hack_cpu_nmc.py", hack_file],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        print(result_nmc.stdout)
-        if result_nmc.stderr:
-            print("STDERR:", result_nmc.stderr)
-    except subprocess.TimeoutExpired:
-        print("ERROR: NMC CPU timed out!")
-        return
+        default_cache(use_cache)
+        cpu = HackCPU(hack_file, cost_models=[COST_MODELS[name]() for name in cost_models],
+                      **CPU_MODELS[cpu_model])
+        result["nmc"] = any(map(is_nmc, cpu.program))
+        cpu.preload(data)
+        for rep in range(warmup + repeat):
+            cpu.reset()
+            rep_start = time.perf_counter()
+            while cpu.run(CHUNK):
+                if timeout is not None and time.perf_counter() - start > timeout:
+                    result["status"] = "timeout"
+                    break
+            if rep >= warmup or result["status"] == "timeout":
+                wall_times.append(time.perf_counter() - rep_start)
+            if result["status"] == "timeout":
+                if checkpoint_dir:
+                    os.makedirs(checkpoint_dir, exist_ok=True)
+                    path = os.path.join(checkpoint_dir, f"{os.path.basename(hack_file)}."
+                                                        f"{cpu_model}{checkpoint.SUFFIX}")
+                    checkpoint.save(cpu, path)
+                    result["checkpoint"] = path
+                break
     except Exception as e:
-        print(f"ERROR running NMC CPU: {e}")
-        return
-    
-    print("\n" + "="*70 + "\n")
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["wall_time"] = time.perf_counter() - start
+        return result
+    rates = [cpu.instr_count / t for t in wall_times if t > 0]
+    result["instructions"] = cpu.instr_count
+    result["cycles"] = cpu.cycle_costs()
+    result["repeat"] = len(wall_times)
+    result["stats"] = {"wall_time": summarize(wall_times), "instr_per_sec": summarize(rates, higher_is_better=True)}
+    result["wall_time"] = result["stats"]["wall_time"]["median"]
+    result["instr_per_sec"] = result["stats"]["instr_per_sec"]["median"]
+    result["state"] = cpu.state()
+    return result
+
+def run_matrix(hack_files, cpu_models, cost_models, jobs=None, timeout=DEFAULT_TIMEOUT,
+               repeat=1, warmup=0, data=(), checkpoint_dir=None, use_cache=None):
+    """Run every (program, CPU model) pair; results come back in matrix order.
+
+    jobs is the number of worker processes (default: one per core);
+    jobs=1 runs everything in the calling process.
+    """
+    matrix = [(hack_file, cpu_model) for hack_file in hack_files for cpu_model in cpu_models]
+    jobs = min(jobs or os.cpu_count() or 1, len(matrix)) or 1
+    if jobs == 1:
+        return [run_job(hack_file, cpu_model, cost_models, timeout, repeat, warmup, data,
+                        checkpoint_dir, use_cache)
+                for hack_file, cpu_model in matrix]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_job, hack_file, cpu_model, cost_models, timeout, repeat,
+                               warmup, data, checkpoint_dir, use_cache)
+                   for hack_file, cpu_model in matrix]
+        return [future.result() for future in futures]
+
+def print_results(results, cost_models):
+    """Print results as a table, one row per job"""
+    header = f"{'program':<24} {'cpu':<7} {'status':<8} {'instructions':>12}"
+    for name in cost_models:
+        header += f" {name + ' cyc':>14}"
+    if "baseline" in cost_models and "nmc" in cost_models:
+        header += f" {'speedup':>8}"
+    header += f" {'wall ms':>9} {'p95 ms':>9} {'instr/s':>11}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        row = (f"{os.path.basename(r['program']):<24} {r['cpu']:<7} {r['status']:<8} "
+               f"{r['instructions']:>12}")
+        for name in cost_models:
+            row += f" {r['cycles'].get(name, 0.0):>14.2f}"
+        if "baseline" in cost_models and "nmc" in cost_models:
+            # A program with NMC instructions has no baseline run to compare with
+            nmc = r["cycles"].get("nmc") if not r.get("nmc") else None
+            row += f" {r['cycles']['baseline'] / nmc:>7.2f}x" if nmc else f" {'-':>8}"
+        p95 = r["stats"].get("wall_time", {}).get("p95", r["wall_time"])
+        row += f" {r['wall_time'] * 1000:>9.1f} {p95 * 1000:>9.1f} {r['instr_per_sec']:>11.0f}"
+        print(row)
+    for r in results:
+        if r["error"]:
+            print(f"ERROR {r['program']} ({r['cpu']}): {r['error']}")
+        if r["checkpoint"]:
+            print(f"TIMEOUT {r['program']} ({r['cpu']}) at {r['instructions']} instructions; "
+                  f"resume with: hack_cpu.py --resume {r['checkpoint']} {r['program']}")
+
+def write_json(path, results):
+    """Write results, with host information, as JSON"""
+    report = {"version": 1,
+              "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "host": {"platform": platform.platform(), "python": platform.python_version(),
+                       "cpus": os.cpu_count()},
+              "results": results}
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+def write_csv(path, results, cost_models):
+    """Write results as CSV, one row per job"""
+    fields = ["program", "cpu", "status", "instructions"]
+    fields += [f"cycles_{name}" for name in cost_models]
+    fields += ["repeat", "wall_time_median", "wall_time_p95", "wall_time_stddev",
+               "instr_per_sec_median", "instr_per_sec_p95", "instr_per_sec_stddev", "error"]
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for r in results:
+            row = {"program": r["program"], "cpu": r["cpu"], "status": r["status"],
+                   "instructions": r["instructions"], "repeat": r["repeat"],
+                   "error": r["error"] or ""}
+            for name in cost_models:
+                row[f"cycles_{name}"] = r["cycles"].get(name, "")
+            for metric in ("wall_time", "instr_per_sec"):
+                stats = r["stats"].get(metric, {})
+                for stat in ("median", "p95", "stddev"):
+                    row[f"{metric}_{stat}"] = stats.get(stat, "")
+            writer.writerow(row)
+
+def compare_results(results, baseline, threshold):
+    """Compare median throughput against a previous JSON report.
+
+    Jobs are matched by program path (relative to the current directory,
+    so "./x.hack" and "x.hack" match) and CPU model. Returns the list of
+    regressions: jobs whose median instr/sec dropped by more than threshold
+    (a fraction, e.g. 0.05 for 5%).
+    """
+    previous = {(os.path.relpath(r["program"]), r["cpu"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\nComparison against baseline (threshold {threshold:.0%}):")
+    for r in results:
+        program = os.path.relpath(r["program"])
+        old = previous.get((program, r["cpu"]))
+        name = f"{program} ({r['cpu']})"
+        if old is None or old["status"] != "ok" or r["status"] != "ok":
+            print(f"  {name:<36} skipped (missing or failed)")
+            continue
+        change = r["instr_per_sec"] / old["instr_per_sec"] - 1 if old["instr_per_sec"] else 0.0
+        verdict = "ok"
+        if change < -threshold:
+            verdict = "REGRESSION"
+            regressions.append(r)
+        elif change > threshold:
+            verdict = "faster"
+        note = ""
+        if r["instructions"] != old["instructions"]:
+            note = f" (instructions {old['instructions']} -> {r['instructions']})"
+        print(f"  {name:<36} {old['instr_per_sec']:>11.0f} -> {r['instr_per_sec']:>11.0f} "
+              f"instr/s {change:+7.1%}  {verdict}{note}")
+    return regressions
+
+def find_hack_files(paths, suffixes=('.hack', BINARY_SUFFIX)):
+    """Expand files and directories into a sorted list of .hack/.hackb files"""
+    hack_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            hack_files += sorted(os.path.join(path, f) for f in os.listdir(path)
+                                 if f.endswith(suffixes))
+        else:
+            hack_files.append(path)
+    return hack_files
 
 def main():
     """Main benchmark runner"""
-    if len(sys.argv) > 1:
-        # Run specific test
-        hack_file = sys.argv[1]
-        if not os.path.exists(hack_file):
-            print(f"Error: File {hack_file} not found")
-            sys.exit(1)
-        test_name = os.path.basename(hack_file)
-        run_benchmark(hack_file, test_name)
-    else:
-        # Run all .hack files in current directory
-        hack_files = [f for f in os.listdir('.') if f.endswith('.hack')]
-        if not hack_files:
-            print("No .hack files found in current directory")
-            print("Usage: python3 benchmark.py [file.hack]")
-            sys.exit(1)
-        
-        for hack_file in sorted(hack_files):
-            run_benchmark(hack_file, hack_file)
+    parser = argparse.ArgumentParser(description="Compare standard and NMC Hack CPU cycle costs")
+    parser.add_argument("paths", nargs="*", default=["."],
+                        help=".hack/.hackb/.asm files or directories (default: current directory)")
+    parser.add_argument("--asm", action="store_true",
+                        help="run the .asm sources in directories, assembled on the fly")
+    parser.add_argument("--cache", action="store_true",
+                        help="assemble .asm programs through the on-disk assembly cache "
+                             "(also on when $HACK_ASM_CACHE is set)")
+    parser.add_argument("--cpu", action="append", choices=sorted(CPU_MODELS),
+                        help="CPU model to run (repeatable, default: interp)")
+    parser.add_argument("--cost-model", action="append", choices=sorted(COST_MODELS),
+                        help="cost model to report (repeatable, default: baseline and nmc)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (default: number of cores)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help=f"per-job timeout in seconds (default: {DEFAULT_TIMEOUT:g})")
+    parser.add_argument("-n", "--repeat", type=int, default=1,
+                        help="timed repetitions per job (default: 1)")
+    parser.add_argument("--warmup", type=int, default=None,
+                        help="untimed warm-up runs per job (default: 1 if --repeat > 1, else 0)")
+    parser.add_argument("--data", action="append", default=[], metavar="IMAGE",
+                        help="preload RAM from a data image for every job (repeatable)")
+    parser.add_argument("--checkpoint-dir", metavar="DIR",
+                        help="save the machine state of jobs that time out here")
+    parser.add_argument("--json", metavar="FILE", help="write results as JSON")
+    parser.add_argument("--csv", metavar="FILE", help="write results as CSV")
+    parser.add_argument("--compare", metavar="BASELINE_JSON",
+                        help="flag throughput regressions against a previous --json report")
+    parser.add_argument("--threshold", type=float, default=0.05,
+                        help="relative instr/sec drop counted as a regression (default: 0.05)")
+    args = parser.parse_args()
+
+    hack_files = find_hack_files(args.paths, ('.asm',) if args.asm else ('.hack', BINARY_SUFFIX))
+    missing = [f for f in hack_files if not os.path.exists(f)]
+    if missing:
+        print(f"Error: File {missing[0]} not found")
+        sys.exit(1)
+    if not hack_files:
+        print("No .hack files found in current directory")
+        print("Usage: python3 benchmark.py [file.hack ...]")
+        sys.exit(1)
+
+    cost_models = args.cost_model or ["baseline", "nmc"]
+    warmup = args.warmup if args.warmup is not None else int(args.repeat > 1)
+    results = run_matrix(hack_files, args.cpu or ["interp"], cost_models,
+                         jobs=args.jobs, timeout=args.timeout, repeat=args.repeat, warmup=warmup,
+                         data=[region for image in args.data for region in read_image_arg(image)],
+                         checkpoint_dir=args.checkpoint_dir, use_cache=args.cache or None)
+    print_results(results, cost_models)
+    if args.json:
+        write_json(args.json, results)
+    if args.csv:
+        write_csv(args.csv, results, cost_models)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare_results(results, baseline, args.threshold):
+            sys.exit(2)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# bitsim.py
+# Bit-parallel gate-level evaluation for exhaustive and random chip testing
+#
+# Every net holds a Python int with one bit per test vector ("lane"), so a
+# Nand gate is one big-int operation over all lanes at once:
+#     out = mask ^ (a & b)
+# and a netlist of G gates evaluates N vectors in G C-level operations
+# instead of G * N Python ones. Stimulus is generated directly in this
+# bit-plane form (plane i of a pin holds bit i of every lane): exhaustive
+# counting patterns, or random bits. to_planes/from_planes convert between
+# planes and per-lane words with big-int and bytes operations only.
+#
+# check_chip() compares a chip with a reference model on every lane and
+# reports the first failing vector. The models are written twice: per word
+# (REFERENCES, the readable specification, also accepted for custom
+# models) and per bit plane (PLANE_REFERENCES, used by default), so the
+# check runs at the speed of the gate evaluation instead of one Python
+# call per lane.
+#
+#     python3 bitsim.py ALU --random 1000000
+#     python3 bitsim.py Add16 --exhaustive
+import argparse
+import random
+import sys
+import time
+from array import array
+
+from alu import MASK16, alu
+from gatesim import NET_FALSE, NET_TRUE, Netlist
+from hdl import HDLLibrary
+
+CHUNK_GATES = 512
+BATCH_BITS = 20  # lanes per batch: 2**20
+TO_ASCII = bytes.maketrans(b"\x00\x01", b"01")
+FROM_ASCII = bytes.maketrans(b"01", b"\x00\x01")
+
+def lane_mask(lanes):
+    return (1 << lanes) - 1
+
+def to_planes(words, width):
+    """Per-lane words (at most 16 bits) -> [plane] with bit i of every lane"""
+    data = array('H', words)
+    if sys.byteorder == 'big':
+        data.byteswap()
+    x = int.from_bytes(data.tobytes(), 'little')
+    ones = int.from_bytes(b"\x01\x00" * len(data), 'little')  # bit 0 of every 16-bit field
+    planes = []
+    for i in range(width):
+        bits = ((x >> i) & ones).to_bytes(2 * len(data), 'little')[::2]  # one 0/1 byte per lane
+        planes.append(int(bits.translate(TO_ASCII)[::-1] or b"0", 2))
+    return planes
+
+def from_planes(planes, lanes):
+    """[plane] -> array('H') of per-lane words"""
+    x = 0
+    buf = bytearray(2 * lanes)
+    for i, plane in enumerate(planes):
+        bits = format(plane & lane_mask(lanes), f"0{lanes}b")[::-1].encode()
+        buf[0::2] = bits.translate(FROM_ASCII)
+        x |= int.from_bytes(buf, 'little') << i
+    words = array('H', x.to_bytes(2 * lanes, 'little'))
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words
+
+def exhaustive(pins, batch_bits=BATCH_BITS):
+    """Yield (first lane, lanes, {pin: [plane]}) covering every input combination.
+
+    pins is [(name, width)]; the combined input counts up with the first
+    pin in the low bits. Large spaces come in batches of 2**batch_bits.
+    """
+    total = sum(width for _, width in pins)
+    bits = min(total, batch_bits)
+    lanes = 1 << bits
+    mask = lane_mask(lanes)
+    patterns = []
+    for k in range(bits):
+        period = 1 << (k + 1)
+        block = ((1 << (period >> 1)) - 1) << (period >> 1)  # upper half of each period
+        patterns.append(block * (mask // ((1 << period) - 1)))
+    for batch in range(1 << (total - bits)):
+        stimulus = {}
+        k = 0
+        for name, width in pins:
+            planes = []
+            for _ in range(width):
+                if k < bits:
+                    planes.append(patterns[k])
+                else:
+                    planes.append(mask if batch >> (k - bits) & 1 else 0)
+                k += 1
+            stimulus[name] = planes
+        yield batch * lanes, lanes, stimulus
+
+def random_stimulus(pins, count, seed=None, batch_bits=BATCH_BITS):
+    """Yield (first lane, lanes, {pin: [plane]}) for count random vectors"""
+    rng = random.Random(seed)
+    first = 0
+    while first < count:
+        lanes = min(count - first, 1 << batch_bits)
+        yield first, lanes, {name: [rng.getrandbits(lanes) for _ in range(width)]
+                             for name, width in pins}
+        first += lanes
+
+class BitParallelSim:
+    """Evaluates a Nand/DFF netlist on many lanes at once.
+
+    Builtin (word-level) chips have no bit-parallel form, so the netlist
+    must be built without any.
+    """
+
+    def __init__(self, netlist, watch=()):
+        if netlist.builtins():
+            raise ValueError(f"{netlist.top}: bit-parallel simulation needs a Nand/DFF-only netlist "
+                             f"(builtins: {', '.join(sorted({b.chip for b in netlist.builtins()}))})")
+        self.netlist = netlist
+        needed = {i for i, _ in netlist.dffs}
+        for nets in netlist.outputs.values():
+            needed.update(nets)
+        for name in watch:
+            needed.update(netlist.signals[name])
+        self.needed = needed
+        order, _, _ = netlist.levelize(needed)
+        gates = [netlist.nodes[index] for index in order]
+        self.gate_count = len(gates)
+        self.functions = self._compile(gates, needed)
+        self.reset()
+
+    def _compile(self, gates, needed):
+        # Chunks of straight-line code on locals; nets crossing chunks go through v
+        chunks = [gates[i:i + CHUNK_GATES] for i in range(0, len(gates), CHUNK_GATES)]
+        chunk_of = {}
+        for number, chunk in enumerate(chunks):
+            for gate in chunk:
+                chunk_of[gate[3]] = number
+        exported = set(needed)
+        for number, chunk in enumerate(chunks):
+            for _, a, b, _ in chunk:
+                for net in (a, b):
+                    if chunk_of.get(net, -1) != number:
+                        exported.add(net)
+
+        def ref(net):
+            if net == NET_FALSE:
+                return "0"
+            if net == NET_TRUE:
+                return "m"
+            return f"n{net}"
+        source = []
+        for number, chunk in enumerate(chunks):
+            lines = [f"def chunk_{number}(v, m):"]
+            loaded = set()
+            for _, a, b, _ in chunk:
+                for net in (a, b):
+                    if net > NET_TRUE and chunk_of.get(net, -1) != number and net not in loaded:
+                        lines.append(f"    n{net} = v[{net}]")
+                        loaded.add(net)
+            for _, a, b, out in chunk:
+                if a == b:
+                    lines.append(f"    n{out} = m ^ {ref(a)}")
+                else:
+                    lines.append(f"    n{out} = m ^ ({ref(a)} & {ref(b)})")
+                if out in exported:
+                    lines.append(f"    v[{out}] = n{out}")
+            source.append("\n".join(lines))
+        namespace = {}
+        exec(compile("\n".join(source), f"<{self.netlist.top} bit-parallel>", "exec"), namespace)
+        return [namespace[f"chunk_{number}"] for number in range(len(chunks))]
+
+    def reset(self):
+        """All DFFs to 0 in every lane"""
+        self.state = {out: 0 for _, out in self.netlist.dffs}
+
+    def evaluate(self, stimulus, lanes):
+        """Evaluate {pin: [plane]} on lanes vectors; returns {output pin: [plane]}.
+
+        Unlisted input pins are 0. Reads, but does not change, DFF state.
+        """
+        m = lane_mask(lanes)
+        v = [0] * self.netlist.net_count
+        v[NET_TRUE] = m
+        for pin, nets in self.netlist.inputs.items():
+            for net, plane in zip(nets, stimulus.get(pin, ())):
+                v[net] = plane & m
+        for net, plane in self.state.items():
+            v[net] = plane & m
+        for function in self.functions:
+            function(v, m)
+        self.values = v
+        return {pin: [v[net] for net in nets] for pin, nets in self.netlist.outputs.items()}
+
+    def step(self, stimulus, lanes):
+        """One clock cycle in every lane: evaluate, then latch the DFFs"""
+        outputs = self.evaluate(stimulus, lanes)
+        v = self.values
+        self.state = {out: v[i] for i, out in self.netlist.dffs}
+        return outputs
+
+def _dmux(value, sel, ways):
+    return tuple(value if i == sel else 0 for i in range(ways))
+
+def _alu(x, y, zx, nx, zy, ny, f, no):
+    out = alu(x, y, zx, nx, zy, ny, f, no)
+    return out, int(out == 0), out >> 15
+
+# Word-level reference models of the combinational chips. Each is called
+# with the input pin values in HDL declaration order and returns the
+# output values in declaration order.
+REFERENCES = {
+    "Nand": lambda a, b: (1 ^ (a & b),),
+    "Not": lambda x: (1 ^ x,),
+    "And": lambda a, b: (a & b,),
+    "Or": lambda a, b: (a | b,),
+    "Xor": lambda a, b: (a ^ b,),
+    "Mux": lambda a, b, sel: (b if sel else a,),
+    "DMux": lambda x, sel: _dmux(x, sel, 2),
+    "Not16": lambda x: (~x & MASK16,),
+    "And16": lambda a, b: (a & b,),
+    "Or16": lambda a, b: (a | b,),
+    "Mux16": lambda a, b, sel: (b if sel else a,),
+    "Or8Way": lambda x: (int(x != 0),),
+    "Mux4Way16": lambda a, b, c, d, sel: ((a, b, c, d)[sel],),
+    "Mux8Way16": lambda a, b, c, d, e, f, g, h, sel: ((a, b, c, d, e, f, g, h)[sel],),
+    "DMux4Way": lambda x, sel: _dmux(x, sel, 4),
+    "DMux8Way": lambda x, sel: _dmux(x, sel, 8),
+    "HalfAdder": lambda a, b: (a ^ b, a & b),
+    "FullAdder": lambda a, b, c: (a ^ b ^ c, (a + b + c) >> 1),
+    "Add16": lambda a, b: ((a + b) & MASK16,),
+    "Inc16": lambda x: ((x + 1) & MASK16,),
+    "ALU": _alu,
+}
+
+# The same models on bit planes: each is called with the lane mask m and
+# the input pins' plane lists in declaration order, and returns the output
+# plane lists in declaration order, so a reference costs a few big-int
+# operations per bit like the netlist itself rather than one call per lane.
+def _p_mux(a, b, sel, m):
+    return [(x & (m ^ sel)) | (y & sel) for x, y in zip(a, b)]
+
+def _p_mux_way(inputs, sel, m):
+    # Mux tree: sel plane 0 picks within pairs, plane 1 between pairs, ...
+    for s in sel:
+        inputs = [_p_mux(a, b, s, m) for a, b in zip(inputs[0::2], inputs[1::2])]
+    return (inputs[0],)
+
+def _p_dmux_way(x, sel, m):
+    outputs = []
+    for i in range(1 << len(sel)):
+        plane = x[0]
+        for k, s in enumerate(sel):
+            plane &= s if i >> k & 1 else m ^ s
+        outputs.append([plane])
+    return tuple(outputs)
+
+def _p_add(a, b, carry=0):
+    out = []
+    for x, y in zip(a, b):
+        half = x ^ y
+        out.append(half ^ carry)
+        carry = (x & y) | (carry & half)
+    return out
+
+def _p_or(planes):
+    out = 0
+    for plane in planes:
+        out |= plane
+    return out
+
+def _p_alu(m, x, y, zx, nx, zy, ny, f, no):
+    zx, nx, zy, ny, f, no = zx[0], nx[0], zy[0], ny[0], f[0], no[0]
+    x = [(p & (m ^ zx)) ^ nx for p in x]
+    y = [(p & (m ^ zy)) ^ ny for p in y]
+    out = [p ^ no for p in _p_mux([a & b for a, b in zip(x, y)], _p_add(x, y), f, m)]
+    return out, [m ^ _p_or(out)], [out[15]]
+
+PLANE_REFERENCES = {
+    "Nand": lambda m, a, b: ([m ^ (a[0] & b[0])],),
+    "Not": lambda m, x: ([m ^ x[0]],),
+    "And": lambda m, a, b: ([a[0] & b[0]],),
+    "Or": lambda m, a, b: ([a[0] | b[0]],),
+    "Xor": lambda m, a, b: ([a[0] ^ b[0]],),
+    "Mux": lambda m, a, b, sel: (_p_mux(a, b, sel[0], m),),
+    "DMux": lambda m, x, sel: _p_dmux_way(x, sel, m),
+    "Not16": lambda m, x: ([m ^ p for p in x],),
+    "And16": lambda m, a, b: ([p & q for p, q in zip(a, b)],),
+    "Or16": lambda m, a, b: ([p | q for p, q in zip(a, b)],),
+    "Mux16": lambda m, a, b, sel: (_p_mux(a, b, sel[0], m),),
+    "Or8Way": lambda m, x: ([_p_or(x)],),
+    "Mux4Way16": lambda m, a, b, c, d, sel: _p_mux_way([a, b, c, d], sel, m),
+    "Mux8Way16": lambda m, a, b, c, d, e, f, g, h, sel: _p_mux_way([a, b, c, d, e, f, g, h], sel, m),
+    "DMux4Way": lambda m, x, sel: _p_dmux_way(x, sel, m),
+    "DMux8Way": lambda m, x, sel: _p_dmux_way(x, sel, m),
+    "HalfAdder": lambda m, a, b: ([a[0] ^ b[0]], [a[0] & b[0]]),
+    "FullAdder": lambda m, a, b, c: (lambda s: ([s[0]], [s[1]]))(_p_add(a + [0], b + [0], c[0])),
+    "Add16": lambda m, a, b: (_p_add(a, b),),
+    "Inc16": lambda m, x: (_p_add(x, [m] + [0] * 15),),
+    "ALU": _p_alu,
+}
+
+def reference_planes(reference, stimulus, lanes, input_pins, output_pins):
+    """Run a word-level reference on every lane; returns {output pin: [plane]}"""
+    columns = [from_planes(stimulus[pin], lanes) for pin, _ in input_pins]
+    results = zip(*map(reference, *columns))
+    return {pin: to_planes(column, width) for (pin, width), column in zip(output_pins, results)}
+
+def check_chip(chip, reference=None, count=None, seed=None, library=None):
+    """Test a combinational chip against its reference model.
+
+    reference is a word-level model, called once per vector; by default
+    the chip's PLANE_REFERENCES model runs on whole batches instead, so
+    "elapsed" covers gate evaluation and reference check together.
+    Exhaustive when count is None, else count random vectors. Returns
+    {"chip", "vectors", "gates", "elapsed", "failure"} where failure is
+    None or (inputs, expected, got) of the first failing vector.
+    """
+    netlist = Netlist(chip, library)
+    sim = BitParallelSim(netlist)
+    plane_reference = None if reference else PLANE_REFERENCES.get(netlist.top)
+    reference = reference or REFERENCES.get(netlist.top)
+    if reference is None:
+        raise ValueError(f"no reference model for {netlist.top}")
+    input_pins = [(pin, len(nets)) for pin, nets in netlist.inputs.items()]
+    output_pins = [(pin, len(nets)) for pin, nets in netlist.outputs.items()]
+    if plane_reference is not None:
+        def run_reference(stimulus, lanes):
+            m = lane_mask(lanes)
+            outputs = plane_reference(m, *[[p & m for p in stimulus[pin]] for pin, _ in input_pins])
+            return {pin: planes for (pin, _), planes in zip(output_pins, outputs)}
+    else:
+        def run_reference(stimulus, lanes):
+            return reference_planes(reference, stimulus, lanes, input_pins, output_pins)
+    batches = exhaustive(input_pins) if count is None else random_stimulus(input_pins, count, seed)
+    vectors = 0
+    start = time.perf_counter()
+    for first, lanes, stimulus in batches:
+        got = sim.evaluate(stimulus, lanes)
+        expected = run_reference(stimulus, lanes)
+        wrong = 0
+        for pin, _ in output_pins:
+            for g, e in zip(got[pin], expected[pin]):
+                wrong |= g ^ e
+        vectors += lanes
+        if wrong:
+            lane = (wrong & -wrong).bit_length() - 1
+            word = lambda planes: sum(((p >> lane) & 1) << i for i, p in enumerate(planes))
+            failure = ({pin: word(stimulus[pin]) for pin, _ in input_pins},
+                       {pin: word(expected[pin]) for pin, _ in output_pins},
+                       {pin: word(got[pin]) for pin, _ in output_pins})
+            return {"chip": netlist.top, "vectors": vectors, "gates": sim.gate_count,
+                    "elapsed": time.perf_counter() - start, "failure": failure,
+                    "first": first + lane}
+    return {"chip": netlist.top, "vectors": vectors, "gates": sim.gate_count,
+            "elapsed": time.perf_counter() - start, "failure": None}
+
+def main():
+    parser = argparse.ArgumentParser(description="Bit-parallel test of HDL chips against reference models")
+    parser.add_argument("chips", nargs="*", help=f"chips to test (default: all of {', '.join(REFERENCES)})")
+    parser.add_argument("--random", type=int, metavar="N",
+                        help="test N random vectors (default: exhaustive up to 2**24 vectors, "
+                             "else 1000000 random)")
+    parser.add_argument("--exhaustive", action="store_true", help="test every input combination")
+    parser.add_argument("--seed", type=int, help="random seed")
+    args = parser.parse_args()
+
+    failed = False
+    for chip in args.chips or [name for name in REFERENCES if name != "Nand"]:
+        definition = HDLLibrary().chip(chip)
+        if definition is None:
+            raise SystemExit(f"no HDL file for chip {chip}")
+        bits = sum(width for _, width in definition.inputs)
+        count = args.random
+        if count is None and not args.exhaustive and bits > 24:
+            count = 1000000
+        try:
+            result = check_chip(chip, count=count, seed=args.seed)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        mode = "exhaustive" if count is None else "random"
+        rate = result["vectors"] / result["elapsed"] if result["elapsed"] else 0
+        status = "ok" if result["failure"] is None else "FAIL"
+        print(f"{result['chip']:<10} {status:<5} {result['vectors']:>10} {mode:<10} vectors "
+              f"{result['gates']:>5} gates  {result['elapsed']:6.2f}s  {rate:>12.0f} vectors/s")
+        if result["failure"]:
+            inputs, expected, got = result["failure"]
+            print(f"    vector {result['first']}: inputs {inputs}")
+            print(f"    expected {expected}, got {got}")
+            failed = True
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
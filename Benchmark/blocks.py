@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# blocks.py
+# Basic-block compiler for the Hack emulators
+#
+# The decoded program is split into basic blocks: a block starts at a jump
+# target (or right after a jumping instruction) and ends at the next jumping
+# C-instruction. Each block is turned into Python source, compiled once with
+# compile()/exec and cached by its start PC, so straight-line runs such as
+#     @74 / A=M / D=M / @70 / M=D
+# execute as a single function call with no per-instruction dispatch.
+# Values loaded by A-instructions are propagated as constants inside a block,
+# so "@70 / M=D" compiles to "RAM[70] = D".
+#
+# Blocks can also start at any other PC (e.g. the target of a computed jump
+# like "A=M / 0;JMP"); such blocks are compiled on first use.
+#
+# Comp codes without a mnemonic, including NMC instructions (nmc.py), call
+# their kernel from the table passed to BlockCompiler.
+from alu import ALU_KERNELS, COMP_MNEMONICS
+from decode import OP_A
+
+# Canonical comp mnemonic -> Python expression over D, A (x) and M (y)
+_COMP_EXPRS = {
+    "0": "0", "1": "1", "-1": "65535",
+    "D": "D", "A": "{A}", "M": "{M}",
+    "!D": "~D & 65535", "!A": "~{A} & 65535", "!M": "~{M} & 65535",
+    "-D": "-D & 65535", "-A": "-{A} & 65535", "-M": "-{M} & 65535",
+    "D+1": "(D + 1) & 65535", "A+1": "({A} + 1) & 65535", "M+1": "({M} + 1) & 65535",
+    "D-1": "(D - 1) & 65535", "A-1": "({A} - 1) & 65535", "M-1": "({M} - 1) & 65535",
+    "D+A": "(D + {A}) & 65535", "D+M": "(D + {M}) & 65535",
+    "D-A": "(D - {A}) & 65535", "D-M": "(D - {M}) & 65535",
+    "A-D": "({A} - D) & 65535", "M-D": "({M} - D) & 65535",
+    "D&A": "D & {A}", "D&M": "D & {M}", "D|A": "D | {A}", "D|M": "D | {M}",
+}
+
+# Jump mask -> condition on the unsigned ALU output v
+_JUMP_CONDS = {
+    1: "0 < v < 32768",             # JGT
+    2: "v == 0",                    # JEQ
+    3: "v < 32768",                 # JGE
+    4: "v >= 32768",                # JLT
+    5: "v != 0",                    # JNE
+    6: "v == 0 or v >= 32768",      # JLE
+    7: "True",                      # JMP
+}
+
+class Block:
+    """A compiled basic block.
+
+    fn(A, D, RAM) runs the block and returns (next_pc, A, D, jumped).
+    length is the number of instructions it executes and writes_mem
+    whether any of them writes M.
+    """
+
+    __slots__ = ("start", "length", "writes_mem", "fn", "source")
+
+    def __init__(self, start, length, writes_mem, fn, source):
+        self.start = start
+        self.length = length
+        self.writes_mem = writes_mem
+        self.fn = fn
+        self.source = source
+
+def find_leaders(program):
+    """Return the sorted start PCs of the program's basic blocks"""
+    size = len(program)
+    leaders = {0}
+    for pc, (op, operand, _, jump) in enumerate(program):
+        if op == OP_A:
+            # "@L" immediately followed by a jump: L is a static jump target
+            if pc + 1 < size and program[pc + 1][0] != OP_A and program[pc + 1][3]:
+                if operand < size:
+                    leaders.add(operand)
+        elif jump and pc + 1 < size:
+            leaders.add(pc + 1)
+    return sorted(leaders)
+
+class BlockCompiler:
+    """Compiles and caches basic blocks of a decoded program"""
+
+    def __init__(self, program, kernels=ALU_KERNELS):
+        self.program = program
+        self.kernels = kernels  # comp code -> kernel, for codes without a mnemonic
+        self.leaders = frozenset(find_leaders(program))
+        self.cache = {}
+
+    def block_at(self, pc):
+        """Return the (cached) block starting at pc"""
+        block = self.cache.get(pc)
+        if block is None:
+            block = self.cache[pc] = self.compile(pc)
+        return block
+
+    def block_end(self, start):
+        """Return the PC one past the last instruction of the block at start"""
+        program = self.program
+        pc = start
+        while pc < len(program):
+            op, _, _, jump = program[pc]
+            pc += 1
+            if (op != OP_A and jump) or pc in self.leaders:
+                break
+        return pc
+
+    def compile(self, start, max_len=None):
+        """Compile the block at start, truncated to max_len instructions"""
+        end = self.block_end(start)
+        if max_len is not None:
+            end = min(end, start + max_len)
+        lines = []
+        a_const = None  # value of A if set by an A-instruction in this block
+        writes_mem = False
+        for pc in range(start, end):
+            op, operand, dest, jump = self.program[pc]
+            if op == OP_A:
+                a_const = operand
+                continue
+            a_ref = "A" if a_const is None else str(a_const)
+            mnemonic = COMP_MNEMONICS.get(operand)
+            if mnemonic is None:
+                if a_const is not None:
+                    lines.append(f"A = {a_const}")
+                    a_const = None
+                expr = f"K[{operand}](D, A, RAM)"
+            else:
+                expr = _COMP_EXPRS[mnemonic].format(A=a_ref, M=f"RAM[{a_ref}]")
+            if dest & 1:
+                writes_mem = True
+            if jump or bin(dest).count("1") > 1:
+                lines.append(f"v = {expr}")
+                expr = "v"
+            if dest & 1:
+                lines.append(f"RAM[{a_ref}] = {expr}")
+            if dest & 2:
+                lines.append(f"D = {expr}")
+            if dest & 4:
+                lines.append(f"A = {expr}")
+                a_const = None
+            if jump:
+                if a_const is not None:
+                    lines.append(f"A = {a_const}")
+                    a_const = None
+                lines.append(f"if {_JUMP_CONDS[jump]}:")
+                lines.append("    return A, A, D, True")
+        if a_const is not None:
+            lines.append(f"A = {a_const}")
+        lines.append(f"return {end}, A, D, False")
+        source = "def block(A, D, RAM):\n" + "".join(f"    {line}\n" for line in lines)
+        namespace = {"K": self.kernels}
+        exec(compile(source, f"<block {start}-{end - 1}>", "exec"), namespace)
+        return Block(start, end - start, writes_mem, namespace["block"], source)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# check_assembler.py
+# Regression check of the streaming assembler against project6/Assembler.py
+#
+# assembler.py resolves labels in one pass with a backpatch list and writes
+# words in chunks of CHUNK, so a reference to a symbol defined later is
+# patched either in the unflushed buffer or, once its chunk has been
+# written, through the writer (in memory, .hack text or packed .hackb).
+# This script assembles programs with both implementations and compares
+# the words of every writer:
+#     - the in-tree .asm files (all of the repository, or the given paths)
+#     - seeded random programs with forward and backward label references
+#       and variables
+#     - a program longer than CHUNK whose first chunk refers to variables,
+#       which are only allocated (and patched) after the last line
+# Every program also runs with tiny CHUNK sizes, so forward label
+# references cross a chunk boundary and go through writer.patch().
+# Sources using NMC mnemonics are skipped: the reference does not know them.
+#
+#     python3 check_assembler.py              # exit status 1 on any mismatch
+#     python3 check_assembler.py --random 1000 ../project4/Mult.asm
+import argparse
+import importlib.util
+import io
+import os
+import random
+import sys
+import tempfile
+from array import array
+
+import assembler
+from assembler import COMP, DEST, JUMP, NMC, Assembler, BinaryWriter, TextWriter
+from hackbin import HEADER
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REFERENCE = os.path.join(HERE, "..", "project6", "Assembler.py")
+CHUNK_SIZES = (1, 7)  # besides assembler.CHUNK
+
+def load_reference(path=REFERENCE):
+    """Import project6/Assembler.py as a module"""
+    spec = importlib.util.spec_from_file_location("project6_assembler", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def reference_words(module, lines):
+    """Assemble source lines with the reference (two-pass) assembler"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "program.asm")
+        with open(path, 'w') as f:
+            f.writelines(lines)
+        ref = module.Assembler(path)
+    ref.process_label()
+    ref.parse()
+    return [int(code, 2) for code in ref.binary_codes]
+
+def streaming_words(lines):
+    """Assemble source lines with every writer; return {writer name: words}"""
+    words = {"memory": list(Assembler().assemble(lines))}
+    out = io.BytesIO()
+    Assembler().assemble(lines, TextWriter(out))
+    words["text"] = [int(line, 2) for line in out.getvalue().decode('ascii').split()]
+    out = io.BytesIO()
+    Assembler().assemble(lines, BinaryWriter(out))
+    packed = array('H', out.getvalue()[HEADER.size:])
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    words["binary"] = list(packed)
+    return words
+
+def compare(module, name, lines):
+    """Return a list of mismatch descriptions for one program"""
+    expected = reference_words(module, lines)
+    failures = []
+    default_chunk = assembler.CHUNK
+    try:
+        for chunk in (default_chunk,) + CHUNK_SIZES:
+            assembler.CHUNK = chunk
+            for writer, words in streaming_words(lines).items():
+                if words != expected:
+                    index = next((i for i, (a, b) in enumerate(zip(words, expected)) if a != b),
+                                 min(len(words), len(expected)))
+                    failures.append(f"{name}: {writer} writer, CHUNK={chunk}: first difference "
+                                    f"at word {index} ({len(words)} vs {len(expected)} words)")
+    finally:
+        assembler.CHUNK = default_chunk
+    return failures
+
+def random_program(rng, size):
+    """A random program of about size instructions with labels and variables"""
+    labels = [f"L{i}" for i in range(rng.randrange(1, 8))]
+    variables = [f"v{i}" for i in range(rng.randrange(0, 6))]
+    symbols = labels + variables + ["R3", "SCREEN", "KBD", "SP"]
+    comps, dests, jumps = sorted(COMP), sorted(DEST), sorted(JUMP)
+    lines = []
+    placed = set()
+    for _ in range(size):
+        r = rng.random()
+        if r < 0.1 and len(placed) < len(labels):
+            label = rng.choice([label for label in labels if label not in placed])
+            placed.add(label)
+            lines.append(f"({label})")
+        elif r < 0.5:
+            operand = rng.choice(symbols) if rng.random() < 0.6 else str(rng.randrange(0x8000))
+            lines.append(f"@{operand}")
+        else:
+            dest, comp, jump = rng.choice(dests), rng.choice(comps), rng.choice(jumps)
+            lines.append((dest + "=" if dest != "null" else "") + comp
+                         + (";" + jump if jump != "null" else ""))
+        if rng.random() < 0.05:
+            lines.append("// comment")
+    for label in labels:
+        if label not in placed:
+            lines.append(f"({label})")
+    return [line + "\n" for line in lines]
+
+def long_program():
+    """Variables referenced in the first chunk, allocated after the last line"""
+    lines = ["@first\n", "M=0\n", "@LOOP\n", "0;JMP\n", "(LOOP)\n"]
+    count = 4
+    while count <= assembler.CHUNK + 100:
+        lines += [f"@x{count % 50}\n", "D=M\n", "@LOOP\n", "D;JGT\n"]
+        count += 4
+    lines += ["@first\n", "M=D\n", "@last\n", "M=D\n"]
+    return lines
+
+def repo_sources(paths):
+    """The .asm files under paths (default: the whole repository)"""
+    found = []
+    for path in paths or [os.path.join(HERE, "..")]:
+        if os.path.isdir(path):
+            found += sorted(os.path.join(root, f) for root, _, files in os.walk(path)
+                            for f in files if f.endswith(".asm"))
+        else:
+            found.append(path)
+    return found
+
+def uses_nmc(lines):
+    return any(line.split()[:1] and line.split()[0] in NMC for line in lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare assembler.py with project6/Assembler.py")
+    parser.add_argument("paths", nargs="*", help=".asm files or directories (default: the repository)")
+    parser.add_argument("--random", type=int, default=300, metavar="N",
+                        help="random programs to compare (default: 300)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    args = parser.parse_args()
+
+    module = load_reference()
+    failures = []
+    checked = skipped = 0
+    for path in repo_sources(args.paths):
+        with open(path) as f:
+            lines = f.readlines()
+        if uses_nmc(lines):
+            skipped += 1
+            continue
+        failures += compare(module, os.path.relpath(path), lines)
+        checked += 1
+    rng = random.Random(args.seed)
+    for i in range(args.random):
+        failures += compare(module, f"random program {i}", random_program(rng, rng.randrange(1, 200)))
+    failures += compare(module, "long program", long_program())
+
+    for failure in failures:
+        print(failure)
+    print(f"{checked} source files ({skipped} with NMC instructions skipped), {args.random} random "
+          f"programs and 1 program over {assembler.CHUNK} words: "
+          f"{'OK' if not failures else f'{len(failures)} mismatches'}")
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
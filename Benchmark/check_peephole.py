@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# check_peephole.py
+# Regression check of the peephole optimizer (peephole.py, assembler.py -O)
+#
+# Every program is assembled with and without the optimizer and run to its
+# halt on HackCPU; the final RAM must be the same, except at the program's
+# temporaries (whose final values the optimizer may drop). A and D are not
+# compared: the optimizer drops D writes a halt loop does not read.
+# Programs checked:
+#     - hand-written cases for each rewrite, including ones that must not
+#       fire (with temporaries)
+#     - the in-tree .asm files that halt within MAX_CYCLES (no temporaries)
+#     - seeded random programs with variables and forward jumps only, so
+#       every one halts (no temporaries)
+#
+#     python3 check_peephole.py              # exit status 1 on any mismatch
+#     python3 check_peephole.py --random 3000 ../project4/Mult.asm
+import argparse
+import os
+import random
+
+from assembler import COMP, prepare
+from check_assembler import repo_sources
+from decode import decode_words
+from hack_cpu import HackCPU
+from peephole import PeepholeOptimizer
+
+MAX_CYCLES = 1000000
+
+# (name, source, temporaries)
+CASES = [
+    ("dead store", "@x\nM=1\n@T\nM=D\n@x\nD=M\n(END)\n@END\n0;JMP\n", ["T"]),
+    # AM=1 writes M at the A @T set; dropping @T would write x instead
+    ("dead store, next writes AM", "@x\nM=0\n@T\nM=D\nAM=1\n(END)\n@END\n0;JMP\n", ["T"]),
+    ("dead store, next writes A", "@T\nM=D\nA=1\nD=A\n@x\nM=D\n(END)\n@END\n0;JMP\n", ["T"]),
+    ("dead store, numeric temporary", "@7\nD=A\n@73\nM=D\n@x\nM=D\n(END)\n@END\n0;JMP\n", ["73"]),
+    ("read temporary", "@5\nD=A\n@T\nM=D\n@T\nD=M\n@x\nM=D\n(END)\n@END\n0;JMP\n", ["T"]),
+    ("read-modify-write", "@9\nD=A\n@x\nM=D\nD=M\nD=D+1\nM=D\n@y\nM=D\n(END)\n@END\n0;JMP\n", []),
+    ("accumulate", "@3\nD=A\n@x\nM=D\n@4\nD=A\n@y\nM=D\n"
+                   "@x\nD=M\n@y\nD=D-M\n@x\nM=D\n(END)\n@END\n0;JMP\n", []),
+    ("forward A=M", "@y\nD=A\n@x\nM=D\nD=M\nA=M\nM=1\n(END)\n@END\n0;JMP\n", []),
+]
+
+def run(lines, optimizer=None):
+    """Assemble and run lines; return (RAM, variable addresses)"""
+    asm, lines = prepare(lines, optimizer)
+    cpu = HackCPU(decode_words(asm.assemble(lines)), max_cycles=MAX_CYCLES)
+    cpu.run()
+    return (list(cpu.RAM) if not cpu.running else None), asm.sym
+
+def compare(name, lines, temporaries=()):
+    """Return (mismatch descriptions, whether the program halted)"""
+    expected, _ = run(lines)
+    if expected is None:
+        return [], False
+    optimizer = PeepholeOptimizer(temporaries)
+    got, symbols = run(lines, optimizer)
+    if got is None:
+        return [f"{name}: optimized program does not halt"], True
+    scratch = {int(t) if t.isdigit() else symbols[t] for t in optimizer.temporaries}
+    diffs = [address for address, (a, b) in enumerate(zip(got, expected))
+             if a != b and address not in scratch]
+    if diffs:
+        address = diffs[0]
+        return [f"{name}: RAM[{address}] is {got[address]}, unoptimized {expected[address]} "
+                f"({len(diffs)} addresses differ; {optimizer.report()})"], True
+    return [], True
+
+def random_program(rng, size):
+    """A random halting program: variables, R registers and forward jumps"""
+    variables = [f"v{i}" for i in range(rng.randrange(1, 6))] + ["R0", "R1", "5"]
+    comps = sorted(comp for comp in COMP if "A" not in comp or rng.random() < 0.5)
+    lines = []
+    pending = []  # labels jumped to but not placed yet
+    for _ in range(size):
+        r = rng.random()
+        if r < 0.35:
+            lines.append(f"@{rng.choice(variables)}")
+        elif r < 0.45:
+            # Forward jump on D (RAM at a label address would move); its label
+            # is placed further down
+            pending.append(f"L{len(lines)}")
+            lines += [f"@{pending[-1]}", f"{rng.choice(('D', 'D-1', 'D+1', '!D'))};"
+                                         f"{rng.choice(('JGT', 'JEQ', 'JLT', 'JNE', 'JMP'))}",
+                      f"@{rng.choice(variables)}"]
+        elif r < 0.55 and pending:
+            lines += [f"({pending.pop(rng.randrange(len(pending)))})", f"@{rng.choice(variables)}"]
+        else:
+            # A is only set by @ and is never a label after a jump or label,
+            # so M always addresses a variable (not a ROM address that moves)
+            dest = rng.choice(("M", "D", "MD"))
+            lines.append(f"{dest}={rng.choice(comps)}")
+    lines += [f"({label})" for label in pending]
+    lines += ["(END)", "@END", "0;JMP"]
+    return [line + "\n" for line in lines]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare optimized and unoptimized runs")
+    parser.add_argument("paths", nargs="*", help=".asm files or directories (default: the repository)")
+    parser.add_argument("--random", type=int, default=1000, metavar="N",
+                        help="random programs to compare (default: 1000)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    args = parser.parse_args()
+
+    failures = []
+    for name, source, temporaries in CASES:
+        failures += compare(name, source.splitlines(True), temporaries)[0]
+    checked = skipped = 0
+    for path in repo_sources(args.paths):
+        with open(path) as f:
+            found, halted = compare(os.path.relpath(path), f.readlines())
+        failures += found
+        checked += halted
+        skipped += not halted
+    rng = random.Random(args.seed)
+    for i in range(args.random):
+        failures += compare(f"random program {i}", random_program(rng, rng.randrange(1, 80)))[0]
+
+    for failure in failures:
+        print(failure)
+    print(f"{len(CASES)} cases, {checked} source files ({skipped} not halting within "
+          f"{MAX_CYCLES} instructions skipped) and {args.random} random programs: "
+          f"{'OK' if not failures else f'{len(failures)} mismatches'}")
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
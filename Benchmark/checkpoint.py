@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# checkpoint.py
+# Checkpoint, restore and fast-forward of HackCPU runs
+#
+# A checkpoint is the complete machine state: registers, RAM, instruction
+# count, per-PC hit counts (from which every cost model's cycles follow, so
+# NMC cost resumes exactly) and the halt detector's state. Resuming from a
+# checkpoint continues the run instruction for instruction as if it had
+# never stopped. Layout (little-endian):
+#     header  4s magic b"HCKP", u16 version, u16 flags, 32s SHA-256 of the program
+#     state   u16 A, u16 D, u32 PC, u64 instr_count, u8 halted, u8 mem_written,
+#             i32 last jump PC (-1: none), u16 last jump D, u32 program length
+#     body    zlib(RAM as 32K uint16 + hits as uint64 per PC
+#             [+ uint64 (comp, elements) pairs if flags & FLAG_ELEMENTS])
+# The element counts of NMC instructions (see nmc.py) are only stored when
+# the run has any, so checkpoints of plain programs are unchanged.
+# A 32K-word RAM that is mostly zero compresses to a few hundred bytes.
+#
+# Periodic checkpoints go to a directory as <instr_count>.hckp, so a long
+# run can be resumed after a timeout or fast-forwarded to any instruction
+# from the nearest earlier checkpoint.
+import hashlib
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from decode import encode_word
+
+MAGIC = b"HCKP"
+VERSION = 1
+SUFFIX = ".hckp"
+FLAG_ELEMENTS = 1  # body ends with NMC element counts
+
+HEADER = struct.Struct("<4sHH32s")
+STATE = struct.Struct("<HHIQBBiHI")
+
+def program_fingerprint(program):
+    """SHA-256 of a decoded program's instruction words"""
+    return hashlib.sha256(array('H', map(encode_word, program)).tobytes()).digest()
+
+def dumps(cpu):
+    """Return the machine state of cpu as checkpoint bytes"""
+    last_pc, last_D = cpu.halt.last_jump or (-1, 0)
+    hits = array('Q', cpu.hits)
+    ram = array('H', cpu.RAM)
+    elements = array('Q', [v for item in sorted(cpu.nmc_elements.items()) for v in item])
+    if sys.byteorder == 'big':
+        hits.byteswap()
+        ram.byteswap()
+        elements.byteswap()
+    flags = FLAG_ELEMENTS if elements else 0
+    return (HEADER.pack(MAGIC, VERSION, flags, program_fingerprint(cpu.program))
+            + STATE.pack(cpu.A, cpu.D, cpu.PC, cpu.instr_count, cpu.halted, cpu._mem_written,
+                         last_pc, last_D, len(hits))
+            + zlib.compress(ram.tobytes() + hits.tobytes() + elements.tobytes(), 1))
+
+def loads(cpu, blob):
+    """Restore cpu (with the same program loaded) from checkpoint bytes"""
+    magic, version, flags, fingerprint = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("not a HackCPU checkpoint")
+    if version != VERSION:
+        raise ValueError(f"unsupported checkpoint version {version}")
+    if fingerprint != program_fingerprint(cpu.program):
+        raise ValueError("checkpoint was taken with a different program")
+    (A, D, PC, instr_count, halted, mem_written,
+     last_pc, last_D, size) = STATE.unpack_from(blob, HEADER.size)
+    body = zlib.decompress(blob[HEADER.size + STATE.size:])
+    ram_bytes = 2 * len(cpu.RAM)
+    hits_end = ram_bytes + 8 * size if flags & FLAG_ELEMENTS else len(body)
+    hits = array('Q', body[ram_bytes:hits_end])
+    elements = array('Q', body[hits_end:])
+    if len(hits) != size or len(elements) % 2:
+        raise ValueError("corrupt checkpoint: hit counts do not match the program")
+    if sys.byteorder == 'big':
+        ram = array('H', body[:ram_bytes])
+        ram.byteswap()
+        hits.byteswap()
+        elements.byteswap()
+        cpu.RAM.restore(ram.tobytes())
+    else:
+        cpu.RAM.restore(body[:ram_bytes])
+    cpu.A, cpu.D, cpu.PC = A, D, PC
+    cpu.instr_count = instr_count
+    cpu.halted = bool(halted)
+    cpu._mem_written = bool(mem_written)
+    cpu.hits = hits.tolist()
+    cpu.nmc_elements.clear()  # the kernels hold this dict, so it is updated in place
+    cpu.nmc_elements.update(zip(elements[::2], elements[1::2]))
+    cpu.halt.last_jump = (last_pc, last_D) if last_pc >= 0 else None
+
+def save(cpu, path):
+    """Write a checkpoint file (atomically: readers never see a partial file)"""
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(dumps(cpu))
+    os.replace(tmp, path)
+
+def load(cpu, path):
+    """Restore cpu from a checkpoint file"""
+    with open(path, 'rb') as f:
+        loads(cpu, f.read())
+
+def checkpoint_path(directory, instr_count):
+    return os.path.join(directory, f"{instr_count:012d}{SUFFIX}")
+
+def list_checkpoints(directory):
+    """Return [(instr_count, path)] of the checkpoints in directory, oldest first"""
+    found = []
+    for name in os.listdir(directory):
+        stem = name[:-len(SUFFIX)]
+        if name.endswith(SUFFIX) and stem.isdigit():
+            found.append((int(stem), os.path.join(directory, name)))
+    return sorted(found)
+
+def run_with_checkpoints(cpu, directory, interval, n=None):
+    """Run cpu (up to n instructions), checkpointing every interval instructions.
+
+    A final checkpoint is written where the run stops. Returns the number
+    of instructions executed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    executed = 0
+    while n is None or executed < n:
+        step = interval - cpu.instr_count % interval
+        if n is not None:
+            step = min(step, n - executed)
+        ran = cpu.run(step)
+        executed += ran
+        if not ran:
+            break
+        save(cpu, checkpoint_path(directory, cpu.instr_count))
+    return executed
+
+def resume(cpu, directory, target=None):
+    """Restore the latest checkpoint in directory at or before instruction target.
+
+    Returns its instruction count, or None (cpu untouched) if there is none.
+    """
+    usable = [(count, path) for count, path in list_checkpoints(directory)
+              if target is None or count <= target]
+    if not usable:
+        return None
+    count, path = usable[-1]
+    load(cpu, path)
+    return count
+
+def fast_forward(cpu, directory, target):
+    """Bring cpu to instruction count target via the nearest earlier checkpoint.
+
+    Starts from a reset machine if no checkpoint qualifies. Returns the
+    final instruction count (less than target if the program stops first).
+    """
+    if resume(cpu, directory, target) is None:
+        cpu.reset()
+    if cpu.instr_count < target:
+        cpu.run(target - cpu.instr_count)
+    return cpu.instr_count
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# cosim.py
+# Verified behavioral substitution for mixed-level gate simulation
+#
+# A chip simulated at gate level costs its whole flattened netlist every
+# cycle; RAM16K alone is half a million Nand gates. gatesim.Netlist can
+# instead run any chip through its word-level model in gatesim.BUILTINS
+# (RAM backed by an array('H'), registers, PC), but a model is only a
+# valid stand-in if it behaves like the chip's HDL. verify() checks that
+# once by random co-simulation: the chip's Nand/DFF netlist runs in
+# bitsim.BitParallelSim with one independent test sequence per lane, one
+# model instance per lane runs the same inputs, and the outputs are
+# compared every cycle. Wide inputs are drawn mostly from a base value and
+# its one-bit neighbours (base ^ 1 << k), so a write to one address is
+# soon followed by reads of addresses differing in a single bit: address
+# lines that are ignored or crossed show up within a few cycles.
+#
+# Results are cached in a JSON file keyed by the SHA-256 of every HDL file
+# in the chip's hierarchy, the model's source and the test parameters, so
+# the check reruns only when something it depends on changes. substitute()
+# builds a Netlist with verified chips as builtins and refuses any chip
+# whose model disagrees with its HDL.
+#
+# Location: $HACK_COSIM_CACHE, default ~/.cache/hack-gatesim/verified.json
+#
+#     python3 cosim.py RAM8 RAM64 PC
+#     python3 gatesim.py ../project5/Computer.hdl --rom MatMul.hack --substitute RAM64
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import random
+import tempfile
+import time
+
+from bitsim import BitParallelSim, to_planes
+from gatesim import BUILTINS, PRIMITIVES, Netlist
+from hdl import HDLLibrary
+
+DEFAULT_CYCLES = 200
+DEFAULT_LANES = 64
+NEIGHBOUR_RATE = 0.75  # share of wide-pin values taken from base ^ 1 << k
+VERSION = 1  # bump when the stimulus or comparison changes
+
+def default_path():
+    """Return the results file from $HACK_COSIM_CACHE or the user cache dir"""
+    return os.environ.get("HACK_COSIM_CACHE") or os.path.join(
+        os.path.expanduser("~"), ".cache", "hack-gatesim", "verified.json")
+
+def hierarchy_key(chip, model, library, cycles, lanes, seed):
+    """SHA-256 of the chip's HDL files, the model's source and the test parameters"""
+    digest = hashlib.sha256(f"{VERSION}\0{chip}\0{cycles}\0{lanes}\0{seed}\0".encode())
+    try:
+        digest.update(inspect.getsource(type(model)).encode())
+    except (OSError, TypeError):
+        digest.update(type(model).__qualname__.encode())
+    seen = set()
+    pending = [chip]
+    while pending:
+        name = pending.pop()
+        if name in seen or name in PRIMITIVES:
+            continue
+        seen.add(name)
+        path = library.find(name)
+        if path is None:
+            digest.update(f"\0builtin {name}".encode())
+            continue
+        with open(path, 'rb') as f:
+            digest.update(f"\0{name}\0".encode() + f.read())
+        pending.extend(part.chip for part in library.chip(name).parts)
+    return digest.hexdigest()
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save(path, results):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def _word(planes, lane):
+    return sum(((plane >> lane) & 1) << i for i, plane in enumerate(planes))
+
+def cosimulate(chip, factory=None, cycles=DEFAULT_CYCLES, lanes=DEFAULT_LANES, seed=0, library=None):
+    """Run a chip's gate netlist and its behavioral model side by side.
+
+    Returns {"chip", "cycles", "lanes", "gates", "elapsed", "failure"}
+    where failure is None or {"cycle", "lane", "inputs", "expected", "got"}
+    for the first disagreeing output.
+    """
+    library = library or HDLLibrary()
+    factory = factory or BUILTINS.get(chip)
+    if factory is None:
+        raise ValueError(f"no behavioral model for chip {chip}")
+    netlist = Netlist(chip, library)
+    sim = BitParallelSim(netlist)
+    models = [factory() for _ in range(lanes)]
+    input_pins = [(pin, len(nets)) for pin, nets in netlist.inputs.items()]
+    output_pins = [(pin, len(nets)) for pin, nets in netlist.outputs.items()]
+    if dict(input_pins) != models[0].inputs or dict(output_pins) != models[0].outputs:
+        raise ValueError(f"{chip}: model pins {models[0].inputs} -> {models[0].outputs} do not match "
+                         f"the HDL pins {dict(input_pins)} -> {dict(output_pins)}")
+
+    rng = random.Random(seed)
+    bases = [{pin: rng.getrandbits(width) for pin, width in input_pins} for _ in range(lanes)]
+    start = time.perf_counter()
+    for cycle in range(cycles):
+        columns = {pin: [] for pin, _ in input_pins}
+        for lane in range(lanes):
+            for pin, width in input_pins:
+                if width > 1 and rng.random() < NEIGHBOUR_RATE:
+                    k = rng.randrange(width + 1)
+                    value = bases[lane][pin] ^ (1 << k if k < width else 0)
+                else:
+                    value = rng.getrandbits(width)
+                columns[pin].append(value)
+        got = sim.step({pin: to_planes(columns[pin], width) for pin, width in input_pins}, lanes)
+
+        expected = {pin: [] for pin, _ in output_pins}
+        for lane, model in enumerate(models):
+            ins = {pin: columns[pin][lane] for pin, _ in input_pins}
+            for pin, value in model.evaluate(ins).items():
+                expected[pin].append(value)
+            model.tick(ins)
+        wrong = 0
+        for pin, width in output_pins:
+            for g, e in zip(got[pin], to_planes(expected[pin], width)):
+                wrong |= g ^ e
+        if wrong:
+            lane = (wrong & -wrong).bit_length() - 1
+            failure = {"cycle": cycle, "lane": lane,
+                       "inputs": {pin: columns[pin][lane] for pin, _ in input_pins},
+                       "expected": {pin: expected[pin][lane] for pin, _ in output_pins},
+                       "got": {pin: _word(got[pin], lane) for pin, _ in output_pins}}
+            break
+    else:
+        cycle, failure = cycles, None
+    return {"chip": netlist.top, "cycles": cycle, "lanes": lanes, "gates": sim.gate_count,
+            "elapsed": time.perf_counter() - start, "failure": failure}
+
+def verify(chip, factory=None, cycles=DEFAULT_CYCLES, lanes=DEFAULT_LANES, seed=0, library=None,
+           path=None, use_cache=True):
+    """cosimulate() once per version of the chip's hierarchy and model.
+
+    Returns the cosimulate() result with "cached" set when it came from
+    the results file.
+    """
+    library = library or HDLLibrary()
+    factory = factory or BUILTINS.get(chip)
+    if factory is None:
+        raise ValueError(f"no behavioral model for chip {chip}")
+    if library.chip(chip) is None:
+        raise ValueError(f"no HDL file for chip {chip}")
+    path = path or default_path()
+    key = hierarchy_key(chip, factory(), library, cycles, lanes, seed)
+    if use_cache:
+        result = _load(path).get(key)
+        if result is not None:
+            return dict(result, cached=True)
+    result = cosimulate(chip, factory, cycles, lanes, seed, library)
+    results = _load(path)
+    results[key] = result
+    _save(path, results)
+    return dict(result, cached=False)
+
+def describe_failure(result):
+    failure = result["failure"]
+    return (f"{result['chip']}: behavioral model disagrees with the HDL at cycle {failure['cycle']}, "
+            f"lane {failure['lane']}: inputs {failure['inputs']}, "
+            f"expected {failure['expected']}, got {failure['got']}")
+
+def substitute(top, chips, library=None, builtin=(), **options):
+    """Netlist of top with every chip in chips replaced by its verified model.
+
+    builtin names further chips to run as builtins without a check (as
+    Netlist does). Raises ValueError if any check fails; options go to
+    verify().
+    """
+    library = library or HDLLibrary()
+    for chip in chips:
+        result = verify(chip, library=library, **options)
+        if result["failure"]:
+            raise ValueError(describe_failure(result))
+    return Netlist(top, library, set(builtin) | set(chips))
+
+def main():
+    parser = argparse.ArgumentParser(description="Check behavioral chip models against their HDL "
+                                                 "by random co-simulation")
+    parser.add_argument("chips", nargs="+", help="chips to check (models from gatesim.BUILTINS)")
+    parser.add_argument("--cycles", type=int, default=DEFAULT_CYCLES,
+                        help=f"clock cycles per lane (default: {DEFAULT_CYCLES})")
+    parser.add_argument("--lanes", type=int, default=DEFAULT_LANES,
+                        help=f"independent test sequences (default: {DEFAULT_LANES})")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument("--no-cache", action="store_true", help="rerun checks even if already done")
+    args = parser.parse_args()
+
+    failed = False
+    for chip in args.chips:
+        try:
+            result = verify(chip, cycles=args.cycles, lanes=args.lanes, seed=args.seed,
+                            use_cache=not args.no_cache)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        status = "ok" if result["failure"] is None else "FAIL"
+        source = "cached" if result["cached"] else f"{result['elapsed']:.2f}s"
+        print(f"{result['chip']:<8} {status:<5} {result['cycles']:>6} cycles x {result['lanes']} lanes "
+              f"{result['gates']:>7} gates  {source}")
+        if result["failure"]:
+            print(f"    {describe_failure(result)}")
+            failed = True
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
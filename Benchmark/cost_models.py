@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# cost_models.py
+# Cycle cost models for the Hack emulator
+#
+# A cost model assigns a weighted cycle cost to every instruction of a
+# decoded program. The emulator counts how often each PC executes, so any
+# number of models can be evaluated from a single run.
+#
+# RuleCostModel reads its costs from a JSON config of instruction patterns
+# (default: nmc_rules.json). Patterns may span several instructions, e.g.
+# the MatMul accumulate idiom "@x / D=M / @y / D=D+M / @x / M=D"; they are
+# matched once when the program is decoded, so rules cost nothing per cycle.
+#
+# NMC instructions (nmc.py) process a run-time number of elements, so they
+# are charged twice: instruction_cost() once per execution and
+# element_cost() once per element the emulator counted.
+import json
+import os
+
+from assembler import COMP, DEST, JUMP
+from decode import OP_A
+from nmc import COPY, MAC, NMC_MNEMONICS, VADD, fields, is_nmc
+
+DEFAULT_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nmc_rules.json")
+
+class CostModel:
+    """Base cost model: one cycle per instruction"""
+
+    name = "baseline"
+    description = "1 cycle per instruction (standard Hack CPU)"
+
+    def instruction_cost(self, instr):
+        """Return the weighted cycle cost of one decoded instruction"""
+        return 1.0
+
+    def program_costs(self, program):
+        """Return the per-PC cost list for a decoded program"""
+        return [self.instruction_cost(instr) for instr in program]
+
+    def element_cost(self, instr):
+        """Return the cost of one element processed by an NMC instruction"""
+        return 0.0
+
+    def element_costs(self, program):
+        """Return the per-PC element cost list (0 for non-NMC instructions)"""
+        return [self.element_cost(instr) if is_nmc(instr) else 0.0 for instr in program]
+
+class BaselineCostModel(CostModel):
+    """Standard Hack CPU: every instruction takes one cycle"""
+
+class NMCCostModel(CostModel):
+    """Near-memory computing: memory read-modify-writes run near the memory"""
+
+    name = "nmc"
+    description = ("NMC-accelerated M writes (D+M, M+1, M-1: 0.3; other M ops: 0.5); "
+                   "NMC instructions 1 + per element MAC 1.0, COPY/VADD 0.5")
+
+    # Pattern 1: D+M with M destination (read-modify-write on memory)
+    ACCEL_COMP_D_PLUS_M = 0b1000010  # D+M
+    # Pattern 2: M+1 with M destination (increment memory)
+    ACCEL_COMP_M_PLUS_1 = 0b1110111  # M+1
+    # Pattern 3: M-1 with M destination (decrement memory)
+    ACCEL_COMP_M_MINUS_1 = 0b1110010  # M-1
+
+    # Per-element cost of NMC instructions: a MAC element reads two words
+    # and multiplies, COPY and VADD elements stream one word each
+    ELEMENT_COSTS = {MAC: 1.0, COPY: 0.5, VADD: 0.5}
+
+    def __init__(self, accel_cost=0.3, mem_cost=0.5, base_cost=1.0, element_costs=None):
+        self.accel_cost = accel_cost
+        self.mem_cost = mem_cost
+        self.base_cost = base_cost
+        self.element_cost_table = dict(self.ELEMENT_COSTS, **(element_costs or {}))
+        self.accel_comps = frozenset((self.ACCEL_COMP_D_PLUS_M, self.ACCEL_COMP_M_PLUS_1,
+                                      self.ACCEL_COMP_M_MINUS_1))
+
+    def instruction_cost(self, instr):
+        op, comp, dest, _ = instr
+        if is_nmc(instr):
+            return self.base_cost
+        # NMC acceleration: operations that read and write memory can be accelerated
+        # because NMC performs computation near the memory
+        if op != OP_A and dest & 1:  # Writing to M (memory)
+            if comp in self.accel_comps:
+                # These operations benefit from near-memory computing
+                return self.accel_cost
+            if comp & 0x40:  # Any M-based computation
+                # Other M operations get moderate speedup
+                return self.mem_cost
+        return self.base_cost
+
+    def element_cost(self, instr):
+        return self.element_cost_table[fields(instr[1])[0]]
+
+class MemoryAccessCostModel(CostModel):
+    """CPU-side memory: every M read and every M write pays extra cycles"""
+
+    name = "memory"
+    description = "1 cycle per instruction + 1 per M read + 1 per M write (NMC: per element)"
+
+    # NMC opcode -> (reads, writes) per element
+    ELEMENT_ACCESSES = {MAC: (2, 0), COPY: (1, 1), VADD: (2, 1)}
+
+    def __init__(self, read_cost=1.0, write_cost=1.0, base_cost=1.0):
+        self.read_cost = read_cost
+        self.write_cost = write_cost
+        self.base_cost = base_cost
+
+    def instruction_cost(self, instr):
+        op, comp, dest, _ = instr
+        cost = self.base_cost
+        if is_nmc(instr):
+            # R13 and R14 are read; MAC reads and writes RAM[A]
+            cost += 2 * self.read_cost
+            if fields(comp)[0] == MAC:
+                cost += self.read_cost + self.write_cost
+        elif op != OP_A:
+            if comp & 0x40:
+                cost += self.read_cost
+            if dest & 1:
+                cost += self.write_cost
+        return cost
+
+    def element_cost(self, instr):
+        reads, writes = self.ELEMENT_ACCESSES[fields(instr[1])[0]]
+        return reads * self.read_cost + writes * self.write_cost
+
+def _field_matcher(text, table, any_m):
+    """Return a predicate for one dest/comp/jump field of a pattern.
+
+    "*" matches anything, "*M" any value with the M bit (any_m) set, and
+    "X|Y|..." any of the listed mnemonics.
+    """
+    if text == "*":
+        return lambda value: True
+    if text == "*M":
+        return lambda value: bool(value & any_m)
+    values = set()
+    for mnemonic in text.split("|"):
+        if mnemonic not in table:
+            raise ValueError(f"unknown mnemonic {mnemonic!r}")
+        values.add(table[mnemonic])
+    return values.__contains__
+
+def parse_pattern_element(text):
+    """Parse one pattern element into a matcher (see RuleCostModel).
+
+    Returns ("A", None, value), ("A", name, None) or ("C", None, predicate).
+    """
+    text = text.replace(" ", "")
+    if text.startswith("@"):
+        operand = text[1:]
+        if operand == "*":
+            return ("A", None, None)
+        if operand.isdigit():
+            return ("A", None, int(operand))
+        return ("A", operand, None)
+    dest, _, rest = text.rpartition("=")
+    comp, _, jump = rest.partition(";")
+    match_dest = _field_matcher(dest or "null", DEST, 1)
+    match_comp = _field_matcher(comp, COMP, 0x40)
+    match_jump = _field_matcher(jump or "null", JUMP, 0)
+    return ("C", None, lambda instr: (not is_nmc(instr) and match_comp(instr[1])
+                                      and match_dest(instr[2]) and match_jump(instr[3])))
+
+class Rule:
+    """A named instruction pattern with per-instruction costs"""
+
+    def __init__(self, name, pattern, cost):
+        self.name = name
+        self.pattern = list(pattern)
+        try:
+            self.elements = [parse_pattern_element(text) for text in self.pattern]
+        except ValueError as e:
+            raise ValueError(f"rule {name!r}: {e}") from None
+        if isinstance(cost, (int, float)):
+            # One number is the cost of the whole sequence, charged to its first instruction
+            cost = [float(cost)] + [0.0] * (len(self.pattern) - 1)
+        if len(cost) != len(self.pattern):
+            raise ValueError(f"rule {name!r}: {len(cost)} costs for {len(self.pattern)} instructions")
+        self.costs = [float(c) for c in cost]
+
+    def matches(self, program, pc, jump_targets):
+        """True if the pattern matches program at pc.
+
+        Instructions after the first may not be jump targets, so a match is
+        always entered at its start.
+        """
+        if pc + len(self.elements) > len(program):
+            return False
+        bound = {}
+        for i, (kind, name, test) in enumerate(self.elements):
+            instr = program[pc + i]
+            if i and pc + i in jump_targets:
+                return False
+            if kind == "A":
+                if instr[0] != OP_A:
+                    return False
+                if name is not None:
+                    if bound.setdefault(name, instr[1]) != instr[1]:
+                        return False
+                elif test is not None and instr[1] != test:
+                    return False
+            elif instr[0] == OP_A or not test(instr):
+                return False
+        return True
+
+def jump_targets(program):
+    """Return the static jump targets: "@T" immediately before a jump"""
+    return {program[pc - 1][1] for pc in range(1, len(program))
+            if program[pc][0] != OP_A and program[pc][3] and program[pc - 1][0] == OP_A}
+
+class RuleCostModel(CostModel):
+    """Costs from a config file of instruction-sequence rules.
+
+    Config (JSON):
+        {"default": 1.0,
+         "rules": [{"name": "mem_accumulate",
+                    "pattern": ["@x", "D=M", "@y", "D=D+M", "@x", "M=D"],
+                    "cost": 1.0}, ...]}
+    Pattern elements are Hack instructions. "@*" is any A-instruction,
+    "@16" a literal, and "@x" binds a name: every "@x" in one match must
+    load the same value. In "dest=comp;jump" each field may be a
+    mnemonic, "X|Y" alternatives, "*" (anything) or "*M" (dest writes M /
+    comp reads M); a missing dest or jump means null. "cost" is a list
+    with one cost per instruction, or one number for the whole sequence
+    (charged to its first instruction). At each PC the first rule that
+    matches wins and matching continues after it; unmatched instructions
+    cost "default". Rules never match NMC instructions; an optional
+    "nmc" object sets their per-element costs by mnemonic, e.g.
+    {"MAC": 1.0}, defaulting to NMCCostModel's.
+    """
+
+    name = "rules"
+    description = "NMC costs from instruction-pattern rules (nmc_rules.json)"
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_RULES
+        with open(self.path) as f:
+            config = json.load(f)
+        self.name = config.get("name", RuleCostModel.name)
+        self.description = config.get("description", RuleCostModel.description)
+        self.default_cost = float(config.get("default", 1.0))
+        self.rules = [Rule(rule["name"], rule["pattern"], rule["cost"])
+                      for rule in config["rules"]]
+        opcodes = {name: opcode for opcode, name in NMC_MNEMONICS.items()}
+        self.element_cost_table = dict(NMCCostModel.ELEMENT_COSTS)
+        for name, cost in config.get("nmc", {}).items():
+            if name not in opcodes:
+                raise ValueError(f"{self.path}: unknown NMC mnemonic {name!r}")
+            self.element_cost_table[opcodes[name]] = float(cost)
+
+    def match(self, program):
+        """Return (costs, rule_at): per-PC costs, and the rule index (or None)
+        of each PC where a match starts"""
+        targets = jump_targets(program)
+        costs = [self.default_cost] * len(program)
+        rule_at = [None] * len(program)
+        pc = 0
+        while pc < len(program):
+            for index, rule in enumerate(self.rules):
+                if rule.matches(program, pc, targets):
+                    costs[pc:pc + len(rule.costs)] = rule.costs
+                    rule_at[pc] = index
+                    pc += len(rule.costs)
+                    break
+            else:
+                pc += 1
+        return costs, rule_at
+
+    def program_costs(self, program):
+        return self.match(program)[0]
+
+    def element_cost(self, instr):
+        return self.element_cost_table[fields(instr[1])[0]]
+
+    def breakdown(self, program, hits, elements=None):
+        """Return [(rule name, sites, executions, instructions, cycles)] per rule,
+        costliest first; unmatched instructions are reported as "default".
+
+        With per-PC NMC element counts (HackCPU.elements()) the element
+        costs are a row of their own, "nmc_elements".
+        """
+        costs, rule_at = self.match(program)
+        rows = {}
+        pc = 0
+        while pc < len(program):
+            index = rule_at[pc]
+            length = len(self.rules[index].costs) if index is not None else 1
+            name = self.rules[index].name if index is not None else "default"
+            row = rows.setdefault(name, [0, 0, 0, 0.0])
+            span = range(pc, pc + length)
+            row[0] += 1 if index is not None else 0
+            row[1] += hits[pc] if index is not None else 0
+            row[2] += sum(hits[i] for i in span)
+            row[3] += sum(hits[i] * costs[i] for i in span)
+            pc += length
+        if elements is not None and any(elements):
+            pcs = [pc for pc, count in enumerate(elements) if count]
+            rows["nmc_elements"] = [len(pcs), sum(hits[pc] for pc in pcs), 0,
+                                    sum(elements[pc] * self.element_cost(program[pc]) for pc in pcs)]
+        return sorted(((name,) + tuple(row) for name, row in rows.items()),
+                      key=lambda row: -row[4])
+
+    def report(self, program, hits, elements=None):
+        """Return the per-rule breakdown as a table"""
+        rows = self.breakdown(program, hits, elements)
+        total = sum(row[4] for row in rows) or 1.0
+        lines = [f"Cost by rule ({self.name}: {os.path.basename(self.path)})",
+                 f"{'rule':<20} {'sites':>6} {'executions':>11} {'instructions':>13} "
+                 f"{'cycles':>12} {'%':>6}"]
+        for name, sites, executions, instructions, cycles in rows:
+            lines.append(f"{name:<20} {sites or '-':>6} {executions or '-':>11} {instructions:>13} "
+                         f"{cycles:>12.2f} {100 * cycles / total:>5.1f}%")
+        return "\n".join(lines)
+
+# Cost models selectable by name
+COST_MODELS = {model.name: model for model in (BaselineCostModel, NMCCostModel,
+                                               MemoryAccessCostModel, RuleCostModel)}
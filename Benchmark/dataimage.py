@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# dataimage.py
+# RAM data images applied before execution
+#
+# A data image is a list of regions (address, [values...]). Two file forms:
+#
+#   Text (.ram): Hack-assembly flavoured; "@addr" moves the cursor and every
+#   following number (decimal, may be negative) fills the next word.
+#       // Matrix A (2x2)
+#       @16
+#       1 0
+#       0 1
+#
+#   Raw (.bin): little-endian uint16 words loaded from a base address
+#   (0 unless given as "file.bin@addr" on the command line).
+import sys
+from array import array
+
+RAW_SUFFIX = ".bin"
+
+def parse_image(text):
+    """Parse the text image format into a list of (address, values) regions"""
+    regions = []
+    address = None
+    values = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        line = line.split('//')[0].strip()
+        if not line:
+            continue
+        if line.startswith('@'):
+            if values:
+                regions.append((address, values))
+            address = int(line[1:])
+            values = []
+            continue
+        if address is None:
+            raise ValueError(f"line {lineno}: data before the first @address")
+        values += [int(token) for token in line.split()]
+    if values:
+        regions.append((address, values))
+    return regions
+
+def format_image(regions, comments=None):
+    """Return the text image for regions; comments[i] labels region i"""
+    lines = []
+    for i, (address, values) in enumerate(regions):
+        if comments and comments[i]:
+            lines.append(f"// {comments[i]}")
+        lines.append(f"@{address}")
+        for row in range(0, len(values), 16):
+            lines.append(" ".join(str(v) for v in values[row:row + 16]))
+    return "\n".join(lines) + "\n"
+
+def write_image(path, regions, comments=None):
+    """Write regions to a text image file"""
+    with open(path, 'w') as f:
+        f.write(format_image(regions, comments))
+
+def write_raw(path, words):
+    """Write words as a raw little-endian uint16 blob"""
+    blob = array('H', (word & 0xFFFF for word in words))
+    if sys.byteorder == 'big':
+        blob.byteswap()
+    with open(path, 'wb') as f:
+        f.write(blob.tobytes())
+
+def read_image(path, base=0):
+    """Read a text (.ram) or raw (.bin) image as a list of regions"""
+    if path.endswith(RAW_SUFFIX):
+        words = array('H')
+        with open(path, 'rb') as f:
+            words.frombytes(f.read())
+        if sys.byteorder == 'big':
+            words.byteswap()
+        return [(base, words.tolist())]
+    with open(path) as f:
+        return parse_image(f.read())
+
+def read_image_arg(arg):
+    """Read an image named on the command line as "file" or "file.bin@addr" """
+    path, sep, base = arg.rpartition('@')
+    if sep and path.endswith(RAW_SUFFIX) and base.isdigit():
+        return read_image(path, int(base))
+    return read_image(arg)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# decode.py
+# Load-time decoding of .hack programs shared by the emulators
+from assembler import assemble, assemble_cached
+from hackbin import read_words
+
+# Decoded opcodes (Hack C-instruction layout: 111a cccc ccdd djjj)
+OP_A = 0
+OP_C = 1
+# NMC instructions (100o oo xx xxxy yyyy, see nmc.py) decode as C-instructions
+# whose comp is NMC_BASE + the low 13 bits, so comp codes below NMC_BASE
+# are the ALU's and the kernel table can hold both
+NMC_BASE = 0x80
+
+def decode_word(word):
+    """Decode one 16-bit instruction word into (op, operand, dest, jump).
+
+    A-instructions decode to (OP_A, value, 0, 0); C-instructions decode to
+    (OP_C, comp, dest, jump) where comp is the 7-bit a+c field as an int,
+    dest is the d1d2d3 mask (A=4, D=2, M=1) and jump is the j1j2j3 mask
+    (LT=4, EQ=2, GT=1). Words starting 100 are NMC instructions and decode
+    to (OP_C, NMC_BASE + low 13 bits, 1, 0): they write RAM[A]. Bits 14
+    and 13 of other C-instructions are ignored, as in CPU.hdl.
+    """
+    if not word & 0x8000:
+        return (OP_A, word, 0, 0)
+    if not word & 0x6000:
+        return (OP_C, NMC_BASE + (word & 0x1FFF), 1, 0)
+    return (OP_C, (word >> 6) & 0x7F, (word >> 3) & 0x7, word & 0x7)
+
+def encode_word(instr):
+    """Inverse of decode_word: the 16-bit word of a decoded instruction"""
+    op, operand, dest, jump = instr
+    if op == OP_A:
+        return operand
+    if operand >= NMC_BASE:
+        return 0x8000 | (operand - NMC_BASE)
+    return 0xE000 | operand << 6 | dest << 3 | jump
+
+def decode(instr):
+    """Decode one 16-char binary instruction string"""
+    return decode_word(int(instr, 2))
+
+def decode_words(words):
+    """Decode a sequence of instruction words; repeated words are decoded once"""
+    decoded = {}
+    program = []
+    for word in words:
+        instr = decoded.get(word)
+        if instr is None:
+            instr = decoded[word] = decode_word(word)
+        program.append(instr)
+    return program
+
+def load_program(path, cache=None):
+    """Read a .hack file (text or packed binary) and decode it once.
+
+    .asm sources are assembled on the fly, in memory or through cache
+    (an asmcache.AssemblyCache).
+    """
+    if path.endswith(".asm"):
+        if cache is None:
+            with open(path) as f:
+                return decode_words(assemble(f))
+        words, _ = assemble_cached(path, cache)
+        return decode_words(words)
+    return decode_words(read_words(path))
+
+# Jump decision, as in CPU.hdl: the j1j2j3 mask is ANDed with the ALU
+# status (ng -> 4, zr -> 2, positive -> 1), so no per-cycle branching on
+# the mnemonic is needed.
+def alu_status(val):
+    """Return the LT/EQ/GT status mask for a 16-bit ALU output"""
+    if val & 0x8000:
+        return 4
+    if val == 0:
+        return 2
+    return 1
@@ -0,0 +1,811 @@
+#!/usr/bin/env python3
+# gatesim.py
+# Compiled, event-driven gate-level simulator for the HDL chips
+#
+# Netlist flattens a chip hierarchy (hdl.py) down to Nand gates, DFFs and
+# word-level builtin chips (ROM32K, Screen, Keyboard, ARegister, ... and
+# any chip without an HDL file, see BUILTINS). Every signal bit becomes a
+# net; aliases made by "out=x" connections are merged, and gates whose
+# outputs nothing reads are dropped.
+#
+# GateSim sorts the combinational nodes topologically once, cuts that
+# order into chunks of CHUNK_GATES gates and compiles every chunk into one
+# straight-line Python function. A chunk reruns only when one of its
+# input nets changed: each function compares the nets it exports with
+# their stored values and marks just the chunks (and DFFs) that read a
+# changed net. Chunks only feed later chunks, so one forward pass over the
+# dirty flags settles the circuit. A clock cycle settles, latches every
+# DFF whose input changed and every clocked builtin, and settles again.
+# --substitute runs a chip as a builtin only after cosim.py has checked its
+# model against the chip's HDL; so does the RAM16K that --rom runs at word
+# level by default. Only --builtin swaps a chip in without a check. In this
+# tree the RAM16K check fails (project3/RAM4K.hdl ignores address bits
+# 9-11), so running Computer needs --builtin RAM16K.
+#
+#     python3 gatesim.py ../project5/CPU.hdl                      # netlist statistics
+#     python3 gatesim.py ../project5/Computer.hdl --rom MatMul.hack --check --builtin RAM16K
+import argparse
+import heapq
+import os
+import time
+from array import array
+
+from asmcache import default_cache
+from decode import encode_word, load_program
+from hdl import HDLLibrary, parse_file
+
+NET_FALSE, NET_TRUE = 0, 1
+CHUNK_GATES = 64
+
+class Builtin:
+    """Word-level model of a chip: pin widths, outputs and clocked state.
+
+    comb_inputs lists the input pins that affect the outputs within a
+    cycle; the other inputs are only sampled by tick().
+    """
+
+    inputs = {}
+    outputs = {}
+    comb_inputs = ()
+    clocked = False
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        pass
+
+    def evaluate(self, ins):
+        """Return {output pin: value} for {input pin: value}"""
+        return {}
+
+    def tick(self, ins):
+        """Clock edge: latch the inputs sampled at the end of the cycle"""
+
+class Register(Builtin):
+    """16-bit register (also ARegister and DRegister)"""
+
+    inputs = {"in": 16, "load": 1}
+    outputs = {"out": 16}
+    clocked = True
+
+    def reset(self):
+        self.value = 0
+
+    def evaluate(self, ins):
+        return {"out": self.value}
+
+    def tick(self, ins):
+        if ins["load"]:
+            self.value = ins["in"]
+
+class Bit(Builtin):
+    """1-bit register"""
+
+    inputs = {"in": 1, "load": 1}
+    outputs = {"out": 1}
+    clocked = True
+
+    def reset(self):
+        self.value = 0
+
+    def evaluate(self, ins):
+        return {"out": self.value}
+
+    def tick(self, ins):
+        if ins["load"]:
+            self.value = ins["in"]
+
+class ProgramCounter(Builtin):
+    """PC: reset, else load, else inc, else hold"""
+
+    inputs = {"in": 16, "reset": 1, "load": 1, "inc": 1}
+    outputs = {"out": 16}
+    clocked = True
+
+    def reset(self):
+        self.value = 0
+
+    def evaluate(self, ins):
+        return {"out": self.value}
+
+    def tick(self, ins):
+        if ins["reset"]:
+            self.value = 0
+        elif ins["load"]:
+            self.value = ins["in"]
+        elif ins["inc"]:
+            self.value = (self.value + 1) & 0xFFFF
+
+class RAM(Builtin):
+    """2**address_bits words of 16-bit memory (RAM8..RAM16K, Screen)"""
+
+    outputs = {"out": 16}
+    comb_inputs = ("address",)
+    clocked = True
+
+    def __init__(self, address_bits):
+        self.inputs = {"in": 16, "load": 1, "address": address_bits}
+        self.size = 1 << address_bits
+        super().__init__()
+
+    def reset(self):
+        self.memory = array('H', bytes(2 * self.size))
+
+    def evaluate(self, ins):
+        return {"out": self.memory[ins["address"]]}
+
+    def tick(self, ins):
+        if ins["load"]:
+            self.memory[ins["address"]] = ins["in"]
+
+class ROM32K(Builtin):
+    """Instruction memory; load() a list of words (kept across reset())"""
+
+    inputs = {"address": 15}
+    outputs = {"out": 16}
+    comb_inputs = ("address",)
+
+    def __init__(self):
+        self.memory = array('H', bytes(2 * 32768))
+        super().__init__()
+
+    def load(self, words):
+        self.memory[:len(words)] = array('H', words)
+
+    def evaluate(self, ins):
+        return {"out": self.memory[ins["address"]]}
+
+class Keyboard(Builtin):
+    """Memory-mapped keyboard: out is the current key code (set self.key)"""
+
+    outputs = {"out": 16}
+
+    def reset(self):
+        self.key = 0
+
+    def evaluate(self, ins):
+        return {"out": self.key}
+
+# Chip name -> factory for chips simulated at word level
+BUILTINS = {
+    "Bit": Bit, "Register": Register, "ARegister": Register, "DRegister": Register,
+    "RAM8": lambda: RAM(3), "RAM64": lambda: RAM(6), "RAM512": lambda: RAM(9),
+    "RAM4K": lambda: RAM(12), "RAM16K": lambda: RAM(14), "Screen": lambda: RAM(13),
+    "ROM32K": ROM32K, "Keyboard": Keyboard, "PC": ProgramCounter,
+}
+
+# Primitive pins: (inputs, outputs)
+PRIMITIVES = {"Nand": ({"a": 1, "b": 1}, {"out": 1}), "DFF": ({"in": 1}, {"out": 1})}
+
+class BuiltinNode:
+    """One builtin chip instance in a netlist"""
+
+    def __init__(self, path, chip, model, ins, outs):
+        self.path = path
+        self.chip = chip
+        self.model = model
+        self.ins = ins  # pin -> [net]
+        self.outs = outs
+
+def _span(bus_range, width):
+    lo, hi = bus_range if bus_range else (0, width - 1)
+    if hi >= width:
+        raise ValueError(f"bit {hi} out of range for a {width}-bit bus")
+    return lo, hi
+
+def _packer(pins):
+    """Compile v -> {pin: value} for {pin: [net]} (bit i of a pin is net i)"""
+    fields = []
+    for pin, nets in pins.items():
+        bits = " | ".join(f"v[{net}] << {i}" if i else f"v[{net}]" for i, net in enumerate(nets))
+        fields.append(f"{pin!r}: {bits or '0'}")
+    return eval(f"lambda v: {{{', '.join(fields)}}}")
+
+class Netlist:
+    """A chip hierarchy flattened to Nand gates, DFFs and builtin nodes.
+
+    builtin names chips to simulate with their BUILTINS model even where
+    an HDL file exists.
+    """
+
+    def __init__(self, top, library=None, builtin=()):
+        self.library = library or HDLLibrary()
+        self.builtin = set(builtin)
+        self.parent = [NET_FALSE, NET_TRUE]  # union-find over nets
+        self.driven = bytearray([1, 1])
+        self.nodes = []  # ("nand", a, b, out) or ("builtin", BuiltinNode), in creation order
+        self.dffs = []  # (in net, out net)
+        self.signals = {}  # "CPU.ALU.zr" -> [net]
+        self._pins = {}
+        chip = self.library.chip(top) if not top.endswith(".hdl") else parse_file(top)
+        if chip is None:
+            raise ValueError(f"no HDL file for chip {top}")
+        self.top = chip.name
+        self.inputs = {pin: self._nets(width) for pin, width in chip.inputs}
+        self.outputs = self._hdl_instance(chip, self.inputs, "")
+        self._canonicalize()
+
+    def _nets(self, width, driven=False):
+        start = len(self.parent)
+        self.parent.extend(range(start, start + width))
+        self.driven.extend([driven] * width)
+        return list(range(start, start + width))
+
+    def _find(self, net):
+        parent = self.parent
+        root = net
+        while parent[root] != root:
+            root = parent[root]
+        while parent[net] != root:
+            parent[net], net = root, parent[net]
+        return root
+
+    def _union(self, signal, driver, where):
+        a, b = self._find(signal), self._find(driver)
+        if a == b:
+            return
+        if self.driven[a] and self.driven[b]:
+            raise ValueError(f"{where}: signal has more than one driver")
+        if self.driven[a]:
+            a, b = b, a
+        self.parent[a] = b
+
+    def pins(self, name):
+        """Return ({input: width}, {output: width}) of a chip"""
+        if name not in self._pins:
+            if name in PRIMITIVES:
+                self._pins[name] = PRIMITIVES[name]
+            else:
+                chip = None if name in self.builtin else self.library.chip(name)
+                if chip is not None:
+                    self._pins[name] = (dict(chip.inputs), dict(chip.outputs))
+                elif name in BUILTINS:
+                    model = BUILTINS[name]()
+                    self._pins[name] = (dict(model.inputs), dict(model.outputs))
+                else:
+                    raise ValueError(f"no HDL file or builtin model for chip {name}")
+        return self._pins[name]
+
+    def _instance(self, name, ins, path):
+        if name == "Nand":
+            out = self._nets(1, driven=True)
+            self.nodes.append(("nand", ins["a"][0], ins["b"][0], out[0]))
+            return {"out": out}
+        if name == "DFF":
+            out = self._nets(1, driven=True)
+            self.dffs.append((ins["in"][0], out[0]))
+            return {"out": out}
+        chip = None if name in self.builtin else self.library.chip(name)
+        if chip is None:
+            model = BUILTINS[name]()
+            outs = {pin: self._nets(width, driven=True) for pin, width in model.outputs.items()}
+            self.nodes.append(("builtin", BuiltinNode(path, name, model, ins, outs)))
+            return outs
+        return self._hdl_instance(chip, ins, path)
+
+    def _hdl_instance(self, chip, ins, path):
+        prefix = path + "." if path else ""
+        signals = dict(ins)
+        outs = {pin: self._nets(width) for pin, width in chip.outputs}
+        signals.update(outs)
+        # Internal signals take the width of the part output driving them
+        for part in chip.parts:
+            part_outputs = self.pins(part.chip)[1]
+            for c in part.connections:
+                if c.pin in part_outputs and c.signal not in signals:
+                    lo, hi = _span(c.pin_range, part_outputs[c.pin])
+                    signals[c.signal] = self._nets(hi - lo + 1)
+        for name, nets in signals.items():
+            self.signals[prefix + name] = nets
+
+        counts = {}
+        for part in chip.parts:
+            counts[part.chip] = counts.get(part.chip, 0) + 1
+        seen = {}
+        for part in chip.parts:
+            where = f"{chip.path}:{part.line}"
+            part_inputs, part_outputs = self.pins(part.chip)
+            sub_ins = {pin: [NET_FALSE] * width for pin, width in part_inputs.items()}
+            for c in part.connections:
+                if c.pin in part_inputs:
+                    lo, hi = _span(c.pin_range, part_inputs[c.pin])
+                    sub_ins[c.pin][lo:hi + 1] = self._source(signals, c, hi - lo + 1, where)
+                elif c.pin not in part_outputs:
+                    raise ValueError(f"{where}: {part.chip} has no pin {c.pin}")
+            index = seen.get(part.chip, 0)
+            seen[part.chip] = index + 1
+            name = part.chip if counts[part.chip] == 1 else f"{part.chip}#{index}"
+            sub_outs = self._instance(part.chip, sub_ins, prefix + name)
+            for c in part.connections:
+                if c.pin in part_outputs:
+                    lo, hi = _span(c.pin_range, part_outputs[c.pin])
+                    if c.signal in ins or c.signal in ("true", "false"):
+                        raise ValueError(f"{where}: cannot drive input {c.signal}")
+                    target = signals[c.signal]
+                    slo, shi = _span(c.signal_range, len(target))
+                    if shi - slo != hi - lo:
+                        raise ValueError(f"{where}: width mismatch on {c.pin}={c.signal}")
+                    for signal_net, driver in zip(target[slo:shi + 1], sub_outs[c.pin][lo:hi + 1]):
+                        self._union(signal_net, driver, where)
+        return outs
+
+    def _source(self, signals, c, width, where):
+        if c.signal in ("true", "false"):
+            return [NET_TRUE if c.signal == "true" else NET_FALSE] * width
+        if c.signal not in signals:
+            raise ValueError(f"{where}: unknown signal {c.signal}")
+        nets = signals[c.signal]
+        lo, hi = _span(c.signal_range, len(nets))
+        if c.signal_range is None and len(nets) != width:
+            raise ValueError(f"{where}: width mismatch on {c.pin}={c.signal}")
+        if hi - lo + 1 != width:
+            raise ValueError(f"{where}: width mismatch on {c.pin}={c.signal}")
+        return nets[lo:hi + 1]
+
+    def _canonicalize(self):
+        find = self._find
+        nodes = []
+        for node in self.nodes:
+            if node[0] == "nand":
+                nodes.append(("nand", find(node[1]), find(node[2]), find(node[3])))
+            else:
+                b = node[1]
+                b.ins = {pin: [find(n) for n in nets] for pin, nets in b.ins.items()}
+                b.outs = {pin: [find(n) for n in nets] for pin, nets in b.outs.items()}
+                nodes.append(node)
+        self.nodes = nodes
+        self.dffs = [(find(i), find(o)) for i, o in self.dffs]
+        self.inputs = {pin: [find(n) for n in nets] for pin, nets in self.inputs.items()}
+        self.outputs = {pin: [find(n) for n in nets] for pin, nets in self.outputs.items()}
+        self.signals = {name: [find(n) for n in nets] for name, nets in self.signals.items()}
+        self.net_count = len(self.parent)
+
+    def levelize(self, needed):
+        """Topological order of the combinational nodes that needed nets depend on.
+
+        Returns (order, inputs_of, driver): node indices (builtins always
+        included), the combinational input nets of each, and net -> index
+        of the node driving it. Ties go to creation order, which keeps
+        the gates of one chip instance together.
+        """
+        nodes = self.nodes
+        # Drop gates nothing reads, walking back from the needed nets
+        driver = {}
+        for index, node in enumerate(nodes):
+            if node[0] == "nand":
+                driver[node[3]] = index
+            else:
+                for nets in node[1].outs.values():
+                    for net in nets:
+                        driver[net] = index
+        live = set()
+        stack = [driver[net] for net in needed if net in driver]
+        while stack:
+            index = stack.pop()
+            if index in live:
+                continue
+            live.add(index)
+            node = nodes[index]
+            if node[0] == "nand":
+                for net in node[1:3]:
+                    if net in driver:
+                        stack.append(driver[net])
+            else:
+                for pin in node[1].model.comb_inputs:
+                    for net in node[1].ins[pin]:
+                        if net in driver:
+                            stack.append(driver[net])
+        # Builtins are always live (their state is visible)
+        live.update(index for index, node in enumerate(nodes) if node[0] == "builtin")
+
+        # Topological order, preferring creation order so chunks stay local
+        inputs_of = {}
+        for index in live:
+            node = nodes[index]
+            if node[0] == "nand":
+                inputs_of[index] = (node[1], node[2])
+            else:
+                inputs_of[index] = [net for pin in node[1].model.comb_inputs for net in node[1].ins[pin]]
+        users = {}
+        pending = {}
+        for index, nets in inputs_of.items():
+            deps = {driver[net] for net in nets if net in driver}
+            pending[index] = len(deps)
+            for dep in deps:
+                users.setdefault(dep, []).append(index)
+        ready = [index for index, count in pending.items() if count == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            index = heapq.heappop(ready)
+            order.append(index)
+            for user in users.get(index, ()):
+                pending[user] -= 1
+                if pending[user] == 0:
+                    heapq.heappush(ready, user)
+        if len(order) != len(live):
+            raise ValueError(f"{self.top}: combinational loop")
+
+        return order, inputs_of, driver
+
+    def builtins(self, chip=None):
+        """Return the BuiltinNodes (of one chip type)"""
+        return [node[1] for node in self.nodes
+                if node[0] == "builtin" and (chip is None or node[1].chip == chip)]
+
+    def stats(self):
+        """Return {"nands", "dffs", "builtins", "nets"} of the flattened netlist"""
+        nands = sum(1 for node in self.nodes if node[0] == "nand")
+        return {"nands": nands, "dffs": len(self.dffs),
+                "builtins": len(self.nodes) - nands, "nets": self.net_count}
+
+class GateSim:
+    """Event-driven simulation of a Netlist with compiled gate chunks.
+
+    watch names internal signals ("CPU.ALU.zr") that get() must be able to
+    read; top-level pins, DFF and builtin outputs are always readable.
+    """
+
+    def __init__(self, netlist, watch=(), chunk_gates=CHUNK_GATES):
+        self.netlist = netlist
+        self.chunk_gates = chunk_gates
+        observed = set()
+        for nets in list(netlist.inputs.values()) + list(netlist.outputs.values()):
+            observed.update(nets)
+        for name in watch:
+            observed.update(self._signal(name))
+        self.observed = observed
+        self._build()
+        self.reset()
+
+    def _signal(self, name):
+        if name in self.netlist.inputs:
+            return self.netlist.inputs[name]
+        if name in self.netlist.outputs:
+            return self.netlist.outputs[name]
+        if name not in self.netlist.signals:
+            raise KeyError(f"no signal {name} in {self.netlist.top}")
+        return self.netlist.signals[name]
+
+    def _build(self):
+        netlist = self.netlist
+        nodes = netlist.nodes
+        dff_inputs = {i for i, _ in netlist.dffs}
+        # Nets something outside the combinational logic needs
+        needed = set(self.observed) | dff_inputs
+        for node in nodes:
+            if node[0] == "builtin":
+                for nets in node[1].ins.values():
+                    needed.update(nets)
+
+        order, inputs_of, driver = netlist.levelize(needed)
+
+        # Cut into chunks: runs of gates, and one chunk per builtin
+        chunks = []
+        current = []
+        for index in order:
+            if nodes[index][0] == "nand":
+                current.append(index)
+                if len(current) >= self.chunk_gates:
+                    chunks.append(current)
+                    current = []
+            else:
+                if current:
+                    chunks.append(current)
+                    current = []
+                chunks.append([index])
+        if current:
+            chunks.append(current)
+        chunk_of = {}
+        for number, chunk in enumerate(chunks):
+            for index in chunk:
+                chunk_of[index] = number
+
+        # Which chunks (by combinational input) and DFFs read each net
+        readers = {}
+        for index in order:
+            for net in inputs_of[index]:
+                if net in driver and chunk_of[driver[net]] == chunk_of[index]:
+                    continue
+                readers.setdefault(net, set()).add(chunk_of[index])
+        self.readers = {net: sorted(chunks) for net, chunks in readers.items()}
+        self.dff_readers = {}
+        for k, (net, _) in enumerate(netlist.dffs):
+            self.dff_readers.setdefault(net, []).append(k)
+        exported = needed | set(readers)
+        self.readable = exported | {out for _, out in netlist.dffs}
+        for node in netlist.builtins():
+            for nets in node.outs.values():
+                self.readable.update(nets)
+
+        functions = [None] * len(chunks)
+        self.driven = []
+        source = []
+        for number, chunk in enumerate(chunks):
+            node = nodes[chunk[0]]
+            if node[0] == "builtin":
+                node[1].pack = _packer(node[1].ins)
+                functions[number] = self._builtin_function(node[1])
+            else:
+                source.append(self._chunk_source(number, [nodes[i] for i in chunk], exported))
+        namespace = {}
+        exec(compile("\n".join(source), f"<{netlist.top} netlist>", "exec"), namespace)
+        for number in range(len(chunks)):
+            if functions[number] is None:
+                functions[number] = namespace[f"chunk_{number}"]
+        self.functions = functions
+        self.chunk_count = len(chunks)
+        self.gate_count = sum(1 for index in order if nodes[index][0] == "nand")
+        self.builtin_chunks = {node[1]: chunk_of[index] for index, node in enumerate(nodes)
+                               if node[0] == "builtin"}
+        self.clocked = [(node, chunk) for node, chunk in self.builtin_chunks.items()
+                        if node.model.clocked]
+
+    def _marks(self, net):
+        # Statements run when exported net changes
+        marks = []
+        chunks = self.readers.get(net)
+        if chunks:
+            marks.append(" = ".join(f"d[{c}]" for c in chunks) + " = 1")
+        for k in self.dff_readers.get(net, ()):
+            marks.append(f"q({k})")
+        return marks
+
+    def _chunk_source(self, number, gates, exported):
+        def ref(net):
+            if net == NET_FALSE:
+                return "0"
+            if net == NET_TRUE:
+                return "1"
+            return f"n{net}"
+        produced = {gate[3] for gate in gates}
+        lines = [f"def chunk_{number}(v, d, q):"]
+        loaded = set()
+        for _, a, b, _ in gates:
+            for net in (a, b):
+                if net > NET_TRUE and net not in produced and net not in loaded:
+                    lines.append(f"    n{net} = v[{net}]")
+                    loaded.add(net)
+        for _, a, b, out in gates:
+            if a == b:
+                lines.append(f"    n{out} = 1 ^ {ref(a)}")
+            else:
+                lines.append(f"    n{out} = 1 ^ ({ref(a)} & {ref(b)})")
+        for _, _, _, out in gates:
+            if out in exported:
+                lines.append(f"    if v[{out}] != n{out}:")
+                lines.append(f"        v[{out}] = n{out}")
+                for mark in self._marks(out):
+                    lines.append(f"        {mark}")
+        return "\n".join(lines)
+
+    def _builtin_function(self, node):
+        # Pack input pins, evaluate the model, unpack changed outputs
+        model = node.model
+        pack = node.pack
+        outs = [(pin, [(net, self.readers.get(net, ()), self.dff_readers.get(net, ()))
+                       for net in nets])
+                for pin, nets in node.outs.items()]
+        # Output values last driven; reset() sets them back to 0 with the nets
+        last = {pin: 0 for pin in node.outs}
+        self.driven.append(last)
+
+        def evaluate(v, d, q):
+            values = model.evaluate(pack(v))
+            for pin, bits in outs:
+                value = values[pin]
+                changed = value ^ last[pin]
+                if not changed:
+                    continue
+                last[pin] = value
+                for i, (net, chunks, dffs) in enumerate(bits):
+                    if changed >> i & 1:
+                        v[net] = value >> i & 1
+                        for chunk in chunks:
+                            d[chunk] = 1
+                        for k in dffs:
+                            q(k)
+        return evaluate
+
+    def reset(self):
+        """All nets and DFFs to 0, builtin state cleared, then settle"""
+        self.values = bytearray(self.netlist.net_count)
+        self.values[NET_TRUE] = 1
+        self.dirty = bytearray([1]) * self.chunk_count
+        self.pending_dffs = set()
+        for last in self.driven:
+            last.update(dict.fromkeys(last, 0))
+        for node in self.netlist.builtins():
+            node.model.reset()
+        self.cycles = 0
+        self.evaluations = 0
+        self.settle()
+
+    def touch(self, node):
+        """Re-evaluate a builtin whose state was changed from outside (e.g. ROM load)"""
+        self.dirty[self.builtin_chunks[node]] = 1
+
+    def _changed(self, net):
+        for chunk in self.readers.get(net, ()):
+            self.dirty[chunk] = 1
+        self.pending_dffs.update(self.dff_readers.get(net, ()))
+
+    def settle(self):
+        """Evaluate every dirty chunk, in order, until the circuit is stable"""
+        v, d, q, functions = self.values, self.dirty, self.pending_dffs.add, self.functions
+        evaluations = 0
+        i = d.find(1)
+        while i >= 0:
+            d[i] = 0
+            functions[i](v, d, q)
+            evaluations += 1
+            i = d.find(1, i + 1)
+        self.evaluations += evaluations
+
+    def set(self, pin, value):
+        """Set a top-level input pin (takes effect at the next settle)"""
+        v = self.values
+        for i, net in enumerate(self.netlist.inputs[pin]):
+            bit = (value >> i) & 1
+            if v[net] != bit:
+                v[net] = bit
+                self._changed(net)
+
+    def get(self, name):
+        """Value of a pin or signal after the last settle"""
+        nets = self._signal(name)
+        if any(net > NET_TRUE and net not in self.readable for net in nets):
+            raise KeyError(f"{name} is internal to a gate chunk; pass it in watch=")
+        v = self.values
+        return sum(v[net] << i for i, net in enumerate(nets))
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def __setitem__(self, pin, value):
+        self.set(pin, value)
+
+    def step(self):
+        """One clock cycle: settle, latch DFFs and clocked builtins, settle"""
+        self.settle()
+        v = self.values
+        dffs = self.netlist.dffs
+        latched = [(dffs[k][1], v[dffs[k][0]]) for k in self.pending_dffs]
+        self.pending_dffs.clear()
+        for node, chunk in self.clocked:
+            node.model.tick(node.pack(v))
+            self.dirty[chunk] = 1
+        for out, bit in latched:
+            if v[out] != bit:
+                v[out] = bit
+                self._changed(out)
+        self.settle()
+        self.cycles += 1
+
+    def run(self, cycles):
+        for _ in range(cycles):
+            self.step()
+
+def computer(program, library=None, builtin=(), substitute=("RAM16K",), watch=()):
+    """GateSim of Computer.hdl with program (path or words) in ROM32K.
+
+    The machine is in its power-on state: PC, registers and memory are 0,
+    as in a fresh HackCPU, and the first step() executes ROM[0]. (A clock
+    cycle with reset held would also execute ROM[0] and keep its writes.)
+
+    Chips in substitute run as builtins once cosim.verify() has checked
+    their models against the HDL (ValueError if one disagrees); chips in
+    builtin run as builtins without a check.
+    """
+    import cosim  # imports this module
+    if isinstance(program, str):
+        program = [encode_word(instr) for instr in load_program(program, default_cache())]
+    netlist = cosim.substitute("Computer", [chip for chip in substitute if chip not in builtin],
+                               library, builtin)
+    sim = GateSim(netlist, watch=("CPU.pc",) + tuple(watch))
+    rom = sim.netlist.builtins("ROM32K")[0]
+    rom.model.load(program)
+    sim.touch(rom)
+    sim.settle()
+    return sim
+
+def cross_check(sim, cpu, cycles):
+    """Run the gate-level Computer and a HackCPU in lock-step.
+
+    Compares PC, A and D after every cycle and, when RAM16K/Screen are
+    builtins, the data memory at the end. Returns (cycles run, first
+    mismatch message or None).
+    """
+    a_reg = sim.netlist.builtins("ARegister")
+    d_reg = sim.netlist.builtins("DRegister")
+    for n in range(1, cycles + 1):
+        if not cpu.step():
+            return n - 1, None
+        sim.step()
+        gate = (sim.get("CPU.pc"), a_reg[0].model.value if a_reg else cpu.A,
+                d_reg[0].model.value if d_reg else cpu.D)
+        if gate != (cpu.PC & 0x7FFF, cpu.A, cpu.D):
+            return n, (f"cycle {n}: gate PC/A/D {gate} != HackCPU {(cpu.PC, cpu.A, cpu.D)}")
+    for chip, base in (("RAM16K", 0), ("Screen", 16384)):
+        for node in sim.netlist.builtins(chip):
+            memory = node.model.memory
+            if list(memory) != list(cpu.RAM[base:base + len(memory)]):
+                first = next(i for i in range(len(memory)) if memory[i] != cpu.RAM[base + i])
+                return cycles, (f"RAM[{base + first}]: gate {memory[first]} != "
+                                f"HackCPU {cpu.RAM[base + first]}")
+    return cycles, None
+
+def main():
+    parser = argparse.ArgumentParser(description="Gate-level simulation of the HDL chips")
+    parser.add_argument("chip", help="chip name or .hdl file (e.g. ../project5/Computer.hdl)")
+    parser.add_argument("--builtin", action="append", default=[], metavar="CHIP",
+                        help="simulate CHIP with its builtin model, without a check (repeatable)")
+    parser.add_argument("--substitute", action="append", default=[], metavar="CHIP",
+                        help="like --builtin, after checking the model against CHIP's HDL by "
+                             "random co-simulation (cosim.py; results are cached; "
+                             "default for --rom: RAM16K)")
+    parser.add_argument("--rom", metavar="PROGRAM",
+                        help="run Computer with this .hack/.hackb/.asm program in ROM32K")
+    parser.add_argument("--cycles", type=int, default=100000, help="clock cycles (default: 100000)")
+    parser.add_argument("--check", action="store_true",
+                        help="run hack_cpu.HackCPU in lock-step and compare PC, A, D and RAM")
+    args = parser.parse_args()
+
+    name = os.path.splitext(os.path.basename(args.chip))[0]
+    library = HDLLibrary()
+    if args.chip.endswith(".hdl"):
+        library.search_path.insert(0, os.path.dirname(os.path.abspath(args.chip)))
+    builtin = tuple(args.builtin)
+    substitute = list(args.substitute)
+    implied = args.rom is not None and "RAM16K" not in builtin + tuple(substitute)
+    if implied:
+        substitute.append("RAM16K")  # half a million gates at gate level
+    if substitute:
+        from cosim import describe_failure, verify
+        for chip in substitute:
+            result = verify(chip, library=library)
+            if result["failure"]:
+                reason = ("--rom runs RAM16K at word level only if its model matches the HDL"
+                          if implied and chip == "RAM16K" else f"--substitute {chip} failed")
+                raise SystemExit(f"{describe_failure(result)}\n{reason}; rerun with "
+                                 f"--builtin {chip} to use the model without this check")
+            print(f"{chip}: behavioral model verified ({result['cycles']} cycles x "
+                  f"{result['lanes']} lanes{', cached' if result['cached'] else ''})")
+    builtin += tuple(substitute)
+    if args.rom is None:
+        netlist = Netlist(name, library, builtin)
+        sim = GateSim(netlist)
+        stats = netlist.stats()
+        print(f"{name}: {stats['nands']} Nand, {stats['dffs']} DFF, {stats['builtins']} builtin, "
+              f"{stats['nets']} nets; {sim.gate_count} live gates in {sim.chunk_count} chunks")
+        return
+
+    start = time.perf_counter()
+    sim = computer(args.rom, library, builtin, substitute=())
+    build = time.perf_counter() - start
+    stats = sim.netlist.stats()
+    print(f"Computer: {stats['nands']} Nand, {stats['dffs']} DFF, {stats['builtins']} builtin; "
+          f"{sim.gate_count} live gates in {sim.chunk_count} chunks (built in {build:.2f}s)")
+    sim.evaluations = 0
+    if args.check:
+        from hack_cpu import HackCPU
+        cpu = HackCPU(args.rom)
+    start = time.perf_counter()
+    if args.check:
+        cycles, mismatch = cross_check(sim, cpu, args.cycles)
+    else:
+        sim.run(args.cycles)
+        cycles, mismatch = args.cycles, None
+    elapsed = time.perf_counter() - start
+    print(f"{cycles} cycles in {elapsed:.2f}s ({cycles / elapsed if elapsed else 0:.0f} cycles/s), "
+          f"{sim.evaluations / max(cycles, 1):.1f} of {sim.chunk_count} chunks evaluated per cycle")
+    print(f"PC={sim.get('CPU.pc')}")
+    if args.check:
+        unchecked = f" (unchecked builtins: {', '.join(args.builtin)})" if args.builtin else ""
+        print(f"Cross-check: {mismatch or 'gate level matches HackCPU'}{unchecked}")
+        if mismatch:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
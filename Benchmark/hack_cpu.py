@@ -1,156 +1,489 @@
 #!/usr/bin/env python3
 # hack_cpu.py
 # Hack CPU emulator (standard design)
-import sys
-
-def to_signed(val):
-    """Convert 16-bit unsigned to signed (two's complement)"""
-    if val & 0x8000:
-        return val - 0x10000
-    return val
-
-def to_unsigned(val):
-    """Convert signed to 16-bit unsigned"""
-    return val & 0xFFFF
-
-# Load hack binary file into a list of 16-bit instruction strings
-if len(sys.argv) < 2:
-    print("Usage: python3 hack_cpu.py <file.hack>")
-    sys.exit(1)
-
-with open(sys.argv[1]) as f:
-    instrs = [line.strip() for line in f if line.strip()]
-
-# Initialize registers and 32K memory
-A = 0
-D = 0
-PC = 0
-RAM = [0] * 32768
-instr_count = 0
-max_cycles = 10000000  # Safety limit to prevent infinite loops
-
-# Comp table: binary -> computation function
-def compute_alu(comp_bits, D, A, RAM):
-    """Compute ALU result based on comp bits"""
-    # Convert to signed for arithmetic operations
-    D_signed = to_signed(D)
-    A_signed = to_signed(A)
-    M_signed = to_signed(RAM[A])
-    
-    comp_map = {
-        "0101010": 0,                           # 0
-        "0111111": 1,                           # 1
-        "0111010": -1,                          # -1
-        "0001100": D_signed,                    # D
-        "0110000": A_signed,                    # A
-        "1110000": M_signed,                    # M
-        "0001101": ~D_signed,                   # !D
-        "0110001": ~A_signed,                   # !A
-        "1110001": ~M_signed,                   # !M
-        "0001111": -D_signed,                   # -D
-        "0110011": -A_signed,                   # -A
-        "1110011": -M_signed,                   # -M
-        "0011111": D_signed + 1,                # D+1
-        "0110111": A_signed + 1,                # A+1
-        "1110111": M_signed + 1,                # M+1
-        "0001110": D_signed - 1,                # D-1
-        "0110010": A_signed - 1,                # A-1
-        "1110010": M_signed - 1,                # M-1
-        "0000010": D_signed + A_signed,         # D+A
-        "1000010": D_signed + M_signed,         # D+M
-        "0010011": D_signed - A_signed,         # D-A
-        "1010011": D_signed - M_signed,         # D-M
-        "0000111": A_signed - D_signed,         # A-D
-        "1000111": M_signed - D_signed,         # M-D
-        "0000000": D_signed & A_signed,         # D&A
-        "1000000": D_signed & M_signed,         # D&M
-        "0010101": D_signed | A_signed,         # D|A
-        "1010101": D_signed | M_signed,         # D|M
-    }
-    
-    if comp_bits not in comp_map:
-        raise ValueError(f"Unknown comp bits: {comp_bits}")
-    
-    result = comp_map[comp_bits]
-    return to_unsigned(result)
-
-def should_jump(jump_bits, val):
-    """Determine if jump condition is met"""
-    if jump_bits == "000":  # null
-        return False
-    
-    val_signed = to_signed(val)
-    
-    if jump_bits == "001":  # JGT
-        return val_signed > 0
-    elif jump_bits == "010":  # JEQ
-        return val_signed == 0
-    elif jump_bits == "011":  # JGE
-        return val_signed >= 0
-    elif jump_bits == "100":  # JLT
-        return val_signed < 0
-    elif jump_bits == "101":  # JNE
-        return val_signed != 0
-    elif jump_bits == "110":  # JLE
-        return val_signed <= 0
-    elif jump_bits == "111":  # JMP
-        return True
-    
-    return False
-
-# Execute instructions until PC leaves program range
-pc_history = []
-
-while 0 <= PC < len(instrs) and instr_count < max_cycles:
-    # Detect halt: if PC cycles through same small set of addresses
-    if len(pc_history) > 20:
-        pc_history.pop(0)
-    pc_history.append(PC)
-    if len(pc_history) >= 20 and len(set(pc_history[-20:])) <= 2:
-        # Stuck in a loop of 1-2 instructions
-        break
-    instr = instrs[PC]
-    instr_count += 1
-    
-    if instr[0] == '0':
-        # A-instruction: set A = value
-        A = int(instr, 2)
-        PC += 1
+#
+# Usable as a script or as a library:
+#     cpu = HackCPU("MatMul_Full.hack", cost_models=[BaselineCostModel(), NMCCostModel()])
+#     cpu.run()
+#     cpu.cycle_costs()  # {"baseline": 5204.0, "nmc": 5145.2}
+import argparse
+import os
+
+import checkpoint
+from asmcache import default_cache
+from blocks import BlockCompiler
+from cost_models import COST_MODELS, BaselineCostModel, RuleCostModel
+from dataimage import read_image_arg
+from decode import OP_A, alu_status, load_program
+from hacktrace import NO_WRITE, TraceWriter
+from halt import HaltDetector
+from memhier import (KIND_SHIFT, LOG_CHUNK, NEAR, WRITE, MemoryHierarchy, access_kinds,
+                     image_regions, load_config)
+from memory import RAM
+from nmc import element_counts, is_nmc, kernel_table
+from profiler import profile_report
+
+MAX_CYCLES = 10000000  # Safety limit to prevent infinite loops
+
+# The interpreter loop, as a template. Plain, traced and memory-logged runs
+# differ only in what they do around each instruction, so each variant is
+# generated from this one source with its hooks filled in (like the blocks
+# of blocks.py) and compiled once at import time; the plain loop pays
+# nothing for the others' hooks.
+#     setup     once, before the loop (e.g. bind a buffer's append)
+#     after_a   after an A-instruction set A (PC still at it)
+#     before_c  before a C-instruction's kernel runs
+#     after_c   after a C-instruction wrote its destinations (old_A, val set)
+# The loop sees only its own locals, the names in _LOOP_NAMES and the names
+# a variant passes for its hooks.
+_LOOP_TEMPLATE = """\
+def {name}(self, limit):
+    program = self.program
+    size = len(program)
+    hits = self.hits
+    RAM = self.RAM
+    kernels = self._kernels
+    halt = self.halt
+    check_halt = halt.enabled
+    {setup}
+    A, D, PC = self.A, self.D, self.PC
+    mem_written = self._mem_written
+    executed = 0
+
+    while executed < limit and 0 <= PC < size:
+        op, operand, dest, jump = program[PC]
+        hits[PC] += 1
+        executed += 1
+
+        if op == OP_A:
+            # A-instruction: set A = value
+            A = operand
+            {after_a}
+            PC += 1
+        else:
+            {before_c}
+            # Compute ALU output
+            val = kernels[operand](D, A, RAM)
+
+            # Write destinations (in parallel - save old A for memory write)
+            old_A = A
+            if dest & 4:  # A register
+                A = val
+            if dest & 2:  # D register
+                D = val
+            if dest & 1:  # M (RAM[A])
+                RAM[old_A] = val
+                mem_written = True
+            {after_c}
+
+            # Compute next PC
+            if jump and jump & alu_status(val):
+                PC = A
+                if check_halt:
+                    if halt.on_jump(PC, D, mem_written):
+                        self.halted = True
+                        break
+                    mem_written = False
+            else:
+                PC += 1
+
+    self.A, self.D, self.PC = A, D, PC
+    self._mem_written = mem_written
+    self.instr_count += executed
+    return executed
+"""
+_LOOP_NAMES = {"OP_A": OP_A, "alu_status": alu_status}
+
+def _compile_loop(name, names=None, **hooks):
+    """Compile one interpreter loop variant from _LOOP_TEMPLATE.
+
+    hooks maps hook names to source lines, inserted at the hook's
+    indentation; missing hooks are left out. names maps the module-level
+    names the hooks use to their values.
+    """
+    unknown = set(hooks) - {"setup", "after_a", "before_c", "after_c"}
+    if unknown:
+        raise ValueError(f"unknown loop hooks: {sorted(unknown)}")
+    lines = []
+    for line in _LOOP_TEMPLATE.splitlines():
+        text = line.strip()
+        if text.startswith("{") and text.endswith("}") and text != "{name}":
+            depth = len(line) - len(line.lstrip())
+            lines += [" " * depth + code for code in hooks.get(text[1:-1], "").splitlines()]
+        else:
+            lines.append(line.replace("{name}", name))
+    source = "\n".join(lines) + "\n"
+    namespace = dict(_LOOP_NAMES, **(names or {}))
+    exec(compile(source, f"<HackCPU.{name}>", "exec"), namespace)
+    loop = namespace[name]
+    loop.source = source
+    return loop
+
+class HackCPU:
+    """Hack CPU emulator.
+
+    Executes a decoded program (see decode.py) and counts how often each PC
+    runs, so every attached cost model is evaluated from the same run.
+    Execution is resumable: run(n) and step() continue from the current state.
+    With a trace (hacktrace.TraceWriter) every instruction is recorded, and
+    with a memory model (memhier.MemoryHierarchy) every RAM access is logged
+    for it; each runs a separate interpreter loop, so plain runs pay nothing
+    for them. NMC instructions (nmc.py) run through the same kernel table
+    as the ALU and count the elements they process in nmc_elements.
+    """
+
+    def __init__(self, program=None, cost_models=None, halt_detect=True,
+                 blocks=False, max_cycles=MAX_CYCLES, trace=None, memory=None):
+        self.cost_models = list(cost_models) if cost_models is not None else [BaselineCostModel()]
+        self.halt_detect = halt_detect
+        self.blocks = blocks
+        self.max_cycles = max_cycles
+        self.trace = trace
+        self.memory = memory
+        self._access = (None, None)  # (near_memory, per-PC access kinds) for memory
+        self.program = []
+        self.nmc_elements = {}  # NMC comp code -> elements processed
+        self._kernels = kernel_table(self.program, self.nmc_elements)
+        self._has_nmc = False
+        self.data = []
+        self.RAM = RAM()
+        self.reset()
+        if program is not None:
+            self.load(program)
+
+    def load(self, program):
+        """Load a program from a .hack/.hackb/.asm path or a list of decoded instructions.
+
+        .asm sources go through the assembly cache only if it is enabled
+        (see asmcache.default_cache).
+        """
+        if isinstance(program, str):
+            program = load_program(program, default_cache())
+        self.program = list(program)
+        self._kernels = kernel_table(self.program, self.nmc_elements)
+        self._has_nmc = any(map(is_nmc, self.program))
+        self._compiler = BlockCompiler(self.program, self._kernels) if self.blocks else None
+        self._access = (None, None)
+        self._costs = [model.program_costs(self.program) for model in self.cost_models]
+        self._element_costs = [model.element_costs(self.program) for model in self.cost_models]
+        self.reset()
+
+    def reset(self):
+        """Reset registers, counters and RAM (in place); the loaded program is kept"""
+        self.A = 0
+        self.D = 0
+        self.PC = 0
+        self.RAM.clear()
+        for address, values in self.data:
+            self.RAM.load(address, values)
+        self.instr_count = 0
+        self.halted = False
+        self.hits = [0] * len(self.program)
+        self.nmc_elements.clear()
+        self._mem_written = False
+        self.halt = HaltDetector(self.program, static=self.halt_detect, repeat=self.halt_detect)
+
+    def preload(self, regions):
+        """Set the RAM data image: (address, values) regions written to RAM
+        now and after every reset() or load(), before execution starts.
+        Pass [] to stop preloading."""
+        self.data = list(regions)
+        for address, values in self.data:
+            self.RAM.load(address, values)
+
+    @property
+    def running(self):
+        """True while the program has neither halted nor left ROM"""
+        return not self.halted and 0 <= self.PC < len(self.program)
+
+    def state(self):
+        """Return the register state and counters as a dict"""
+        return {"A": self.A, "D": self.D, "PC": self.PC,
+                "instr_count": self.instr_count, "halted": self.halted}
+
+    def elements(self):
+        """Return the per-PC number of elements processed by NMC instructions"""
+        return element_counts(self.program, self.hits, self.nmc_elements)
+
+    def cycle_costs(self):
+        """Return {cost model name: weighted cycles} for everything executed so far"""
+        costs = {model.name: sum(h * c for h, c in zip(self.hits, costs) if h)
+                 for model, costs in zip(self.cost_models, self._costs)}
+        if self.nmc_elements:
+            elements = self.elements()
+            for model, element_costs in zip(self.cost_models, self._element_costs):
+                costs[model.name] += sum(e * c for e, c in zip(elements, element_costs) if e)
+        return costs
+
+    def step(self):
+        """Execute one instruction; returns False if nothing was executed"""
+        if not self.running or self.instr_count >= self.max_cycles:
+            return False
+        self._check_attachments(self.trace, self.memory)
+        if self.trace is not None:
+            return self._run_traced(1) == 1
+        if self.memory is not None:
+            return self._run_memory(1) == 1
+        return self._run_interpreted(1) == 1
+
+    def run(self, n=None):
+        """Execute up to n instructions (default: until halt or max_cycles).
+
+        Returns the number of instructions executed by this call.
+        """
+        limit = self.max_cycles - self.instr_count
+        if n is not None:
+            limit = min(limit, n)
+        if limit <= 0 or not self.running:
+            return 0
+        self._check_attachments(self.trace, self.memory)
+        if self.trace is not None:
+            return self._run_traced(limit)
+        if self.memory is not None:
+            return self._run_memory(limit)
+        if self._compiler is not None:
+            return self._run_blocks(limit)
+        return self._run_interpreted(limit)
+
+    def _check_attachments(self, trace, memory):
+        # Shared by run(), step() and run_from_args (before it creates the
+        # trace file), so all refuse the same combinations
+        if trace is not None and memory is not None:
+            raise ValueError("a trace and a memory model cannot be attached at the same time")
+        # A trace holds one memory write per instruction; COPY and VADD write
+        # up to D words, so their traces would silently miss element writes
+        if trace is not None and self._has_nmc:
+            raise ValueError("programs with NMC instructions cannot be traced")
+
+    # One instruction at a time (see _compile_loop)
+    _run_interpreted = _compile_loop("_run_interpreted")
+
+    def _run_traced(self, limit):
+        # Run in segments that fit the trace buffer, flushing between them
+        trace = self.trace
+        executed = 0
+        while executed < limit and self.running:
+            executed += self._run_trace_segment(min(limit - executed, trace.room()))
+            if not trace.room():
+                trace.flush()
+        return executed
+
+    # _run_interpreted, plus one (pc, A, D, mem_addr, mem_value) record per instruction
+    _run_trace_segment = _compile_loop(
+        "_run_trace_segment",
+        names={"NO_WRITE": NO_WRITE},
+        setup="record = self.trace.buffer.extend",
+        after_a="record((PC, A, D, NO_WRITE, 0))",
+        after_c="record((PC, A, D, old_A, val) if dest & 1 else (PC, A, D, NO_WRITE, 0))")
+
+    def _run_memory(self, limit):
+        # Run in segments of at most LOG_CHUNK accesses, feeding the model between them
+        memory = self.memory
+        if self._access[0] != memory.near_memory:
+            self._access = (memory.near_memory, access_kinds(self.program, memory.near_memory))
+        executed = 0
+        while executed < limit and self.running:
+            executed += self._run_memory_segment(min(limit - executed, LOG_CHUNK // 2))
+            memory.flush()
+        return executed
+
+    # _run_interpreted, plus address | kind << KIND_SHIFT per RAM access
+    # (at most two per instruction)
+    _run_memory_segment = _compile_loop(
+        "_run_memory_segment",
+        names={"KIND_SHIFT": KIND_SHIFT, "NEAR": NEAR, "WRITE": WRITE},
+        setup="""\
+access = self._access[1]
+log = self.memory.log.append
+write_bit, near_bit = WRITE << KIND_SHIFT, NEAR << KIND_SHIFT""",
+        before_c="""\
+kind = access[PC]
+if kind:
+    if kind == 4:
+        log(A | near_bit)
     else:
-        # C-instruction: decode
-        comp_bits = instr[3:10]
-        dest_bits = instr[10:13]
-        jump_bits = instr[13:16]
-        
-        # Compute ALU output
-        val = compute_alu(comp_bits, D, A, RAM)
-        
-        # Write destinations (in parallel - save old A for memory write)
-        old_A = A
-        if dest_bits[0] == '1':  # A register
-            A = val
-        if dest_bits[1] == '1':  # D register
-            D = val
-        if dest_bits[2] == '1':  # M (RAM[A])
-            RAM[old_A] = val
-        
-        # Compute next PC
-        if should_jump(jump_bits, val):
-            new_PC = A
-            # Detect halt: unconditional jump to self
-            if jump_bits == "111" and new_PC == PC:
-                break  # Halted
-            PC = new_PC
+        if kind & 1:
+            log(A)
+        if kind & 2:
+            log(A | write_bit)""")
+
+    def _run_blocks(self, limit):
+        compiler = self._compiler
+        cache = compiler.cache
+        size = len(self.program)
+        hits = self.hits
+        RAM = self.RAM
+        halt = self.halt
+        check_halt = halt.enabled
+        A, D, PC = self.A, self.D, self.PC
+        mem_written = self._mem_written
+        block_counts = {}
+        executed = 0
+
+        while executed < limit and 0 <= PC < size:
+            block = cache.get(PC) or compiler.block_at(PC)
+            if executed + block.length > limit:
+                # Would overrun the limit: run a truncated copy instead
+                block = compiler.compile(PC, limit - executed)
+                for pc in range(PC, PC + block.length):
+                    hits[pc] += 1
+            else:
+                block_counts[PC] = block_counts.get(PC, 0) + 1
+            PC, A, D, jumped = block.fn(A, D, RAM)
+            executed += block.length
+            if check_halt:
+                mem_written = mem_written or block.writes_mem
+                if jumped:
+                    if halt.on_jump(PC, D, mem_written):
+                        self.halted = True
+                        break
+                    mem_written = False
+
+        # Fold per-block counts into the per-PC hit counts
+        for start, count in block_counts.items():
+            for pc in range(start, start + cache[start].length):
+                hits[pc] += count
+
+        self.A, self.D, self.PC = A, D, PC
+        self._mem_written = mem_written
+        self.instr_count += executed
+        return executed
+
+def print_matrix_result(RAM, prefix=""):
+    """Print the 4x4 MatMul result matrix if RAM looks like a MatMul run"""
+    if RAM[65] != 0 or RAM[48] != 0:  # Check if this looks like MatMul
+        print(f"{prefix}Matrix C result (RAM[48..63]):")
+        for i in range(4):
+            row = list(RAM[48 + i*4 : 48 + i*4 + 4])
+            print(f"  Row {i}: {row}")
+
+def run_from_args(cpu, args):
+    """Run cpu as the command line asks: resume, stop at --until, checkpoint, trace,
+    memory model"""
+    if args.memory or args.memory_config:
+        config = load_config(args.memory_config) if args.memory_config else {}
+        if "regions" not in config and cpu.data:
+            config["regions"] = image_regions(cpu.data)  # the image's layout, not 4x4 MatMul
+        cpu.memory = MemoryHierarchy(config)
+    if args.resume:
+        if os.path.isdir(args.resume):
+            count = checkpoint.resume(cpu, args.resume, args.until)
         else:
-            PC += 1
+            checkpoint.load(cpu, args.resume)
+            count = cpu.instr_count
+        if count is None:
+            print(f"No checkpoint in {args.resume}; starting from the beginning")
+        else:
+            print(f"Resumed at instruction {count} from {args.resume}")
+    n = None if args.until is None else max(0, args.until - cpu.instr_count)
+
+    if args.trace:
+        try:
+            cpu._check_attachments(args.trace, cpu.memory)
+        except ValueError as e:
+            raise SystemExit(f"--trace: {e}")
+    trace = TraceWriter(args.trace, compress=not args.trace_raw) if args.trace else None
+    cpu.trace = trace
+    try:
+        if args.checkpoint_dir:
+            checkpoint.run_with_checkpoints(cpu, args.checkpoint_dir, args.checkpoint_every, n)
+        else:
+            cpu.run(n)
+    finally:
+        cpu.trace = None
+        if trace is not None:
+            trace.close()
+    if trace is not None:
+        print(f"Trace: {trace.count} records written to {args.trace}")
+    if cpu.running and cpu.instr_count >= cpu.max_cycles:
+        print(f"Stopped at max_cycles ({cpu.max_cycles}); resume from a checkpoint "
+              f"with a higher --max-cycles to continue")
+
+def make_parser(description):
+    """Command-line options shared by hack_cpu.py and hack_cpu_nmc.py"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("hack_file", help="program to run (.hack text, packed .hackb or .asm)")
+    parser.add_argument("--cache", action="store_true",
+                        help="assemble .asm programs through the on-disk assembly cache "
+                             "(also on when $HACK_ASM_CACHE is set)")
+    parser.add_argument("--no-halt-detect", action="store_true",
+                        help="run until the PC leaves the program or max_cycles is hit")
+    parser.add_argument("--blocks", action="store_true",
+                        help="execute compiled basic blocks instead of single instructions")
+    parser.add_argument("--cost-model", action="append", default=[], choices=sorted(COST_MODELS),
+                        help="also report weighted cycles under this cost model (repeatable)")
+    parser.add_argument("--cost-rules", metavar="FILE",
+                        help="also report weighted cycles under the pattern rules in FILE "
+                             "(see nmc_rules.json), with a per-rule breakdown")
+    parser.add_argument("--data", action="append", default=[], metavar="IMAGE",
+                        help="preload RAM from a data image (.ram text, or raw file.bin[@addr])")
+    parser.add_argument("--max-cycles", type=int, default=MAX_CYCLES, metavar="N",
+                        help=f"stop after N instructions in total (default: {MAX_CYCLES})")
+    parser.add_argument("--until", type=int, metavar="N",
+                        help="stop when the instruction count reaches N")
+    parser.add_argument("--checkpoint-dir", metavar="DIR",
+                        help="write checkpoints (<instr_count>.hckp) here during the run")
+    parser.add_argument("--checkpoint-every", type=int, default=1000000, metavar="N",
+                        help="instructions between checkpoints (default: 1000000)")
+    parser.add_argument("--resume", metavar="PATH",
+                        help="resume from a checkpoint file, or the latest one in a directory "
+                             "(at or before --until)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="record every instruction to a binary trace (see hacktrace.py)")
+    parser.add_argument("--trace-raw", action="store_true",
+                        help="write the trace uncompressed")
+    parser.add_argument("--memory", action="store_true",
+                        help="simulate a cache and banked near-memory and report traffic per "
+                             "region (see memhier.py)")
+    parser.add_argument("--memory-config", metavar="FILE",
+                        help="JSON memory-hierarchy parameters (implies --memory)")
+    parser.add_argument("--profile", action="store_true",
+                        help="print a flat profile, per-label costs and hot loops after the run")
+    parser.add_argument("--profile-top", type=int, default=15, metavar="N",
+                        help="rows in the flat profile and hot-loop report (default: 15)")
+    parser.add_argument("--source", metavar="FILE",
+                        help="source map (.map.json) or assembly source for --profile "
+                             "(default: Xxx.map.json, then Xxx.asm next to the program)")
+    return parser
+
+def rule_reports(cpu):
+    """Per-rule cost tables of every RuleCostModel attached to cpu"""
+    elements = cpu.elements() if cpu.nmc_elements else None
+    return [model.report(cpu.program, cpu.hits, elements) for model in cpu.cost_models
+            if isinstance(model, RuleCostModel)]
+
+def main():
+    args = make_parser("Run a .hack program on the standard Hack CPU").parse_args()
+    default_cache(args.cache or None)
+    models = [BaselineCostModel()] + [COST_MODELS[name]() for name in args.cost_model
+                                      if name != BaselineCostModel.name]
+    if args.cost_rules:
+        models.append(RuleCostModel(args.cost_rules))
+    cpu = HackCPU(args.hack_file, cost_models=models, halt_detect=not args.no_halt_detect,
+                  blocks=args.blocks, max_cycles=args.max_cycles)
+    for image in args.data:
+        cpu.preload(cpu.data + read_image_arg(image))
+    run_from_args(cpu, args)
+
+    # Print final state and instruction count for benchmarking
+    print(f"Final A={cpu.A}, D={cpu.D}, PC={cpu.PC}, RAM[0..5]={cpu.RAM.dump(0, 6)}")
+    print(f"Instructions executed: {cpu.instr_count}")
+    for name, cost in cpu.cycle_costs().items():
+        if name != BaselineCostModel.name:
+            print(f"Weighted cycles ({name}): {cost:.2f}")
+
+    # Print some key memory locations for matrix multiplication
+    print_matrix_result(cpu.RAM)
+    if cpu.memory is not None:
+        print()
+        print(cpu.memory.report())
+    for report in rule_reports(cpu):
+        print()
+        print(report)
 
-# Print final state and instruction count for benchmarking
-print(f"Final A={A}, D={D}, PC={PC}, RAM[0..5]={RAM[:6]}")
-print(f"Instructions executed: {instr_count}")
+    if args.profile:
+        print()
+        print(profile_report(cpu, args.hack_file, args.source, args.profile_top))
 
-# Print some key memory locations for matrix multiplication
-if RAM[65] != 0 or RAM[48] != 0:  # Check if this looks like MatMul
-    print(f"Matrix C result (RAM[48..63]):")
-    for i in range(4):
-        row = RAM[48 + i*4 : 48 + i*4 + 4]
-        print(f"  Row {i}: {row}")
+if __name__ == "__main__":
+    main()
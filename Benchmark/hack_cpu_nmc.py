@@ -1,184 +1,79 @@
 #!/usr/bin/env python3
 # hack_cpu_nmc.py
 # Hack CPU emulator with NMC extension (Near-Memory Computing)
-# This version estimates cycle costs with acceleration for certain memory operations
-import sys
+# This version estimates cycle costs with acceleration for certain memory operations;
+# the emulator itself is HackCPU from hack_cpu.py, run with the NMC cost model.
+#
+# Programs may use the NMC instructions of nmc.py (MAC, COPY, VADD). The
+# speedup of such a program is only meaningful against a plain Hack
+# version of it, named with --baseline and run on the same data:
+#     python3 hack_cpu_nmc.py --data MatMul4.ram --baseline MatMul.asm MatMul_NMC.asm
+from asmcache import default_cache
+from cost_models import COST_MODELS, BaselineCostModel, NMCCostModel, RuleCostModel
+from dataimage import read_image_arg
+from hack_cpu import HackCPU, make_parser, print_matrix_result, rule_reports, run_from_args
+from nmc import is_nmc
+from profiler import profile_report
 
-def to_signed(val):
-    """Convert 16-bit unsigned to signed (two's complement)"""
-    if val & 0x8000:
-        return val - 0x10000
-    return val
+def baseline_cycles(program, args):
+    """Baseline cycles of a plain Hack program run on the same data"""
+    cpu = HackCPU(program, cost_models=[BaselineCostModel()], halt_detect=not args.no_halt_detect,
+                  blocks=args.blocks, max_cycles=args.max_cycles)
+    for image in args.data:
+        cpu.preload(cpu.data + read_image_arg(image))
+    cpu.run()
+    if any(map(is_nmc, cpu.program)):
+        raise SystemExit(f"--baseline {program} uses NMC instructions")
+    return cpu.cycle_costs()[BaselineCostModel.name]
 
-def to_unsigned(val):
-    """Convert signed to 16-bit unsigned"""
-    return val & 0xFFFF
+def main():
+    parser = make_parser("Run a .hack program on the NMC-augmented Hack CPU")
+    parser.add_argument("--baseline", metavar="PROGRAM",
+                        help="report the speedup over this plain Hack program (same --data) "
+                             "instead of over the program itself")
+    args = parser.parse_args()
+    default_cache(args.cache or None)
+    models = [NMCCostModel(), BaselineCostModel()] + [
+        COST_MODELS[name]() for name in args.cost_model
+        if name not in (NMCCostModel.name, BaselineCostModel.name)]
+    if args.cost_rules:
+        models.append(RuleCostModel(args.cost_rules))
+    cpu = HackCPU(args.hack_file, cost_models=models, halt_detect=not args.no_halt_detect,
+                  blocks=args.blocks, max_cycles=args.max_cycles)
+    for image in args.data:
+        cpu.preload(cpu.data + read_image_arg(image))
+    run_from_args(cpu, args)
+    costs = cpu.cycle_costs()
+    cycle_cost = costs[NMCCostModel.name]
 
-# Load hack binary file
-if len(sys.argv) < 2:
-    print("Usage: python3 hack_cpu_nmc.py <file.hack>")
-    sys.exit(1)
-
-with open(sys.argv[1]) as f:
-    instrs = [line.strip() for line in f if line.strip()]
-
-# Initialize registers and 32K memory
-A = 0
-D = 0
-PC = 0
-RAM = [0] * 32768
-instr_count = 0
-cycle_cost = 0.0
-max_cycles = 10000000
-
-# Comp table
-def compute_alu(comp_bits, D, A, RAM):
-    """Compute ALU result based on comp bits"""
-    D_signed = to_signed(D)
-    A_signed = to_signed(A)
-    M_signed = to_signed(RAM[A])
-    
-    comp_map = {
-        "0101010": 0,                           # 0
-        "0111111": 1,                           # 1
-        "0111010": -1,                          # -1
-        "0001100": D_signed,                    # D
-        "0110000": A_signed,                    # A
-        "1110000": M_signed,                    # M
-        "0001101": ~D_signed,                   # !D
-        "0110001": ~A_signed,                   # !A
-        "1110001": ~M_signed,                   # !M
-        "0001111": -D_signed,                   # -D
-        "0110011": -A_signed,                   # -A
-        "1110011": -M_signed,                   # -M
-        "0011111": D_signed + 1,                # D+1
-        "0110111": A_signed + 1,                # A+1
-        "1110111": M_signed + 1,                # M+1
-        "0001110": D_signed - 1,                # D-1
-        "0110010": A_signed - 1,                # A-1
-        "1110010": M_signed - 1,                # M-1
-        "0000010": D_signed + A_signed,         # D+A
-        "1000010": D_signed + M_signed,         # D+M
-        "0010011": D_signed - A_signed,         # D-A
-        "1010011": D_signed - M_signed,         # D-M
-        "0000111": A_signed - D_signed,         # A-D
-        "1000111": M_signed - D_signed,         # M-D
-        "0000000": D_signed & A_signed,         # D&A
-        "1000000": D_signed & M_signed,         # D&M
-        "0010101": D_signed | A_signed,         # D|A
-        "1010101": D_signed | M_signed,         # D|M
-    }
-    
-    if comp_bits not in comp_map:
-        raise ValueError(f"Unknown comp bits: {comp_bits}")
-    
-    result = comp_map[comp_bits]
-    return to_unsigned(result)
-
-def should_jump(jump_bits, val):
-    """Determine if jump condition is met"""
-    if jump_bits == "000":
-        return False
-    
-    val_signed = to_signed(val)
-    
-    if jump_bits == "001":  # JGT
-        return val_signed > 0
-    elif jump_bits == "010":  # JEQ
-        return val_signed == 0
-    elif jump_bits == "011":  # JGE
-        return val_signed >= 0
-    elif jump_bits == "100":  # JLT
-        return val_signed < 0
-    elif jump_bits == "101":  # JNE
-        return val_signed != 0
-    elif jump_bits == "110":  # JLE
-        return val_signed <= 0
-    elif jump_bits == "111":  # JMP
-        return True
-    
-    return False
-
-# NMC acceleration patterns
-# Pattern 1: D+M with M destination (read-modify-write on memory)
-ACCEL_COMP_D_PLUS_M = "1000010"  # D+M
-# Pattern 2: M+1 with M destination (increment memory)
-ACCEL_COMP_M_PLUS_1 = "1110111"  # M+1
-# Pattern 3: M-1 with M destination (decrement memory)
-ACCEL_COMP_M_MINUS_1 = "1110010"  # M-1
-
-# Execute instructions
-pc_history = []
-
-while 0 <= PC < len(instrs) and instr_count < max_cycles:
-    # Detect halt: if PC cycles through same small set of addresses
-    if len(pc_history) > 20:
-        pc_history.pop(0)
-    pc_history.append(PC)
-    if len(pc_history) >= 20 and len(set(pc_history[-20:])) <= 2:
-        # Stuck in a loop of 1-2 instructions
-        break
-    instr = instrs[PC]
-    instr_count += 1
-    
-    if instr[0] == '0':
-        # A-instruction: baseline cost
-        A = int(instr, 2)
-        cycle_cost += 1.0
-        PC += 1
+    # Print final state and metrics
+    print(f"(NMC-sim) Final A={cpu.A}, D={cpu.D}, PC={cpu.PC}, RAM[0..5]={cpu.RAM.dump(0, 6)}")
+    print(f"(NMC-sim) Instructions executed: {cpu.instr_count}")
+    print(f"(NMC-sim) Estimated weighted cycles: {cycle_cost:.2f}")
+    if args.baseline:
+        baseline = baseline_cycles(args.baseline, args)
+        print(f"(NMC-sim) Baseline cycles ({args.baseline}): {baseline:.2f}")
+        print(f"(NMC-sim) Speedup factor: {baseline / cycle_cost:.2f}x")
+    elif any(map(is_nmc, cpu.program)):
+        print("(NMC-sim) Speedup factor: n/a (program uses NMC instructions; see --baseline)")
     else:
-        # C-instruction: decode
-        comp_bits = instr[3:10]
-        dest_bits = instr[10:13]
-        jump_bits = instr[13:16]
-        
-        # Compute ALU output
-        val = compute_alu(comp_bits, D, A, RAM)
-        
-        # Determine cycle cost for this instruction
-        cost = 1.0  # baseline
-        
-        # NMC acceleration: operations that read and write memory can be accelerated
-        # because NMC performs computation near the memory
-        if dest_bits[2] == '1':  # Writing to M (memory)
-            if comp_bits in [ACCEL_COMP_D_PLUS_M, ACCEL_COMP_M_PLUS_1, ACCEL_COMP_M_MINUS_1]:
-                # These operations benefit from near-memory computing
-                # Reduced cost: 0.3 cycles instead of 1.0
-                cost = 0.3
-            elif comp_bits[0] == '1':  # Any M-based computation
-                # Other M operations get moderate speedup
-                cost = 0.5
-        
-        cycle_cost += cost
-        
-        # Write destinations (in parallel)
-        old_A = A
-        if dest_bits[0] == '1':  # A register
-            A = val
-        if dest_bits[1] == '1':  # D register
-            D = val
-        if dest_bits[2] == '1':  # M (RAM[A])
-            RAM[old_A] = val
-        
-        # Compute next PC
-        if should_jump(jump_bits, val):
-            new_PC = A
-            # Detect halt: unconditional jump to self
-            if jump_bits == "111" and new_PC == PC:
-                break  # Halted
-            PC = new_PC
-        else:
-            PC += 1
+        print(f"(NMC-sim) Speedup factor: {costs[BaselineCostModel.name] / cycle_cost:.2f}x")
+    for name, cost in costs.items():
+        if name not in (NMCCostModel.name, BaselineCostModel.name):
+            print(f"(NMC-sim) Weighted cycles ({name}): {cost:.2f}")
+
+    # Print matrix result if applicable
+    print_matrix_result(cpu.RAM, prefix="(NMC-sim) ")
+    if cpu.memory is not None:
+        print()
+        print(cpu.memory.report())
+    for report in rule_reports(cpu):
+        print()
+        print(report)
 
-# Print final state and metrics
-print(f"(NMC-sim) Final A={A}, D={D}, PC={PC}, RAM[0..5]={RAM[:6]}")
-print(f"(NMC-sim) Instructions executed: {instr_count}")
-print(f"(NMC-sim) Estimated weighted cycles: {cycle_cost:.2f}")
-print(f"(NMC-sim) Speedup factor: {instr_count / cycle_cost:.2f}x")
+    if args.profile:
+        print()
+        print(profile_report(cpu, args.hack_file, args.source, args.profile_top))
 
-# Print matrix result if applicable
-if RAM[65] != 0 or RAM[48] != 0:
-    print(f"(NMC-sim) Matrix C result (RAM[48..63]):")
-    for i in range(4):
-        row = RAM[48 + i*4 : 48 + i*4 + 4]
-        print(f"  Row {i}: {row}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# hackbin.py
+# Packed binary .hack format
+#
+# Layout (all little-endian):
+#     offset 0   4s   magic b"HACK"
+#     offset 4   u16  format version (1)
+#     offset 6   u16  flags (0, reserved)
+#     offset 8   u32  instruction count N
+#     offset 12  N x u16 instruction words
+# Text .hack files start with '0' or '1', so the magic tells the two apart.
+# Binary programs are conventionally named Xxx.hackb.
+import mmap
+import struct
+import sys
+from array import array
+
+MAGIC = b"HACK"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+BINARY_SUFFIX = ".hackb"
+
+def pack_header(count):
+    """Return the file header for a program of count instructions"""
+    return HEADER.pack(MAGIC, VERSION, 0, count)
+
+def pack(words):
+    """Return the packed binary image of a sequence of 16-bit words"""
+    body = array('H', words)
+    if sys.byteorder == 'big':
+        body.byteswap()
+    return pack_header(len(body)) + body.tobytes()
+
+def write_binary(path, words):
+    """Write 16-bit instruction words to a packed binary file"""
+    with open(path, 'wb') as f:
+        f.write(pack(words))
+
+def is_binary(path):
+    """True if path holds a packed binary program"""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def unpack(buffer):
+    """Return the instruction words of a packed binary image.
+
+    On little-endian hosts the result is a zero-copy memoryview of uint16
+    over buffer; otherwise an array('H') copy with bytes swapped.
+    """
+    magic, version, _, count = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError("not a packed binary .hack image")
+    if version != VERSION:
+        raise ValueError(f"unsupported binary .hack version {version}")
+    end = HEADER.size + 2 * count
+    if len(buffer) < end:
+        raise ValueError(f"truncated binary .hack image: expected {count} instructions")
+    body = memoryview(buffer)[HEADER.size:end]
+    if sys.byteorder == 'big':
+        words = array('H', body.tobytes())
+        words.byteswap()
+        return words
+    return body.cast('H')
+
+def read_words(path):
+    """Read the instruction words of a .hack file, text or packed binary"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
+            return [int(line, 2) for line in f.read().decode('ascii').split()]
+        return unpack(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
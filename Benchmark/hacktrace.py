@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# hacktrace.py
+# Compact binary execution traces
+#
+# One record per executed instruction, five little-endian uint16:
+#     pc, A, D, mem_addr, mem_value
+# with A and D as they are after the instruction and mem_addr = 0xFFFF when
+# the instruction wrote no memory. Each record has room for one memory
+# write, so HackCPU refuses to trace programs with NMC instructions (COPY
+# and VADD write up to D words). Records are buffered and written in
+# chunks of CHUNK records, each optionally zlib-compressed:
+#     header  4s magic b"HTRC", u16 version, u16 flags (1 = zlib), u32 chunk records
+#     chunk   u32 records, u32 payload bytes, payload
+#     index   u64 file offset of every chunk
+#     footer  u64 index offset, u32 chunk count, 4s magic b"HTRC"
+# The index lets the reader seek to any instruction by reading one chunk;
+# a trace whose writer never closed (no footer) is indexed by scanning the
+# chunk headers instead.
+#
+#     python3 hack_cpu.py --trace run.htrc MatMul.hack
+#     python3 hacktrace.py run.htrc --start 1000 --count 20
+import argparse
+import struct
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+
+MAGIC = b"HTRC"
+VERSION = 1
+FLAG_ZLIB = 1
+CHUNK = 65536  # records per chunk
+FIELDS = 5  # uint16 per record
+NO_WRITE = 0xFFFF
+
+HEADER = struct.Struct("<4sHHI")
+CHUNK_HEADER = struct.Struct("<II")
+FOOTER = struct.Struct("<QI4s")
+
+TraceRecord = namedtuple("TraceRecord", "pc A D mem_addr mem_value")
+
+class TraceWriter:
+    """Streaming trace writer.
+
+    The emulator appends FIELDS words per instruction to self.buffer (an
+    array('H')) and calls flush() once it holds CHUNK records.
+    """
+
+    def __init__(self, path, compress=True, chunk=CHUNK):
+        self.f = open(path, 'wb')
+        self.compress = compress
+        self.chunk = chunk
+        self.buffer = array('H')
+        self.limit = chunk * FIELDS  # buffer length that triggers flush()
+        self.offsets = []
+        self.count = 0
+        self.f.write(HEADER.pack(MAGIC, VERSION, FLAG_ZLIB if compress else 0, chunk))
+
+    def record(self, pc, A, D, mem_addr=NO_WRITE, mem_value=0):
+        """Append one record (the emulator writes self.buffer directly)"""
+        self.buffer.extend((pc, A, D, mem_addr, mem_value))
+        if len(self.buffer) >= self.limit:
+            self.flush()
+
+    def room(self):
+        """Records that fit in the buffer before the next flush()"""
+        return (self.limit - len(self.buffer)) // FIELDS
+
+    def flush(self, final=False):
+        """Write out every full chunk in the buffer; with final, the rest too"""
+        buf = self.buffer
+        end = len(buf) if final else len(buf) - len(buf) % self.limit
+        for start in range(0, end, self.limit):
+            self._write_chunk(buf[start:min(start + self.limit, end)])
+        self.buffer = buf[end:]
+
+    def _write_chunk(self, words):
+        if sys.byteorder == 'big':
+            words.byteswap()
+        payload = words.tobytes()
+        if self.compress:
+            payload = zlib.compress(payload, 1)
+        self.offsets.append(self.f.tell())
+        self.f.write(CHUNK_HEADER.pack(len(words) // FIELDS, len(payload)))
+        self.f.write(payload)
+        self.count += len(words) // FIELDS
+
+    def close(self):
+        """Flush, write the chunk index and footer, and close the file"""
+        if self.f.closed:
+            return
+        self.flush(final=True)
+        index_offset = self.f.tell()
+        self.f.write(struct.pack(f"<{len(self.offsets)}Q", *self.offsets))
+        self.f.write(FOOTER.pack(index_offset, len(self.offsets), MAGIC))
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class TraceReader:
+    """Random-access reader: len(), iteration, reader[i] and iter_from(i)"""
+
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        magic, version, flags, self.chunk = HEADER.unpack(self.f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("not a Hack trace file")
+        if version != VERSION:
+            raise ValueError(f"unsupported trace version {version}")
+        self.compressed = bool(flags & FLAG_ZLIB)
+        self.offsets, self.counts = self._read_index()
+        self.count = sum(self.counts)
+        self._cached = (None, None)  # (chunk number, words)
+
+    def _read_index(self):
+        self.f.seek(0, 2)
+        size = self.f.tell()
+        if size >= HEADER.size + FOOTER.size:
+            self.f.seek(size - FOOTER.size)
+            index_offset, chunks, magic = FOOTER.unpack(self.f.read(FOOTER.size))
+            if magic == MAGIC:
+                self.f.seek(index_offset)
+                offsets = list(struct.unpack(f"<{chunks}Q", self.f.read(8 * chunks)))
+                counts = []
+                for offset in offsets:
+                    self.f.seek(offset)
+                    counts.append(CHUNK_HEADER.unpack(self.f.read(CHUNK_HEADER.size))[0])
+                return offsets, counts
+        # No footer (writer did not close): scan the chunk headers
+        offsets, counts = [], []
+        offset = HEADER.size
+        while offset + CHUNK_HEADER.size <= size:
+            self.f.seek(offset)
+            records, nbytes = CHUNK_HEADER.unpack(self.f.read(CHUNK_HEADER.size))
+            if offset + CHUNK_HEADER.size + nbytes > size:
+                break  # truncated chunk
+            offsets.append(offset)
+            counts.append(records)
+            offset += CHUNK_HEADER.size + nbytes
+        return offsets, counts
+
+    def __len__(self):
+        return self.count
+
+    def chunk_words(self, n):
+        """Return chunk n as a flat array('H') of FIELDS words per record"""
+        if self._cached[0] == n:
+            return self._cached[1]
+        self.f.seek(self.offsets[n])
+        _, nbytes = CHUNK_HEADER.unpack(self.f.read(CHUNK_HEADER.size))
+        payload = self.f.read(nbytes)
+        if self.compressed:
+            payload = zlib.decompress(payload)
+        words = array('H', payload)
+        if sys.byteorder == 'big':
+            words.byteswap()
+        self._cached = (n, words)
+        return words
+
+    def _locate(self, index):
+        # Every chunk but the last holds self.chunk records
+        if not 0 <= index < self.count:
+            raise IndexError("trace index out of range")
+        return divmod(index, self.chunk)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        n, i = self._locate(index)
+        return self._record(self.chunk_words(n), i)
+
+    @staticmethod
+    def _record(words, i):
+        pc, A, D, mem_addr, mem_value = words[i * FIELDS:(i + 1) * FIELDS]
+        if mem_addr == NO_WRITE:
+            return TraceRecord(pc, A, D, None, None)
+        return TraceRecord(pc, A, D, mem_addr, mem_value)
+
+    def iter_from(self, start=0):
+        """Yield records from instruction index start to the end"""
+        if start >= self.count:
+            return
+        n, i = self._locate(start)
+        for chunk in range(n, len(self.offsets)):
+            words = self.chunk_words(chunk)
+            for j in range(i, len(words) // FIELDS):
+                yield self._record(words, j)
+            i = 0
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Print records from a Hack execution trace")
+    parser.add_argument("trace_file", help="trace written by hack_cpu.py --trace")
+    parser.add_argument("--start", type=int, default=0, help="first instruction index (default: 0)")
+    parser.add_argument("--count", type=int, default=20, help="records to print (default: 20)")
+    parser.add_argument("--writes", action="store_true", help="only print memory writes")
+    args = parser.parse_args()
+
+    with TraceReader(args.trace_file) as trace:
+        print(f"{args.trace_file}: {len(trace)} instructions in {len(trace.offsets)} chunks"
+              f"{' (zlib)' if trace.compressed else ''}")
+        print(f"{'index':>10} {'pc':>6} {'A':>6} {'D':>6}  write")
+        printed = 0
+        for index, r in enumerate(trace.iter_from(args.start), args.start):
+            if printed >= args.count:
+                break
+            if args.writes and r.mem_addr is None:
+                continue
+            write = f"RAM[{r.mem_addr}]={r.mem_value}" if r.mem_addr is not None else ""
+            print(f"{index:>10} {r.pc:>6} {r.A:>6} {r.D:>6}  {write}")
+            printed += 1
+
+if __name__ == "__main__":
+    main()
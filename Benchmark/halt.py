@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# halt.py
+# Halt detection for the Hack emulators
+#
+# Hack has no halt instruction; programs end by spinning in a loop such as
+#     (END)
+#     @END
+#     0;JMP
+# Detection runs only when a jump is taken, so straight-line code pays
+# nothing, and each check is constant time:
+#   - static: loops that can never be left are found once at decode time
+#     and matched against the jump target with a set lookup;
+#   - repeat: a taken jump that lands on the same PC with the same D as the
+#     previous taken jump, with no memory write in between, means the whole
+#     machine state has repeated, so the program can never make progress.
+# Neither check can fire on a loop that still changes D or memory, so
+# short counting loops like "(L) @L / D=D-1;JNE" run to completion.
+from decode import OP_A, OP_C
+
+def find_halt_loops(program):
+    """Return the set of PCs from which execution can never leave.
+
+    An unconditional jump that does not write A is a halt loop whenever it
+    is reached by a jump, since a taken jump always lands with A equal to
+    its target. An "@L / x;JMP" pair at L is one too.
+    """
+    halt_pcs = set()
+    for pc, (op, _, dest, jump) in enumerate(program):
+        if op == OP_C and jump == 7 and not dest & 4:
+            halt_pcs.add(pc)
+            if pc and program[pc - 1] == (OP_A, pc - 1, 0, 0):
+                halt_pcs.add(pc - 1)
+    return frozenset(halt_pcs)
+
+class HaltDetector:
+    """Decides, at each taken jump, whether the program has halted"""
+
+    def __init__(self, program, static=True, repeat=True):
+        self.halt_pcs = find_halt_loops(program) if static else frozenset()
+        self.repeat = repeat
+        self.enabled = static or repeat
+        self.last_jump = None
+
+    def on_jump(self, pc, D, mem_written):
+        """Called after a taken jump to pc; mem_written says whether RAM was
+        written since the previous taken jump. Returns True on halt."""
+        if pc in self.halt_pcs:
+            return True
+        if self.repeat:
+            state = (pc, D)
+            if state == self.last_jump and not mem_written:
+                return True
+            self.last_jump = state
+        return False
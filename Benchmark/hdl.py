@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# hdl.py
+# Parser for nand2tetris HDL chip definitions
+#
+# Reads the chips of project1..project5 into plain data:
+#     Chip(name, inputs, outputs, parts, builtin, clocked, path)
+# where inputs/outputs are [(pin, width)] and every part is
+#     Part(chip, connections, line)
+#     Connection(pin, pin_range, signal, signal_range)
+# with ranges as inclusive (lo, hi) bit ranges or None for the whole bus.
+# "true"/"false" are ordinary signal names here; gatesim.py gives them
+# their meaning. HDLLibrary finds Xxx.hdl on a search path (by default
+# every project* directory of the repository) and caches parsed chips.
+import os
+import re
+from collections import namedtuple
+
+Chip = namedtuple("Chip", "name inputs outputs parts builtin clocked path")
+Part = namedtuple("Part", "chip connections line")
+Connection = namedtuple("Connection", "pin pin_range signal signal_range")
+
+HDL_SUFFIX = ".hdl"
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TOKEN = re.compile(r"//[^\n]*|/\*.*?\*/|[A-Za-z_][A-Za-z0-9_]*|\d+|\.\.|[{}()\[\],;=:]|\S", re.S)
+
+def tokenize(text):
+    """Return [(token, line)] with comments removed"""
+    tokens = []
+    line = 1
+    pos = 0
+    for m in TOKEN.finditer(text):
+        line += text.count("\n", pos, m.start())
+        pos = m.start()
+        token = m.group()
+        if not token.startswith(("//", "/*")):
+            tokens.append((token, line))
+    return tokens
+
+class _Parser:
+    def __init__(self, text, path):
+        self.tokens = tokenize(text)
+        self.pos = 0
+        self.path = path
+
+    def error(self, message):
+        line = self.tokens[min(self.pos, len(self.tokens) - 1)][1] if self.tokens else 1
+        return ValueError(f"{self.path}:{line}: {message}")
+
+    def peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        if self.pos >= len(self.tokens):
+            raise self.error("unexpected end of file")
+        token = self.tokens[self.pos][0]
+        self.pos += 1
+        return token
+
+    def expect(self, expected):
+        token = self.next()
+        if token != expected:
+            self.pos -= 1
+            raise self.error(f"expected {expected!r}, got {token!r}")
+        return token
+
+    def name(self):
+        token = self.next()
+        if not (token[0].isalpha() or token[0] == "_"):
+            self.pos -= 1
+            raise self.error(f"expected a name, got {token!r}")
+        return token
+
+    def number(self):
+        token = self.next()
+        if not token.isdigit():
+            self.pos -= 1
+            raise self.error(f"expected a number, got {token!r}")
+        return int(token)
+
+    def sub(self):
+        # Optional [i] or [i..j]
+        if self.peek() != "[":
+            return None
+        self.next()
+        lo = hi = self.number()
+        if self.peek() == "..":
+            self.next()
+            hi = self.number()
+        self.expect("]")
+        if hi < lo:
+            raise self.error(f"bad bit range [{lo}..{hi}]")
+        return (lo, hi)
+
+    def pins(self):
+        pins = []
+        while self.peek() != ";":
+            name = self.name()
+            width = 1
+            if self.peek() == "[":
+                self.next()
+                width = self.number()
+                self.expect("]")
+            pins.append((name, width))
+            if self.peek() == ",":
+                self.next()
+        self.expect(";")
+        return pins
+
+    def part(self):
+        line = self.tokens[self.pos][1]
+        chip = self.name()
+        self.expect("(")
+        connections = []
+        while True:
+            pin = self.name()
+            pin_range = self.sub()
+            self.expect("=")
+            signal = self.name()
+            signal_range = self.sub()
+            connections.append(Connection(pin, pin_range, signal, signal_range))
+            if self.peek() != ",":
+                break
+            self.next()
+        self.expect(")")
+        self.expect(";")
+        return Part(chip, connections, line)
+
+    def chip(self):
+        self.expect("CHIP")
+        name = self.name()
+        self.expect("{")
+        inputs, outputs, parts, builtin, clocked = [], [], [], None, []
+        while True:
+            token = self.next()
+            if token == "IN":
+                inputs += self.pins()
+            elif token == "OUT":
+                outputs += self.pins()
+            elif token == "PARTS":
+                self.expect(":")
+                while self.peek() not in ("}", None):
+                    parts.append(self.part())
+            elif token == "BUILTIN":
+                builtin = self.name()
+                self.expect(";")
+            elif token == "CLOCKED":
+                clocked = [pin for pin, _ in self.pins()]
+            elif token == "}":
+                return Chip(name, inputs, outputs, parts, builtin, clocked, self.path)
+            else:
+                self.pos -= 1
+                raise self.error(f"unexpected {token!r}")
+
+def parse(text, path="<hdl>"):
+    """Parse one CHIP definition"""
+    return _Parser(text, path).chip()
+
+def parse_file(path):
+    with open(path) as f:
+        return parse(f.read(), path)
+
+def default_search_path():
+    """The repository's project* directories, in order"""
+    return sorted(os.path.join(REPO_ROOT, name) for name in os.listdir(REPO_ROOT)
+                  if name.startswith("project") and os.path.isdir(os.path.join(REPO_ROOT, name)))
+
+class HDLLibrary:
+    """Chip definitions found on a search path of directories"""
+
+    def __init__(self, search_path=None):
+        self.search_path = list(search_path) if search_path is not None else default_search_path()
+        self._chips = {}
+
+    def find(self, name):
+        """Return the path of name.hdl (first on the search path), or None"""
+        for directory in self.search_path:
+            path = os.path.join(directory, name + HDL_SUFFIX)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def chip(self, name):
+        """Return the parsed Chip, or None if there is no HDL file for it"""
+        if name not in self._chips:
+            path = self.find(name)
+            self._chips[name] = parse_file(path) if path else None
+        return self._chips[name]
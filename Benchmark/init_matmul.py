@@ -1,6 +1,278 @@
 #!/usr/bin/env python3
 # init_matmul.py
 # Initialize matrix data in RAM for testing MatMul
+#
+# Default: write MatMul_Full.asm, the 4x4 MatMul.asm preceded by assembly
+# that stores matrices A and B (4 instructions per element).
+#
+# --image: write the matrices as a RAM data image instead (see dataimage.py),
+# for any N, so initialization costs no instructions:
+#     python3 init_matmul.py --image -n 8 --kernel
+#     python3 assembler.py MatMul8.asm
+#     python3 hack_cpu.py --data MatMul8.ram MatMul8.hack
+#
+# --nmc also writes MatMul{N}_NMC.asm, the same product with one NMC MAC
+# instruction per element of C (see nmc.py); MatMul_NMC.asm is its N=4
+# output:
+#     python3 init_matmul.py --image -n 4 --nmc
+#     python3 hack_cpu_nmc.py --data MatMul4.ram --baseline MatMul.asm MatMul4_NMC.asm
+import argparse
+import random
+
+from dataimage import RAW_SUFFIX, write_image, write_raw
+
+BASE_A = 16  # Matrix A starts at RAM[16]; B and C follow it
+
+def matrix_bases(n):
+    """Return the RAM base addresses of matrices A, B and C for N x N"""
+    return BASE_A, BASE_A + n * n, BASE_A + 2 * n * n
+
+def default_matrices(n, seed=None):
+    """Return (A, B): identity and 1..N*N, or small random values if seeded"""
+    if seed is not None:
+        rng = random.Random(seed)
+        A = [[rng.randrange(10) for _ in range(n)] for _ in range(n)]
+        B = [[rng.randrange(10) for _ in range(n)] for _ in range(n)]
+        return A, B
+    A = [[int(i == j) for j in range(n)] for i in range(n)]
+    B = [[i * n + j + 1 for j in range(n)] for i in range(n)]
+    return A, B
+
+def matmul(A, B):
+    """Reference result, 16-bit like the Hack CPU"""
+    n = len(A)
+    return [[sum(A[i][k] * B[k][j] for k in range(n)) & 0xFFFF for j in range(n)]
+            for i in range(n)]
+
+def create_matmul_image(A, B):
+    """Return the data-image regions (and comments) for matrices A and B"""
+    base_a, base_b, _ = matrix_bases(len(A))
+    regions = [(base_a, [v for row in A for v in row]),
+               (base_b, [v for row in B for v in row])]
+    comments = [f"Matrix A at RAM[{base_a}..{base_b - 1}]",
+                f"Matrix B at RAM[{base_b}..{base_b + len(B) ** 2 - 1}]"]
+    return regions, comments
+
+def create_matmul_kernel(n):
+    """Create an N x N matrix multiplication program for the image layout.
+
+    Same algorithm as MatMul.asm (multiplication by repeated addition), with
+    loop variables in R5..R14 so any N fits: i, i*N, j, sum, k, k*N,
+    A_val, B_val, count, addrC. For N=4 the matrices sit where MatMul.asm
+    expects them.
+    """
+    base_a, base_b, base_c = matrix_bases(n)
+    if base_c + n * n > 16384:
+        raise ValueError(f"{n}x{n} matrices do not fit below SCREEN")
+    return f"""// {n}x{n} MATRIX MULTIPLICATION (generated by init_matmul.py)
+// A: RAM[{base_a}..{base_b - 1}]
+// B: RAM[{base_b}..{base_c - 1}]
+// C: RAM[{base_c}..{base_c + n * n - 1}]
+
+// i = 0, iN = 0
+@R5
+M=0
+@R6
+M=0
+
+(LOOP_i)
+@R5
+D=M
+@{n}
+D=D-A
+@END_ALL
+D;JGE  // if i>=N, end
+
+// j = 0
+@R7
+M=0
+
+(LOOP_j)
+@R7
+D=M
+@{n}
+D=D-A
+@END_j
+D;JGE  // if j>=N end j-loop
+
+// sum = 0, k = 0, kN = 0
+@R8
+M=0
+@R9
+M=0
+@R10
+M=0
+
+(LOOP_k)
+@R9
+D=M
+@{n}
+D=D-A
+@END_k
+D;JGE  // if k>=N break
+
+// A_val = A[iN + k]
+@R6
+D=M
+@{base_a}
+D=D+A
+@R9
+A=D+M
+D=M
+@R11
+M=D
+
+// B_val = B[kN + j]
+@R10
+D=M
+@{base_b}
+D=D+A
+@R7
+A=D+M
+D=M
+@R12
+M=D
+
+// sum += A_val * B_val (repeated add)
+@R11
+D=M
+@R13
+M=D      // count = A_val
+
+(LOOP_mult)
+@R13
+D=M
+@AFTER_mult
+D;JEQ
+@R12
+D=M
+@R8
+M=D+M    // sum += B_val
+@R13
+M=M-1
+@LOOP_mult
+0;JMP
+
+(AFTER_mult)
+// k++, kN += N
+@R9
+M=M+1
+@{n}
+D=A
+@R10
+M=D+M
+@LOOP_k
+0;JMP
+
+(END_k)
+// C[iN + j] = sum
+@R6
+D=M
+@{base_c}
+D=D+A
+@R7
+D=D+M
+@R14
+M=D      // addrC
+@R8
+D=M
+@R14
+A=M
+M=D
+
+// j++
+@R7
+M=M+1
+@LOOP_j
+0;JMP
+
+(END_j)
+// i++, iN += N
+@R5
+M=M+1
+@{n}
+D=A
+@R6
+M=D+M
+@LOOP_i
+0;JMP
+
+(END_ALL)
+@HALT
+0;JMP
+
+(HALT)
+@HALT
+0;JMP
+"""
+
+def create_matmul_nmc_kernel(n):
+    """Create an N x N matrix multiplication program using NMC MAC.
+
+    C[i][j] is one "MAC 1,N": the dot product of row i of A (stride 1,
+    base in R13) and column j of B (stride N, base in R14), accumulated
+    into C[i][j] (address in R15) after clearing it. N is at most 31, the
+    largest stride.
+    """
+    base_a, base_b, base_c = matrix_bases(n)
+    if n > 31:
+        raise ValueError(f"{n}x{n}: the NMC column stride is at most 31")
+    return f"""// {n}x{n} MATRIX MULTIPLICATION WITH NMC MAC (generated by init_matmul.py --nmc)
+// A: RAM[{base_a}..{base_b - 1}]
+// B: RAM[{base_b}..{base_c - 1}]
+// C: RAM[{base_c}..{base_c + n * n - 1}]
+// R13: row i of A, R14: column j of B, R15: address of C[i][j]
+
+@{base_a}
+D=A
+@R13
+M=D      // row = A
+@{base_c}
+D=A
+@R15
+M=D      // addrC = C
+
+(LOOP_i)
+@{base_b}
+D=A
+@R14
+M=D      // column = B
+
+(LOOP_j)
+// C[i][j] = row . column
+@{n}
+D=A      // n = N
+@R15
+A=M
+M=0
+MAC 1,{n}
+
+// addrC++, column++; next j while column < B + N
+@R15
+M=M+1
+@R14
+MD=M+1
+@{base_b + n}
+D=D-A
+@LOOP_j
+D;JLT
+
+// row += N; next i while row < B
+@R13
+D=M
+@{n}
+D=D+A
+@R13
+M=D
+@{base_b}
+D=D-A
+@LOOP_i
+D;JLT
+
+(HALT)
+@HALT
+0;JMP
+"""
 
 def create_matmul_init():
     """Create an assembly program that initializes matrices A and B"""
@@ -76,5 +348,50 @@ def create_matmul_with_init():
     for i, row in enumerate(B):
         print(f"  Row {i}: {row}")
 
+def create_matmul_data(n, seed=None, raw=False, kernel=False, nmc=False):
+    """Write MatMul{N}.ram (or .bin) and optionally the MatMul{N}.asm and
+    MatMul{N}_NMC.asm kernels"""
+    A, B = default_matrices(n, seed)
+    regions, comments = create_matmul_image(A, B)
+    if raw:
+        # One contiguous blob from RAM[0]: A and B are adjacent
+        image_file = f"MatMul{n}{RAW_SUFFIX}"
+        write_raw(image_file, [0] * BASE_A + regions[0][1] + regions[1][1])
+    else:
+        image_file = f"MatMul{n}.ram"
+        write_image(image_file, regions, comments)
+    print(f"Created {image_file} ({2 * n * n} words)")
+    if kernel:
+        with open(f"MatMul{n}.asm", "w") as f:
+            f.write(create_matmul_kernel(n))
+        print(f"Created MatMul{n}.asm")
+    if nmc:
+        with open(f"MatMul{n}_NMC.asm", "w") as f:
+            f.write(create_matmul_nmc_kernel(n))
+        print(f"Created MatMul{n}_NMC.asm")
+    _, _, base_c = matrix_bases(n)
+    print(f"\nExpected result (RAM[{base_c}..{base_c + n * n - 1}]):")
+    for i, row in enumerate(matmul(A, B)):
+        print(f"  Row {i}: {row}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate MatMul test data")
+    parser.add_argument("--image", action="store_true",
+                        help="write a RAM data image instead of MatMul_Full.asm")
+    parser.add_argument("-n", type=int, default=4, help="matrix size N (default: 4)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="random matrices with this seed (default: identity x 1..N*N)")
+    parser.add_argument("--raw", action="store_true",
+                        help="write a raw uint16 blob (.bin) instead of a text image")
+    parser.add_argument("--kernel", action="store_true",
+                        help="also write the MatMul{N}.asm kernel for the image layout")
+    parser.add_argument("--nmc", action="store_true",
+                        help="also write the MatMul{N}_NMC.asm kernel using NMC MAC instructions")
+    args = parser.parse_args()
+    if args.image:
+        create_matmul_data(args.n, args.seed, args.raw, args.kernel, args.nmc)
+    else:
+        create_matmul_with_init()
+
 if __name__ == "__main__":
-    create_matmul_with_init()
+    main()
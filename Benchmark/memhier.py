@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# memhier.py
+# Memory-hierarchy model for NMC evaluation
+#
+# The cost models price instructions by opcode; this model prices data
+# accesses by where they go. With HackCPU(memory=MemoryHierarchy()) the
+# emulator logs every RAM access as one word of an array('L'):
+#     address | kind << 16     kind: 0 read, 1 write, 2 near-memory op
+# and feeds the log to the model in batches of LOG_CHUNK accesses, so the
+# interpreter loop only appends. An instruction that reads and writes M
+# (M=M+1, M=D+M, ...) is one near-memory op executed at the memory bank;
+# with near_memory off it is a CPU-side read plus write instead. NMC
+# instructions (nmc.py) are logged the same way, as one access at A; the
+# elements they stream stay inside the memory and are priced by the cost
+# models.
+#
+# CPU-side accesses go through a set-associative, write-back,
+# write-allocate LRU cache. Misses, write-backs and near ops reach memory,
+# whose banks are interleaved by cache line; a memory access to the same
+# bank as the previous one pays a bank conflict. Per region (MatMul's
+# matrices A/B/C at RAM[16..63] by default, or those of the run's data
+# image, see image_regions) the model reports accesses, hit rate, bytes
+# moved between memory and cache, and modeled cycles.
+import json
+import math
+from array import array
+
+from decode import OP_A
+from init_matmul import BASE_A, matrix_bases
+from memory import RAM_SIZE
+from nmc import is_nmc
+
+LOG_CHUNK = 65536  # accesses per batch fed to the model
+READ, WRITE, NEAR = 0, 1, 2
+KIND_SHIFT = 16
+WORD_BYTES = 2
+
+DEFAULT_CONFIG = {
+    "cache_bytes": 256,         # total cache capacity
+    "line_bytes": 16,           # cache line (8 words)
+    "ways": 2,                  # associativity
+    "banks": 4,                 # memory banks, interleaved by line
+    "near_memory": True,        # run read-modify-write instructions at the bank
+    "hit_cycles": 1,            # cache hit
+    "miss_cycles": 10,          # line fill from memory
+    "writeback_cycles": 10,     # dirty line written back to memory
+    "near_cycles": 3,           # near-memory read-modify-write at the bank
+    "bank_conflict_cycles": 4,  # extra cycles when the previous memory access used the same bank
+    # region name -> [first, last] RAM address (inclusive); 4x4 MatMul
+    "regions": {"A": [16, 31], "B": [32, 47], "C": [48, 63]},
+}
+
+# Per-region counters, in report order
+FIELDS = ("accesses", "reads", "writes", "near", "hits", "misses", "writebacks",
+          "conflicts", "bytes", "cycles")
+
+def access_kinds(program, near_memory=True):
+    """Per-PC memory access of a decoded program.
+
+    0: none, 1: read, 2: write, 3: read then write (CPU-side), 4: near op.
+    """
+    kinds = []
+    for instr in program:
+        op, comp, dest, _ = instr
+        kind = 0
+        if is_nmc(instr):
+            kind = 4 if near_memory else 3
+        elif op != OP_A:
+            if comp & 0x40:
+                kind |= 1
+            if dest & 1:
+                kind |= 2
+            if kind == 3 and near_memory:
+                kind = 4
+        kinds.append(kind)
+    return kinds
+
+def image_regions(regions):
+    """Report regions for a data image: (address, values) regions.
+
+    An image that ends where init_matmul.py's N x N matrices A and B end
+    (RAM[BASE_A + 2*N*N - 1]) gets that layout's A, B and C; any other
+    image is reported by its own regions, data0, data1, ...
+    """
+    regions = [(address, values) for address, values in regions if values]
+    if not regions:
+        return {}
+    first = min(address for address, _ in regions)
+    end = max(address + len(values) for address, values in regions)
+    n = math.isqrt(max(end - BASE_A, 0) // 2)
+    if first <= BASE_A and n and end == BASE_A + 2 * n * n:
+        base_a, base_b, base_c = matrix_bases(n)
+        return {"A": [base_a, base_b - 1], "B": [base_b, base_c - 1],
+                "C": [base_c, base_c + n * n - 1]}
+    return {f"data{i}": [address, address + len(values) - 1]
+            for i, (address, values) in enumerate(sorted(regions))}
+
+def load_config(path):
+    """Read a JSON file of DEFAULT_CONFIG keys"""
+    with open(path) as f:
+        config = json.load(f)
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"{path}: unknown memory config keys: {', '.join(sorted(unknown))}")
+    return config
+
+def _is_power_of_two(n):
+    return n > 0 and n & (n - 1) == 0
+
+class MemoryHierarchy:
+    """Cache + banked memory model fed with batched RAM access logs"""
+
+    def __init__(self, config=None, **overrides):
+        self.config = dict(DEFAULT_CONFIG)
+        self.config.update(config or {})
+        self.config.update(overrides)
+        c = self.config
+        line_words = c["line_bytes"] // WORD_BYTES
+        sets = c["cache_bytes"] // (c["line_bytes"] * c["ways"])
+        if not (_is_power_of_two(line_words) and _is_power_of_two(sets) and c["banks"] > 0):
+            raise ValueError("line_bytes/2 and cache_bytes/(line_bytes*ways) must be powers of two")
+        self.line_shift = line_words.bit_length() - 1
+        self.set_mask = sets - 1
+        self.ways = c["ways"]
+        self.banks = c["banks"]
+        self.near_memory = c["near_memory"]
+
+        self.region_names = list(c["regions"]) + ["other"]
+        self.region_ranges = [tuple(c["regions"][name]) for name in c["regions"]]
+        self.region_of = bytearray([len(self.region_ranges)]) * RAM_SIZE
+        for index, (first, last) in enumerate(self.region_ranges):
+            self.region_of[first:last + 1] = bytes([index]) * (last + 1 - first)
+        self.reset()
+
+    @classmethod
+    def from_file(cls, path):
+        """Model configured by a JSON file of DEFAULT_CONFIG keys"""
+        return cls(load_config(path))
+
+    def reset(self):
+        """Empty the cache and zero the statistics"""
+        self.sets = [[] for _ in range(self.set_mask + 1)]  # lines per set, LRU first
+        self.dirty = set()
+        self.last_bank = -1
+        self.stats = {name: [0] * len(self.region_names) for name in FIELDS}
+        self.log = array('L')
+
+    def feed(self, log):
+        """Simulate a batch of logged accesses (see the module comment)"""
+        c = self.config
+        hit_cycles, miss_cycles = c["hit_cycles"], c["miss_cycles"]
+        writeback_cycles, near_cycles = c["writeback_cycles"], c["near_cycles"]
+        conflict_cycles = c["bank_conflict_cycles"]
+        line_bytes = c["line_bytes"]
+        shift, set_mask, ways, banks = self.line_shift, self.set_mask, self.ways, self.banks
+        sets, dirty, region_of = self.sets, self.dirty, self.region_of
+        s = self.stats
+        accesses, reads, writes, near = s["accesses"], s["reads"], s["writes"], s["near"]
+        hits, misses, writebacks = s["hits"], s["misses"], s["writebacks"]
+        conflicts, moved, cycles = s["conflicts"], s["bytes"], s["cycles"]
+        last_bank = self.last_bank
+        mru = -1  # line of the previous CPU-side access: still most recently used
+
+        for entry in log:
+            address = entry & 0xFFFF
+            kind = entry >> KIND_SHIFT
+            region = region_of[address & 0x7FFF]
+            line = address >> shift
+            accesses[region] += 1
+
+            if kind == NEAR:
+                near[region] += 1
+                cost = near_cycles
+                if line in dirty:  # the bank needs the cache's copy first
+                    dirty.discard(line)
+                    writebacks[region] += 1
+                    moved[region] += line_bytes
+                    cost += writeback_cycles
+                ways_ = sets[line & set_mask]
+                if line in ways_:  # keep the cache coherent: drop the stale copy
+                    ways_.remove(line)
+                    if mru == line:
+                        mru = -1
+                bank = line % banks
+                if bank == last_bank:
+                    conflicts[region] += 1
+                    cost += conflict_cycles
+                last_bank = bank
+                cycles[region] += cost
+                continue
+
+            if kind == WRITE:
+                writes[region] += 1
+                dirty.add(line)
+            else:
+                reads[region] += 1
+            if line == mru:
+                hits[region] += 1
+                cycles[region] += hit_cycles
+                continue
+            ways_ = sets[line & set_mask]
+            if line in ways_:
+                hits[region] += 1
+                cycles[region] += hit_cycles
+                ways_.remove(line)
+                ways_.append(line)
+            else:
+                misses[region] += 1
+                moved[region] += line_bytes
+                cost = miss_cycles
+                if len(ways_) >= ways:
+                    victim = ways_.pop(0)
+                    if victim in dirty:
+                        dirty.discard(victim)
+                        victim_region = region_of[(victim << shift) & 0x7FFF]
+                        writebacks[victim_region] += 1
+                        moved[victim_region] += line_bytes
+                        cycles[victim_region] += writeback_cycles
+                ways_.append(line)
+                bank = line % banks
+                if bank == last_bank:
+                    conflicts[region] += 1
+                    cost += conflict_cycles
+                last_bank = bank
+                cycles[region] += cost
+            mru = line
+
+        self.last_bank = last_bank
+
+    def flush(self):
+        """Feed the pending part of self.log"""
+        if self.log:
+            self.feed(self.log)
+            self.log = array('L')
+
+    def totals(self):
+        """Return {field: total over all regions}"""
+        return {name: sum(values) for name, values in self.stats.items()}
+
+    def region_stats(self):
+        """Return [(region, range text, {field: value})] for regions that were accessed"""
+        rows = []
+        for index, name in enumerate(self.region_names):
+            row = {field: self.stats[field][index] for field in FIELDS}
+            if row["accesses"] or row["writebacks"]:
+                span = (f"{self.region_ranges[index][0]}-{self.region_ranges[index][1]}"
+                        if index < len(self.region_ranges) else "")
+                rows.append((name, span, row))
+        return rows
+
+    def report(self):
+        """Return the per-region table as text"""
+        c = self.config
+        out = [f"Memory hierarchy: {c['cache_bytes']} B cache, {c['line_bytes']} B lines, "
+               f"{c['ways']}-way, {c['banks']} banks, near-memory "
+               f"{'on' if self.near_memory else 'off'}",
+               f"{'region':<8} {'range':>7} {'accesses':>9} {'reads':>8} {'writes':>8} {'near':>8} "
+               f"{'hit %':>6} {'misses':>7} {'wbacks':>7} {'conflicts':>9} {'bytes':>9} {'cycles':>10}"]
+        rows = self.region_stats() + [("total", "", self.totals())]
+        for name, span, row in rows:
+            cached = row["hits"] + row["misses"]
+            hit_rate = f"{100.0 * row['hits'] / cached:.1f}" if cached else "-"
+            out.append(f"{name:<8} {span:>7} {row['accesses']:>9} {row['reads']:>8} {row['writes']:>8} "
+                       f"{row['near']:>8} {hit_rate:>6} {row['misses']:>7} {row['writebacks']:>7} "
+                       f"{row['conflicts']:>9} {row['bytes']:>9} {row['cycles']:>10}")
+        return "\n".join(out)
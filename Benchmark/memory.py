@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# memory.py
+# Array-backed Hack RAM
+#
+# RAM is an array('H') of 16-bit words: 64 KB in one buffer instead of a
+# list of 32K Python int references. Indexing works exactly like a list, so
+# ALU kernels and compiled blocks use it unchanged, while whole-memory
+# operations (clear, snapshot, restore) are single buffer copies.
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+RAM_SIZE = 32768
+
+class RAM(array):
+    """Hack data memory: RAM_SIZE unsigned 16-bit words"""
+
+    def __new__(cls, size=RAM_SIZE):
+        return super().__new__(cls, 'H', bytes(2 * size))
+
+    def clear(self):
+        """Zero all words in place"""
+        with memoryview(self) as view:
+            view.cast('B')[:] = bytes(view.nbytes)
+
+    def snapshot(self):
+        """Return the full memory contents as bytes"""
+        return self.tobytes()
+
+    def restore(self, snapshot):
+        """Overwrite memory in place with a snapshot() result"""
+        with memoryview(self) as view:
+            view.cast('B')[:] = snapshot
+
+    def load(self, address, values):
+        """Store a sequence of words starting at address.
+
+        Values are taken modulo 2**16, so signed values may be passed.
+        """
+        words = array('H', (value & 0xFFFF for value in values))
+        if address < 0 or address + len(words) > len(self):
+            raise IndexError(f"region {address}..{address + len(words) - 1} is outside RAM")
+        self[address:address + len(words)] = words
+
+    def dump(self, address, count):
+        """Return count words starting at address as a list"""
+        return self[address:address + count].tolist()
+
+    def as_numpy(self):
+        """Return a zero-copy NumPy uint16 view of memory (requires NumPy)"""
+        if np is None:
+            raise ImportError("as_numpy() requires NumPy")
+        return np.frombuffer(self, dtype=np.uint16)
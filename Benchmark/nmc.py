@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# nmc.py
+# NMC instruction set: in-memory multiply-accumulate and vector operations
+#
+# A C-instruction word starting 100 (bits 14 and 13 clear, which CPU.hdl
+# ignores) is an NMC instruction executed next to the memory:
+#     100 ooo xxxxx yyyyy    o: opcode, x: stride sx, y: stride sy (0..31)
+# Operands are in registers and fixed RAM words: D is the element count n
+# (a negative D counts as 0), RAM[R13] the x vector base, RAM[R14] the y
+# vector base and A the destination. A, D, R13 and R14 are left unchanged.
+#
+#     MAC sx,sy    RAM[A] += sum(RAM[x + k*sx] * RAM[y + k*sy] for k < n)
+#     COPY sx,sy   RAM[A + k*sy] = RAM[x + k*sx]                  for k < n
+#     VADD sx,sy   RAM[A + k*sy] += RAM[x + k*sx]                 for k < n
+#
+# Arithmetic is modulo 2**16 and addresses wrap at 32K. A stride of 0
+# repeats one word: "VADD 1,0" sums a vector into RAM[A], "COPY 0,1"
+# fills one. The assembler writes them as "MAC 1,4" ("MAC" alone means
+# strides 1,1).
+#
+# Decoded, an NMC instruction is (OP_C, NMC_BASE + low 13 bits, M, no
+# jump) (see decode.py), so the emulators run it through the same kernel
+# table as the ALU: kernel_table() extends alu.ALU_KERNELS with a kernel
+# per NMC code in the program. The kernel returns the new RAM[A], which the
+# emulator stores as for any M destination. Each kernel adds the elements
+# it processed to a per-code count; cost models charge the instruction
+# itself through instruction_cost() and each element through element_cost().
+from alu import ALU_KERNELS, MASK16
+from decode import NMC_BASE, OP_A
+
+# Opcode -> mnemonic (same table as assembler.py)
+NMC_MNEMONICS = {0: "MAC", 1: "COPY", 2: "VADD"}
+MAC, COPY, VADD = 0, 1, 2
+
+X_BASE = 13  # R13 holds the address of the x vector
+Y_BASE = 14  # R14 holds the address of the y vector
+ADDRESS_MASK = 0x7FFF
+
+def is_nmc(instr):
+    """True for a decoded NMC instruction"""
+    return instr[0] != OP_A and instr[1] >= NMC_BASE
+
+def fields(comp):
+    """Return (opcode, sx, sy) of a decoded NMC comp code"""
+    code = comp - NMC_BASE
+    return code >> 10, (code >> 5) & 0x1F, code & 0x1F
+
+def mnemonic(comp):
+    """Return the assembly text of a decoded NMC comp code, e.g. "MAC 1,4" """
+    opcode, sx, sy = fields(comp)
+    return f"{NMC_MNEMONICS.get(opcode, f'NMC{opcode}')} {sx},{sy}"
+
+def make_kernel(comp, counts):
+    """Build a kernel (D, A, RAM) -> new RAM[A] for an NMC comp code.
+
+    Every call adds its element count to counts[comp].
+    """
+    opcode, sx, sy = fields(comp)
+    if opcode == MAC:
+        def kernel(D, A, RAM):
+            n = D if D < 0x8000 else 0
+            x, y = RAM[X_BASE], RAM[Y_BASE]
+            total = RAM[A & ADDRESS_MASK]
+            for k in range(n):
+                total += RAM[(x + k * sx) & ADDRESS_MASK] * RAM[(y + k * sy) & ADDRESS_MASK]
+            counts[comp] = counts.get(comp, 0) + n
+            return total & MASK16
+    elif opcode in (COPY, VADD):
+        add = opcode == VADD
+        def kernel(D, A, RAM):
+            n = D if D < 0x8000 else 0
+            x = RAM[X_BASE]
+            for k in range(n):
+                value = RAM[(x + k * sx) & ADDRESS_MASK]
+                target = (A + k * sy) & ADDRESS_MASK
+                RAM[target] = (RAM[target] + value) & MASK16 if add else value
+            counts[comp] = counts.get(comp, 0) + n
+            return RAM[A & ADDRESS_MASK]
+    else:
+        raise ValueError(f"undefined NMC opcode {opcode}")
+    return kernel
+
+def kernel_table(program, counts):
+    """Return the kernel table for a decoded program.
+
+    alu.ALU_KERNELS itself when the program has no NMC instructions,
+    otherwise a copy extended with a kernel for each NMC code it uses.
+    Raises ValueError for an undefined opcode.
+    """
+    comps = sorted({instr[1] for instr in program if is_nmc(instr)})
+    if not comps:
+        return ALU_KERNELS
+    kernels = ALU_KERNELS + [None] * (comps[-1] + 1 - len(ALU_KERNELS))
+    for comp in comps:
+        try:
+            kernels[comp] = make_kernel(comp, counts)
+        except ValueError as e:
+            pc = next(pc for pc, instr in enumerate(program) if is_nmc(instr) and instr[1] == comp)
+            raise ValueError(f"PC {pc}: {e}") from None
+    return kernels
+
+def element_counts(program, hits, counts):
+    """Spread per-code element counts over the PCs with that code, by hits.
+
+    Returns a per-PC list; the totals per code are exact, the split between
+    PCs sharing a code is proportional to how often each ran.
+    """
+    elements = [0.0] * len(program)
+    for comp, total in counts.items():
+        pcs = [pc for pc, instr in enumerate(program) if is_nmc(instr) and instr[1] == comp]
+        runs = sum(hits[pc] for pc in pcs)
+        for pc in pcs:
+            if runs:
+                elements[pc] = total * hits[pc] / runs
+    return elements
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# peephole.py
+# Peephole optimizer for Hack assembly source
+#
+# Works on source lines, before assembly, and returns as many lines as it
+# was given: removed instructions become blank lines and rewritten ones
+# keep their line, so labels are still resolved by the assembler and
+# source maps still point into the original file. Rewrites, repeated
+# until none applies:
+#
+#   redundant A-load   @X when A already holds X (same block, A not written),
+#                      or when the next instruction is another A-load
+#   reload             D=M when D already equals RAM[A] (after M=D, D=M,
+#                      MD=...); A=M becomes A=D
+#   read-modify-write  D=M / D=D+1 / M=D            -> MD=M+1 (also D-1, !D, -D)
+#                      @X / D=M / @Y / D=D+M / @X / M=D -> @Y / D=M / @X / MD=D+M
+#                      (also D-M, M-D, D&M, D|M)
+#   dead D write       MD=... -> M=... and D=... removed when no path reads
+#                      D before writing it again
+#   dead store         @T / M=... removed for a temporary T that no
+#                      instruction reads directly (only with temporaries)
+#
+# Blocks start at labels; jumps are followed through their @LABEL, and a
+# jump to a computed address or the end of the program keep D live (a
+# halt loop does not read D, so its value there is not kept).
+# Temporaries are addresses or symbols the caller promises are scratch
+# space: their final values do not matter and no pointer reaches them.
+# NMC instructions (nmc.py) are kept as they are; they read D, RAM[A],
+# R13 and R14 and write memory.
+#
+#     from peephole import PeepholeOptimizer
+#     lines = PeepholeOptimizer(temporaries=["73", "74"]).optimize(open("MatMul.asm"))
+from collections import namedtuple
+
+# kind: "A" (text = symbol), "L" (text = label), "N" (text = NMC instruction)
+# or "C" (dest/comp/jump, "" when absent)
+Item = namedtuple("Item", "line kind text dest comp jump")
+
+NMC = ("MAC", "COPY", "VADD")  # NMC mnemonics (assembler.NMC)
+NMC_OPERANDS = ("R13", "13", "R14", "14")  # vector bases an NMC instruction reads
+
+# D=D op M at X, after D=M from Y: the same op with the operands swapped
+SWAPPED = {"D+M": "D+M", "D-M": "M-D", "M-D": "D-M", "D&M": "D&M", "D|M": "D|M"}
+# D=f(D) between D=M and M=D at the same address
+UNARY = {"D+1": "M+1", "D-1": "M-1", "!D": "!M", "-D": "-M"}
+
+STATS = (("redundant_load", "redundant A-loads"), ("reload", "reloads"),
+         ("rmw", "read-modify-write merges"), ("dead_code", "dead D writes"),
+         ("dead_store", "dead stores"), ("forward", "A=M forwarded"))
+
+def parse_line(line, index):
+    """Return the Item of one source line, or None for blanks and comments"""
+    if '//' in line:
+        line = line.split('//')[0]
+    line = line.strip()
+    if not line:
+        return None
+    if line[0] == '@':
+        return Item(index, "A", line[1:], "", "", "")
+    if line[0] == '(' and line[-1] == ')':
+        return Item(index, "L", line[1:-1], "", "", "")
+    if line.split()[0] in NMC:
+        return Item(index, "N", line, "", "", "")
+    dest, rest = line.split('=', 1) if '=' in line else ("", line)
+    comp, jump = rest.split(';', 1) if ';' in rest else (rest, "")
+    return Item(index, "C", "", dest.strip(), comp.strip(), jump.strip())
+
+def item_text(item):
+    if item.kind == "A":
+        return "@" + item.text
+    if item.kind == "L":
+        return f"({item.text})"
+    if item.kind == "N":
+        return item.text
+    return (item.dest + "=" if item.dest else "") + item.comp + (";" + item.jump if item.jump else "")
+
+def _symbol(text):
+    return str(int(text)) if text.isdigit() else text
+
+def _writes_a(item):
+    return item.kind == "A" or "A" in item.dest
+
+def _is_c(item, dest, comps):
+    return item.kind == "C" and item.dest == dest and item.comp in comps and not item.jump
+
+class PeepholeOptimizer:
+    """Rewrites Hack assembly lines; see the module comment"""
+
+    def __init__(self, temporaries=()):
+        self.temporaries = {_symbol(t) for t in temporaries}
+        self.stats = {name: 0 for name, _ in STATS}
+        self.before = self.after = 0
+        self.symbols = []  # A-instruction symbols of the source, in order of first use
+        self.labels = set()
+
+    def optimize(self, lines):
+        """Return the optimized lines (one per input line)"""
+        lines = list(lines)
+        code = [item for item in map(parse_line, lines, range(len(lines))) if item is not None]
+        seen = set()
+        for item in code:
+            if item.kind == "A" and item.text not in seen:
+                seen.add(item.text)
+                self.symbols.append(item.text)
+            elif item.kind == "L":
+                self.labels.add(item.text)
+        self.before = sum(item.kind != "L" for item in code)
+
+        changed = True
+        while changed:
+            changed = self._forward(code)
+            changed |= self._dead_d(code)
+            if self.temporaries:
+                changed |= self._dead_stores(code)
+        self.after = sum(item.kind != "L" for item in code)
+
+        out = list(lines)
+        for item in map(parse_line, lines, range(len(lines))):
+            if item is not None and item.kind != "L":
+                out[item.line] = ""
+        for item in code:
+            if item.kind != "L":
+                out[item.line] = item_text(item)
+        return out
+
+    def _forward(self, code):
+        # One pass tracking the known A symbol and whether D == RAM[A]
+        changed = False
+        a, dm = None, False
+        i = 0
+        while i < len(code):
+            item = code[i]
+            if item.kind == "L":
+                a, dm = None, False
+            elif item.kind == "N":
+                dm = False
+            elif item.kind == "A":
+                symbol = _symbol(item.text)
+                if symbol == a or (i + 1 < len(code) and code[i + 1].kind == "A"):
+                    del code[i]
+                    self.stats["redundant_load"] += 1
+                    changed = True
+                    continue
+                a, dm = symbol, False
+            else:
+                if dm and item.comp == "M":
+                    dest = item.dest.replace("D", "")
+                    if item.dest == "A":
+                        self.stats["forward"] += 1
+                    if not dest and not item.jump:
+                        del code[i]
+                        self.stats["reload"] += 1
+                        changed = True
+                        continue
+                    item = code[i] = item._replace(dest=dest, comp="D")
+                    changed = True
+                elif self._merge(code, i, a):
+                    item = code[i]
+                    changed = True
+                if _writes_a(item):
+                    a, dm = None, False
+                elif "M" in item.dest and "D" in item.dest:
+                    dm = True
+                elif "M" in item.dest:
+                    dm = item.comp == "D"
+                elif "D" in item.dest:
+                    dm = item.comp == "M"
+            i += 1
+        return changed
+
+    def _merge(self, code, i, a):
+        # Read-modify-write sequences starting with D=M at code[i]
+        if not _is_c(code[i], "D", ("M",)):
+            return False
+        following = code[i + 1:i + 5]
+        if (len(following) >= 2 and _is_c(following[0], "D", UNARY)
+                and _is_c(following[1], "M", ("D",))):
+            code[i] = code[i]._replace(dest="MD", comp=UNARY[following[0].comp])
+            del code[i + 1:i + 3]
+            self.stats["rmw"] += 1
+            return True
+        if (a is not None and len(following) == 4 and following[0].kind == "A"
+                and _is_c(following[1], "D", SWAPPED) and following[2].kind == "A"
+                and _symbol(following[2].text) == a and _is_c(following[3], "M", ("D",))):
+            y, op, x = following[0], following[1], following[2]
+            code[i:i + 5] = [y._replace(line=code[i].line),
+                             code[i]._replace(line=y.line),
+                             x._replace(line=op.line),
+                             op._replace(line=x.line, dest="MD", comp=SWAPPED[op.comp])]
+            self.stats["rmw"] += 1
+            return True
+        return False
+
+    def _live_d(self, code):
+        """Return live[i]: whether D may be read after code[i] before it is written"""
+        position = {item.text: i for i, item in enumerate(code) if item.kind == "L"}
+        successors = []
+        a = None
+        for i, item in enumerate(code):
+            nexts = [i + 1]
+            if item.kind == "C" and item.jump:
+                target = position.get(a) if a is not None and "A" not in item.dest else None
+                if target is None:
+                    nexts = None  # computed or unknown target
+                elif item.jump == "JMP":
+                    nexts = [target]
+                else:
+                    nexts = [target, i + 1]
+            successors.append(nexts)
+            if item.kind == "L":
+                a = None
+            elif item.kind == "A":
+                a = item.text
+            elif "A" in item.dest:
+                a = None
+
+        live_in = [False] * len(code) + [True]  # D is live at the end of the program
+        live_out = [True] * len(code)
+        changed = True
+        while changed:
+            changed = False
+            for i in range(len(code) - 1, -1, -1):
+                item = code[i]
+                out = successors[i] is None or any(live_in[s] for s in successors[i])
+                if item.kind == "C":
+                    value = "D" in item.comp or (out and "D" not in item.dest)
+                elif item.kind == "N":
+                    value = True
+                else:
+                    value = out
+                if value != live_in[i] or out != live_out[i]:
+                    live_in[i], live_out[i] = value, out
+                    changed = True
+        return live_out
+
+    def _dead_d(self, code):
+        changed = False
+        live = self._live_d(code)
+        for i in range(len(code) - 1, -1, -1):
+            item = code[i]
+            if item.kind != "C" or "D" not in item.dest or live[i]:
+                continue
+            dest = item.dest.replace("D", "")
+            if not dest and not item.jump:
+                del code[i]
+                self.stats["dead_code"] += 1
+            else:
+                code[i] = item._replace(dest=dest)
+            changed = True
+        return changed
+
+    def _dead_stores(self, code):
+        # Temporaries no instruction reads through a known @T; A is carried
+        # across labels here, since falling through keeps it
+        read = set()
+        a = None
+        for item in code:
+            if item.kind == "A":
+                a = _symbol(item.text)
+            elif item.kind == "C":
+                if "M" in item.comp and a is not None:
+                    read.add(a)
+                if "A" in item.dest:
+                    a = None
+            elif item.kind == "N":
+                read.update(NMC_OPERANDS)
+                if a is not None:
+                    read.add(a)
+        dead = self.temporaries - read
+
+        changed = False
+        i = 0
+        while i + 1 < len(code):
+            at, store = code[i], code[i + 1]
+            if (at.kind == "A" and _symbol(at.text) in dead and store.kind == "C"
+                    and store.dest == "M" and not store.jump):
+                after = code[i + 2] if i + 2 < len(code) else None
+                # @T goes too when the next instruction sets A without reading A or M
+                # or writing M (which would land at the A before @T)
+                a_dead = after is not None and (after.kind == "A" or (
+                    after.kind == "C" and "A" in after.dest and "M" not in after.dest
+                    and not after.jump and "A" not in after.comp and "M" not in after.comp))
+                del code[i + 1]
+                if a_dead:
+                    del code[i]
+                self.stats["dead_store"] += 1
+                changed = True
+                continue
+            i += 1
+        return changed
+
+    def report(self):
+        """Return a one-line summary of instructions saved"""
+        done = [f"{self.stats[name]} {text}" for name, text in STATS if self.stats[name]]
+        return (f"Peephole: {self.before} -> {self.after} instructions "
+                f"({self.before - self.after} saved{': ' + ', '.join(done) if done else ''})")
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# profiler.py
+# Execution profile of a HackCPU run
+#
+# HackCPU already counts how often every PC executes (cpu.hits), so a
+# profile costs nothing during the run: it is built afterwards from those
+# counts, a per-PC cost table (NMC by default) and, when available, the
+# program's source map (see find_source_map). Three views:
+#     flat      hottest instructions with label+offset and source text
+#     labels    instructions and cost per label region
+#     loops     backward jumps (tail -> header) with inclusive cost, i.e.
+#               candidates for an NMC instruction or a rewrite
+import os
+
+from asmcache import default_cache
+from assembler import build_source_map
+from cost_models import NMCCostModel
+from decode import OP_A
+from sourcemap import SOURCEMAP_SUFFIX, SourceMap, map_path
+
+def find_source_map(program_path, source=None):
+    """Return the SourceMap for a program, or None.
+
+    source may name a .map.json sidecar or an .asm file; otherwise the
+    sidecar next to the program (Xxx.map.json) is used, then Xxx.asm,
+    assembled through the assembly cache if it is enabled.
+    """
+    if source is None:
+        if os.path.exists(map_path(program_path)):
+            return SourceMap.load(map_path(program_path))
+        source = os.path.splitext(program_path)[0] + ".asm"
+        if not os.path.exists(source):
+            return None
+    if source.endswith(SOURCEMAP_SUFFIX):
+        return SourceMap.load(source)
+    return build_source_map(source, default_cache())
+
+def find_loops(program):
+    """Return [(header, tail)] for backward jumps ("@header" then a jump at tail).
+
+    Several back edges to one header are merged into the widest range.
+    """
+    tails = {}
+    for pc in range(1, len(program)):
+        op, _, _, jump = program[pc]
+        prev_op, target, _, _ = program[pc - 1]
+        if op != OP_A and jump and prev_op == OP_A and target < pc:
+            tails[target] = max(pc, tails.get(target, pc))
+    return sorted(tails.items())
+
+class Profile:
+    """Per-PC counts and costs of a run, mapped back to source when possible"""
+
+    def __init__(self, program, hits, costs, source_map=None, cost_name=NMCCostModel.name):
+        self.program = program
+        self.hits = hits
+        self.costs = [h * c for h, c in zip(hits, costs)]
+        self.source_map = source_map
+        self.cost_name = cost_name
+        self.total_hits = sum(hits)
+        self.total_cost = sum(self.costs)
+
+    @classmethod
+    def from_cpu(cls, cpu, source=None, cost_model=None):
+        """Profile a finished HackCPU run.
+
+        source is a SourceMap, a .map.json or .asm path, or None to run
+        without source information; cost_model defaults to NMCCostModel().
+        """
+        if isinstance(source, str):
+            source = find_source_map(source, source)
+        cost_model = cost_model or NMCCostModel()
+        costs = cost_model.program_costs(cpu.program)
+        if cpu.nmc_elements:
+            # Fold each NMC instruction's element costs into its cost per execution
+            element_costs = cost_model.element_costs(cpu.program)
+            costs = [c + e * ec / h if h else c for c, e, ec, h
+                     in zip(costs, cpu.elements(), element_costs, cpu.hits)]
+        return cls(cpu.program, cpu.hits, costs, source, cost_model.name)
+
+    def location(self, pc):
+        return self.source_map.location(pc) if self.source_map else str(pc)
+
+    def flat(self, top=None):
+        """Return [(pc, hits, cost)] of executed instructions, costliest first"""
+        rows = [(pc, h, self.costs[pc]) for pc, h in enumerate(self.hits) if h]
+        rows.sort(key=lambda row: (-row[2], row[0]))
+        return rows[:top] if top else rows
+
+    def by_label(self):
+        """Return [(label, start, end, hits, cost)] per label region, costliest first"""
+        if self.source_map is None or not self.source_map.labels:
+            starts = [0]
+        else:
+            starts = sorted({0} | {a for a in self.source_map.labels.values() if a < len(self.hits)})
+        rows = []
+        for i, start in enumerate(starts):
+            end = starts[i + 1] if i + 1 < len(starts) else len(self.hits)
+            hits = sum(self.hits[start:end])
+            if hits:
+                label = self.source_map.label_at(start)[0] if self.source_map else None
+                rows.append((label or "<start>", start, end - 1, hits, sum(self.costs[start:end])))
+        rows.sort(key=lambda row: (-row[4], row[1]))
+        return rows
+
+    def hot_loops(self, top=None):
+        """Return [(header, tail, iterations, hits, cost)] costliest first.
+
+        iterations counts executions of the loop header; hits and cost are
+        inclusive of nested loops.
+        """
+        rows = []
+        for header, tail in find_loops(self.program):
+            hits = sum(self.hits[header:tail + 1])
+            if self.hits[header] and hits > self.hits[header]:
+                rows.append((header, tail, self.hits[header], hits,
+                             sum(self.costs[header:tail + 1])))
+        rows.sort(key=lambda row: (-row[4], row[0]))
+        return rows[:top] if top else rows
+
+    def _pct(self, hits, cost):
+        hit_pct = 100.0 * hits / self.total_hits if self.total_hits else 0.0
+        cost_pct = 100.0 * cost / self.total_cost if self.total_cost else 0.0
+        return hit_pct, cost_pct
+
+    def report(self, top=15):
+        """Return the flat profile, label breakdown and hot-loop report as text"""
+        cyc = f"{self.cost_name} cyc"
+        out = [f"Profile: {self.total_hits} instructions, {self.total_cost:.2f} {self.cost_name} cycles"]
+        if self.source_map:
+            out[0] += f" ({self.source_map.source})"
+
+        out += ["", f"Flat profile (top {top})",
+                f"{'pc':>6} {'hits':>10} {'%instr':>7} {cyc:>12} {'%cost':>7}  {'location':<16} source"]
+        for pc, hits, cost in self.flat(top):
+            hit_pct, cost_pct = self._pct(hits, cost)
+            text = self.source_map.text(pc) if self.source_map else ""
+            lineno = self.source_map.line(pc) if self.source_map else None
+            where = f"  (line {lineno})" if lineno else ""
+            out.append(f"{pc:>6} {hits:>10} {hit_pct:>6.1f}% {cost:>12.2f} {cost_pct:>6.1f}%  "
+                       f"{self.location(pc):<16} {text}{where}")
+
+        out += ["", "Per-label breakdown",
+                f"{'label':<16} {'range':>11} {'hits':>10} {'%instr':>7} {cyc:>12} {'%cost':>7}"]
+        for label, start, end, hits, cost in self.by_label():
+            hit_pct, cost_pct = self._pct(hits, cost)
+            out.append(f"{label:<16} {f'{start}-{end}':>11} {hits:>10} {hit_pct:>6.1f}% "
+                       f"{cost:>12.2f} {cost_pct:>6.1f}%")
+
+        out += ["", "Hot loops (inclusive of nested loops)",
+                f"{'loop':<16} {'range':>11} {'iterations':>10} {'hits':>10} {cyc:>12} {'%cost':>7} {'cyc/iter':>9}"]
+        loops = self.hot_loops(top)
+        for header, tail, iterations, hits, cost in loops:
+            _, cost_pct = self._pct(hits, cost)
+            out.append(f"{self.location(header):<16} {f'{header}-{tail}':>11} {iterations:>10} {hits:>10} "
+                       f"{cost:>12.2f} {cost_pct:>6.1f}% {cost / iterations:>9.2f}")
+        if not loops:
+            out.append("(no executed loops)")
+        return "\n".join(out)
+
+def profile_report(cpu, program_path, source=None, top=15):
+    """Profile report for a finished run, with the source map from find_source_map()"""
+    return Profile.from_cpu(cpu, find_source_map(program_path, source)).report(top)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# sourcemap.py
+# ROM address -> source line and label mapping
+#
+# A SourceMap ties a program back to its .asm source: the source line of
+# every ROM address, plus the label and variable tables. It is built by the
+# assembler in the same pass that emits the words (Assembler(source_map=True))
+# and saved as a JSON sidecar next to the program, Xxx.map.json:
+#     {"version": 1, "source": "MatMul.asm", "lines": [5, 6, ...],
+#      "labels": {"LOOP_i": 2, ...}, "variables": {...}}
+# "source" is relative to the sidecar's directory.
+import bisect
+import json
+import os
+
+SOURCEMAP_SUFFIX = ".map.json"
+SOURCEMAP_VERSION = 1
+
+class SourceMap:
+    """Source line per ROM address, labels and variables of one program"""
+
+    def __init__(self, source, lines, labels, variables):
+        self.source = source  # .asm path
+        self.lines = lines  # 1-based source line per ROM address
+        self.labels = labels  # label -> ROM address
+        self.variables = variables  # variable -> RAM address
+        # Labels by address; of several labels on one address the last
+        # defined (closest to the code) wins
+        by_address = {}
+        for name, address in labels.items():
+            by_address[address] = name
+        self._addresses = sorted(by_address)
+        self._names = [by_address[address] for address in self._addresses]
+        self._text = None
+
+    def save(self, path):
+        """Write the map as a JSON sidecar"""
+        source = os.path.relpath(self.source, os.path.dirname(os.path.abspath(path)))
+        with open(path, 'w') as f:
+            json.dump({"version": SOURCEMAP_VERSION, "source": source, "lines": list(self.lines),
+                       "labels": self.labels, "variables": self.variables}, f)
+
+    @classmethod
+    def load(cls, path):
+        """Read a JSON sidecar written by save()"""
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != SOURCEMAP_VERSION:
+            raise ValueError(f"unsupported source map version {data.get('version')}")
+        source = os.path.join(os.path.dirname(path), data["source"])
+        return cls(os.path.normpath(source), data["lines"], data["labels"], data["variables"])
+
+    def line(self, pc):
+        """Return the source line number of ROM address pc (None if unknown)"""
+        return self.lines[pc] if 0 <= pc < len(self.lines) else None
+
+    def label_at(self, pc):
+        """Return (label, offset) of the nearest label at or before pc, or (None, pc)"""
+        i = bisect.bisect_right(self._addresses, pc) - 1
+        if i < 0:
+            return None, pc
+        return self._names[i], pc - self._addresses[i]
+
+    def location(self, pc):
+        """Return pc as "LABEL+offset" (or the bare address before any label)"""
+        label, offset = self.label_at(pc)
+        if label is None:
+            return str(pc)
+        return f"{label}+{offset}" if offset else label
+
+    def text(self, pc):
+        """Return the stripped source text of ROM address pc, or "" """
+        if self._text is None:
+            try:
+                with open(self.source) as f:
+                    self._text = f.read().splitlines()
+            except OSError:
+                self._text = []
+        lineno = self.line(pc)
+        if lineno is None or lineno > len(self._text):
+            return ""
+        return self._text[lineno - 1].split('//')[0].strip()
+
+def map_path(program_path):
+    """Return the sidecar path for a program: Xxx.hack -> Xxx.map.json"""
+    return os.path.splitext(program_path)[0] + SOURCEMAP_SUFFIX
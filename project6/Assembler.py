@@ -1,5 +1,7 @@
 import sys
 import os
+import array
+import struct
 
 class Assembler:
 	def __init__(self,file_path):
@@ -126,13 +128,33 @@ class Assembler:
 			for line in self.binary_codes:
 				file.write(line+'\n')
 
+	def save_packed(self):
+		"""
+		write the binary codes as a packed Xxx.hackb file:
+		a 12-byte header (magic "HACK", u16 version=1, u16 flags=0, u32 count)
+		followed by one little-endian uint16 per instruction
+		"""
+		words=array.array('H',(int(line,2) for line in self.binary_codes))
+		if sys.byteorder == 'big':
+			words.byteswap()
+		packed_filename=self.file_name[:-4]+".hackb"
+		with open(packed_filename,'wb') as file:
+			file.write(struct.pack("<4sHHI",b"HACK",1,0,len(words)))
+			file.write(words.tobytes())
+
 
 def main():
+	if len(sys.argv) < 2:
+		print("Usage: python3 Assembler.py Xxx.asm [--binary]")
+		sys.exit(1)
 	file_path=sys.argv[1]
 	ass=Assembler(file_path)
 	ass.process_label()
 	ass.parse()
-	ass.save_binary()
+	if "--binary" in sys.argv[2:]:
+		ass.save_packed()
+	else:
+		ass.save_binary()
 
 if __name__ == '__main__':
 	main()
\ No newline at end of file